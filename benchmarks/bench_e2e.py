@@ -0,0 +1,130 @@
+"""
+End-to-end benchmarks of submitting, polling and downloading jobs against a local fake API
+
+Runs offline, see `vds_api_client.fake_server.FakeApiServer`. Written as an asv
+benchmark suite (throughputs as `track_` benchmarks), but can also be run directly:
+
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e benchmarks/scenarios/flaky.toml   # with injected faults
+"""
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+import vds_api_client as vac
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.fake_server import FakeApiServer
+from vds_api_client.faults import FaultScenario
+from vds_api_client.log import temporary_logging
+
+
+def run_e2e(n_jobs=20, days=10, file_size=2 ** 17, processing_time=0., latency=0., error_rate=0., n_proc=4,
+            n_submit=1, faults=None):
+    """
+    Submit, poll and download gridded-data jobs against a fake API and time each stage
+
+    Parameters
+    ----------
+    n_jobs: int
+        Number of submitted requests (date splits)
+    days: int
+        Days, and so files, per job, at least 10 (the minimum length of a date split)
+    file_size: int
+        Bytes per file
+    processing_time: float
+    latency: float
+    error_rate: float
+        See `FakeApiServer`
+    n_proc: int
+        Number of simultaneous downloads
+    n_submit: int
+        Number of simultaneous submits
+    faults: FaultScenario or str, optional
+        Faults to inject, see `FakeApiServer`
+
+    Returns
+    -------
+    dict
+        jobs, files, bytes, seconds per stage and the submit and poll throughput (jobs/s)
+        and download throughput (MB/s), with faults also the `resilience_report` of the server
+    """
+    cwd = os.getcwd()
+    with temporary_logging(log_file='', summary_only=True), tempfile.TemporaryDirectory() as tmpdir, \
+            FakeApiServer(processing_time=processing_time, file_size=file_size, latency=latency,
+                          error_rate=error_rate, faults=faults) as server:
+        os.chdir(tmpdir)  # uuid files are written to the working directory
+        try:
+            vac.ENVIRONMENT = server.name
+            vds = VdsApiV2('bench', 'bench', debug=False)
+            vds._wait_time = 0.05
+            vds.outfold = os.path.join(tmpdir, 'output')
+            end = datetime(2020, 1, 1) + timedelta(n_jobs * days - 1)
+            vds.gen_gridded_data_request(products=[server.products[0]], start_date='2020-01-01',
+                                         end_date=f'{end:%Y-%m-%d}', lat_min=52, lat_max=53, lon_min=4, lon_max=5, nrequests=n_jobs)
+            t0 = time.perf_counter()
+            vds.submit_async_requests(n_jobs=n_submit, queue_files=False)
+            t1 = time.perf_counter()
+            vds.queue_uuids_files()
+            t2 = time.perf_counter()
+            vds.download_async_files(n_proc=n_proc)
+            t3 = time.perf_counter()
+            files = [os.path.join(vds.outfold, fn) for fn in os.listdir(vds.outfold)]
+            nbytes = sum(os.path.getsize(fn) for fn in files)
+            resilience = server.resilience() if faults is not None else {}
+        finally:
+            os.chdir(cwd)
+            vac.ENVIRONMENT = 'maps'
+    submit, poll, download = t1 - t0, t2 - t1, t3 - t2
+    return {'jobs': n_jobs, 'files': len(files), 'bytes': nbytes,
+            'submit_seconds': submit, 'poll_seconds': poll, 'download_seconds': download,
+            'submit_jobs_per_second': n_jobs / submit, 'poll_jobs_per_second': n_jobs / poll,
+            'download_mb_per_second': nbytes / 1e6 / download, **resilience}
+
+
+class TrackEndToEnd:
+    params = [[0., 0.02]]
+    param_names = ['latency']
+    timeout = 300
+
+    def setup_cache(self):
+        return {latency: run_e2e(latency=latency) for latency in self.params[0]}
+
+    def track_submit(self, results, latency):
+        return results[latency]['submit_jobs_per_second']
+    track_submit.unit = 'jobs/s'
+
+    def track_poll(self, results, latency):
+        return results[latency]['poll_jobs_per_second']
+    track_poll.unit = 'jobs/s'
+
+    def track_download(self, results, latency):
+        return results[latency]['download_mb_per_second']
+    track_download.unit = 'MB/s'
+
+
+def main_faults(path):
+    r = run_e2e(faults=FaultScenario.from_file(path))
+    print(f'{r["jobs"]} jobs, {r["files"]} files, {r["bytes"] / 1e6:.1f} MB in '
+          f'{r["submit_seconds"] + r["poll_seconds"] + r["download_seconds"]:.1f} s, faults: {r["faults"]}')
+    print(f'goodput: {r["goodput"] / 1e6:.2f} MB/s ({r["efficiency"]:.1%} of the bytes sent)  '
+          f'retry amplification: {r["retry_amplification"]:.2f}  time to recovery: '
+          f'mean {r["time_to_recovery_mean"]:.2f} s, max {r["time_to_recovery_max"]:.2f} s  '
+          f'unrecovered: {r["unrecovered"]}')
+
+
+def main():
+    for latency in [0., 0.02]:
+        for n_proc in [1, 4]:
+            r = run_e2e(latency=latency, n_proc=n_proc)
+            print(f'latency {latency * 1e3:4.0f} ms  n_proc {n_proc}  {r["jobs"]} jobs, {r["files"]} files, '
+                  f'{r["bytes"] / 1e6:.1f} MB  submit: {r["submit_jobs_per_second"]:7.1f} jobs/s  '
+                  f'poll: {r["poll_jobs_per_second"]:7.1f} jobs/s  download: {r["download_mb_per_second"]:7.1f} MB/s')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main_faults(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,168 @@
+"""
+Benchmarks of the client-side hot paths which grow with the account size and request volume
+
+Product and roi lookups, roi filtering and printing, roi validation, uri generation
+for large point sets, reviewing download results and get_roi_df against a local fake
+API. Written as an asv benchmark suite, but can also be run directly:
+
+    python -m benchmarks.bench_hot_paths
+"""
+import timeit
+
+import numpy as np
+
+import vds_api_client as vac
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.types import Products, Rois
+from vds_api_client.fake_server import FakeApiServer
+from vds_api_client.log import temporary_logging
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def synthetic_products(n=100):
+    """
+    Product dictionaries as returned by the products endpoint
+    """
+    return [{'api_name': f'PRODUCT-{i:05d}_V001_100', 'name': f'Product {i}', 'abbreviation': f'P{i}',
+             'unit': 'm3/m3', 'time_series_type': 'continuous'} for i in range(n)]
+
+
+def synthetic_rois(n=10_000):
+    """
+    Roi dictionaries as returned by the rois endpoint
+    """
+    return [{'id': 1000 + i, 'name': f'roi_{i:07d}', 'area': 1e4 * (1 + i % 1000), 'description': f'field {i % 97}',
+             'created_at': f'2020-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00.000000', 'display': i % 2 == 0}
+            for i in range(n)]
+
+
+def synthetic_processed(n=10_000):
+    """
+    Results of `api_get` for n downloads: written files, existing and no-data files and failures
+    """
+    kinds = [lambda i: f'/data/file_{i}.tif'.encode('ascii'), lambda i: (-1, f'/data/file_{i}.tif'),
+             lambda i: (-2, f'/data/file_{i}.tif'), lambda i: (None, f'https://host/file_{i}.tif/download')]
+    return [kinds[0 if i % 10 < 7 else i % 10 - 6](i) for i in range(n)]
+
+
+def offline_client(server=None):
+    """
+    VdsApiV2 logged in to a fake API, usable offline after the server stopped
+    """
+    with temporary_logging(log_file='', summary_only=True):
+        if server is not None:
+            vac.ENVIRONMENT = server.name
+            return VdsApiV2('bench', 'bench', debug=False)
+        with FakeApiServer() as server:
+            vac.ENVIRONMENT = server.name
+            return VdsApiV2('bench', 'bench', debug=False)
+
+
+class TimeProducts:
+    params = [[10, 1000]]
+    param_names = ['nproducts']
+
+    def setup(self, nproducts):
+        self.products = Products(synthetic_products(nproducts))
+        self.last = self.products[-1].api_name
+
+    def time_getitem(self, nproducts):
+        self.products[self.last]
+
+
+class TimeRois:
+    params = [SIZES]
+    param_names = ['nrois']
+    timeout = 300
+
+    def setup(self, nrois):
+        self.rois = Rois(synthetic_rois(nrois))
+        self.last = self.rois.ids_to_list()[-1]
+
+    def time_getitem_id(self, nrois):
+        self.rois[self.last]
+
+    def time_getitem_name(self, nrois):
+        self.rois[f'roi_{nrois - 1:07d}']
+
+    def time_filter(self, nrois):
+        self.rois.filter(area_min=5e5, name_regex='1$', display=False)
+
+    def time_str(self, nrois):
+        str(self.rois)
+
+    def peakmem_rois(self, nrois):
+        Rois(synthetic_rois(nrois))
+
+
+class TimeClient:
+    params = [SIZES]
+    param_names = ['n']
+    timeout = 300
+
+    def setup(self, n):
+        self.vds = offline_client()
+        self.vds.rois = Rois(synthetic_rois(max(n // 100, 10)))
+        self.roi_ids = self.vds.rois.ids_to_list()
+        rng = np.random.default_rng(0)
+        self.lats = rng.uniform(50, 54, n).round(4)
+        self.lons = rng.uniform(3, 7, n).round(4)
+        self.processed = synthetic_processed(n)
+
+    def time_check_valid_rois(self, n):
+        self.vds.check_valid_rois(self.roi_ids)
+
+    def time_gen_uri_points(self, n):
+        self.vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01',
+                                          end_time='2020-12-31', lats=self.lats, lons=self.lons, gen_uri=False)
+        for _ in self.vds.iter_uri():
+            pass
+
+    def time_review_results(self, n):
+        self.vds._outputs, self.vds._skipped, self.vds._ndskipped, self.vds._retry = [], [], [], []
+        self.vds.review_results(self.processed)
+
+
+class TimeGetRoiDf:
+    params = [[365, 3650]]
+    param_names = ['ndays']
+
+    def setup(self, ndays):
+        self.server = FakeApiServer()
+        self.server.start()
+        self.vds = offline_client(self.server)
+        self.end = f'{2000 + ndays // 365}-12-31'
+
+    def teardown(self, ndays):
+        self.server.stop()
+
+    def time_get_roi_df(self, ndays):
+        self.vds.get_roi_df('SM-XN_V001_100', 1000, '2001-01-01', self.end, chunk_days=365)
+
+
+def _time(suite, params, name, number=3):
+    bench = suite()
+    bench.setup(*params)
+    try:
+        t = min(timeit.repeat(lambda: getattr(bench, name)(*params), number=number, repeat=3)) / number
+    finally:
+        if hasattr(bench, 'teardown'):
+            bench.teardown(*params)
+    print(f'{suite.__name__}.{name}{params}: {t * 1e3:10.2f} ms')
+
+
+def main(sizes=SIZES[:2]):
+    for nproducts in TimeProducts.params[0]:
+        _time(TimeProducts, (nproducts,), 'time_getitem', number=100)
+    for n in sizes:
+        for name in ['time_getitem_id', 'time_getitem_name', 'time_filter', 'time_str']:
+            _time(TimeRois, (n,), name)
+        for name in ['time_check_valid_rois', 'time_gen_uri_points', 'time_review_results']:
+            _time(TimeClient, (n,), name, number=1)
+    for ndays in TimeGetRoiDf.params[0]:
+        _time(TimeGetRoiDf, (ndays,), 'time_get_roi_df', number=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmarks for parsing time-series responses
+
+Written as an asv benchmark suite, but can also be run directly:
+
+    python -m benchmarks.bench_parsing
+"""
+import json
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from vds_api_client.parsing import read_time_series_csv, loads, pa
+
+
+def synthetic_csv(ndays=3650, ncols=4, seed=0):
+    """
+    Roi time-series csv response with a comment header, ndays dates and ncols value columns
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2010-01-01', periods=ndays, freq='D')
+    df = pd.DataFrame(rng.random((ndays, ncols)).round(4), index=dates,
+                      columns=['value', 'average', 'climatology', 'coverage'][:ncols])
+    df.index.name = 'datetime'
+    header = '# product: SM-XN_V001_100\n# roi_id: 25009\n'
+    return (header + df.to_csv(date_format='%Y-%m-%d')).encode()
+
+
+def synthetic_json(nitems=10000):
+    """
+    Json response with a list of nitems previous requests
+    """
+    return json.dumps({'requests': [{'uuid': f'{i:032x}', 'percentage': 100, 'processing_status': 'Ready',
+                                     'data': [f'/api/v2/api-requests/{i:032x}/data/file_{i}.tif']}
+                                    for i in range(nitems)]}).encode()
+
+
+class TimeCsvParsing:
+    params = [[365, 3650, 36500], ['pandas', 'pyarrow']]
+    param_names = ['ndays', 'engine']
+
+    def setup(self, ndays, engine):
+        if engine == 'pyarrow' and pa is None:
+            raise NotImplementedError('pyarrow not installed')
+        self.content = synthetic_csv(ndays)
+
+    def time_read_time_series_csv(self, ndays, engine):
+        read_time_series_csv(self.content, engine=engine)
+
+    def time_read_csv_default(self, ndays, engine):
+        # Parsing as done before the parsing module existed
+        pd.read_csv(pd.io.common.BytesIO(self.content), index_col=0, parse_dates=True, comment='#')
+
+
+class TimeJsonParsing:
+    params = [[100, 10000]]
+    param_names = ['nitems']
+
+    def setup(self, nitems):
+        self.content = synthetic_json(nitems)
+
+    def time_loads(self, nitems):
+        loads(self.content)
+
+    def time_json_loads(self, nitems):
+        json.loads(self.content)
+
+
+def main(number=5):
+    engines = ['pandas'] + (['pyarrow'] if pa is not None else [])
+    for ndays in TimeCsvParsing.params[0]:
+        content = synthetic_csv(ndays)
+        base = min(timeit.repeat(lambda: pd.read_csv(pd.io.common.BytesIO(content), index_col=0,
+                                                     parse_dates=True, comment='#'),
+                                 number=number, repeat=3)) / number
+        print(f'csv {ndays:>6} days ({len(content) / 1e6:.2f} MB)  read_csv default: {base * 1e3:8.2f} ms')
+        for engine in engines:
+            t = min(timeit.repeat(lambda: read_time_series_csv(content, engine=engine),
+                                  number=number, repeat=3)) / number
+            print(f'{"":29s}{engine:>8s}: {t * 1e3:8.2f} ms  ({base / t:.1f}x)')
+    for nitems in TimeJsonParsing.params[0]:
+        content = synthetic_json(nitems)
+        base = min(timeit.repeat(lambda: json.loads(content), number=number, repeat=3)) / number
+        t = min(timeit.repeat(lambda: loads(content), number=number, repeat=3)) / number
+        print(f'json {nitems:>6} items  json.loads: {base * 1e3:8.2f} ms  loads: {t * 1e3:8.2f} ms ({base / t:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmarks of client workflows replayed from recorded API traffic
+
+A gridded-data and time-series workflow is recorded once against the local fake
+API (see `vds_api_client.transport.Recorder`) and then replayed without network
+or server, so the time is spent in the client only. Run directly to compare client
+versions on identical traffic: the first run records the archive, later runs (e.g.
+in a checkout of another version) replay it:
+
+    python -m benchmarks.bench_replay workflow.zip
+"""
+import os
+import sys
+import timeit
+import tempfile
+from datetime import datetime, timedelta
+
+import vds_api_client as vac
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.fake_server import FakeApiServer
+from vds_api_client.transport import Recorder, Replayer
+from vds_api_client.log import temporary_logging
+
+
+def workflow(outfold, days=100, n_jobs=10):
+    """
+    Submit, poll and download gridded data and a roi time series
+
+    Parameters
+    ----------
+    outfold: str
+    days: int
+    n_jobs: int
+        Number of date splits of the gridded data, at most days / 10
+    """
+    vds = VdsApiV2('bench', 'bench', debug=False)
+    vds._wait_time = 0.01
+    vds.outfold = outfold
+    end = datetime(2020, 1, 1) + timedelta(days - 1)
+    vds.gen_gridded_data_request(products=['SM-XN_V001_100'], start_date='2020-01-01', end_date=f'{end:%Y-%m-%d}',
+                                 lat_min=52, lat_max=53, lon_min=4, lon_max=5, nrequests=n_jobs)
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-12-31',
+                                 rois=[1000, 1001])
+    vds.submit_async_requests(queue_files=False)
+    vds.queue_uuids_files()
+    vds.download_async_files(n_proc=4)
+
+
+def record(path, file_size=2 ** 12):
+    """
+    Record the workflow against the fake API to an archive
+    """
+    cwd = os.getcwd()
+    with temporary_logging(log_file='', summary_only=True), tempfile.TemporaryDirectory() as tmpdir, \
+            FakeApiServer(file_size=file_size) as server:
+        os.chdir(tmpdir)  # uuid files are written to the working directory
+        try:
+            vac.ENVIRONMENT = server.name
+            with Recorder(path):
+                workflow(os.path.join(tmpdir, 'output'))
+        finally:
+            os.chdir(cwd)
+            vac.ENVIRONMENT = 'maps'
+    return path
+
+
+def replay(path, preserve_timing=False):
+    """
+    Replay the workflow from an archive into a temporary folder
+    """
+    cwd = os.getcwd()
+    with temporary_logging(log_file='', summary_only=True), tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            with Replayer(path, preserve_timing=preserve_timing) as replayer:
+                workflow(os.path.join(tmpdir, 'output'))
+        finally:
+            os.chdir(cwd)
+    if replayer.misses:
+        raise RuntimeError(f'{len(replayer.misses)} requests were not recorded, e.g. {replayer.misses[0]}')
+
+
+class TimeReplay:
+    timeout = 300
+
+    def setup_cache(self):
+        return record(os.path.abspath('workflow.zip'))
+
+    def time_workflow(self, path):
+        replay(path)
+
+
+def main(path=None):
+    path = path or os.path.join(tempfile.mkdtemp(), 'workflow.zip')
+    if not os.path.exists(path):
+        record(path)
+        print(f'Recorded {path} ({os.path.getsize(path) / 1e3:.0f} kB)')
+    t = min(timeit.repeat(lambda: replay(path), number=1, repeat=3))
+    print(f'Replayed workflow of {path} with client {vac.__version__}: {t:.3f} s')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
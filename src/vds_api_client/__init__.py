@@ -5,11 +5,21 @@ import logging
 __version__ = pkg_resources.get_distribution(__name__).version
 
 from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.coalesce import SingleFlight
 
 
 AUTH = (None, None)
 ENVIRONMENT = 'maps'
+# Base url of each environment, see Requester.add_environment
+ENVIRONMENTS = {'maps': 'https://maps.vandersat.com',
+                'staging': 'https://staging.maps.planetary-variables.prod.planet-labs.com'}
 HEADERS = {}
+SESSION = None
+HTTP_CACHE = None
+METRICS = None
+TRACER = None
+TRANSPORT = None
+SINGLE_FLIGHT = SingleFlight()
 LOGGER = logging.getLogger('vds_api')
 
 # EOF
@@ -4,8 +4,16 @@ import click
 import click_datetime as click_dt
 import os
 import time
+import vds_api_client as vac
 from vds_api_client.vds_api_base import VdsApiBase, getpar_fromtext
 from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.manifest import Manifest, run_manifest
+from vds_api_client.mosaic import mosaic_grids
+from vds_api_client.metrics import RequestMetrics
+from vds_api_client.tracing import Tracer, JsonFileExporter
+from vds_api_client.log import configure_logging
+from vds_api_client.profiling import Profiler
+from vds_api_client.transport import Recorder, Replayer
 
 from requests import HTTPError, ConnectionError
 setattr(VdsApiV2, '__str__', VdsApiBase.__str__)
@@ -123,15 +131,51 @@ def download_if_unfinished(api_instance, n_jobs=1):
 @click.option('--environment',
               type=click.Choice(['maps', 'staging']),
               help='Environment to use for requests https://maps.vandersat.com or Planet internal staging https://staging.maps.planetary-variables.prod.planet-labs.com')
+@click.option('--metrics', 'metrics_file', type=click.Path(dir_okay=False),
+              help='Write request counts and timings in the OpenMetrics text format to this file')
+@click.option('--trace', 'trace_file', type=click.Path(dir_okay=False),
+              help='Append the spans of the submit, poll and download stages of each job as json lines to this file')
+@click.option('--log-file', type=click.Path(dir_okay=False),
+              help='Location of the log file, default $VDS_API_LOG_FILE or vds_api.log in the working directory')
+@click.option('--no-log-file', is_flag=True, default=False, help='Do not write a log file')
+@click.option('--summary-only', is_flag=True, default=False,
+              help='Only log warnings, errors and summaries, e.g. for runs with many files')
+@click.option('--profile', is_flag=True, default=False,
+              help='Profile the CPU time, peak memory and stages of the run, the report is written to the output folder')
+@click.option('--journal', type=click.Path(dir_okay=False), envvar='VDS_API_JOURNAL',
+              help='Record submitted, ready and downloaded jobs in this job journal (json lines), used by --plan '
+                   'and --reuse, default $VDS_API_JOURNAL')
+@click.option('--record', 'record_file', type=click.Path(dir_okay=False),
+              help='Record the requests and responses of the run to this archive, to replay them with --replay')
+@click.option('--replay', 'replay_file', type=click.Path(exists=True, dir_okay=False),
+              help='Serve the responses recorded in this archive (see --record) instead of requesting the API')
+@click.option('--preserve-timing', is_flag=True, default=False,
+              help='With --replay, delay the responses by their recorded response time')
 @click.pass_context
-def api(ctx, username, password, oauth_token, impersonate, environment):
+def api(ctx, username, password, oauth_token, impersonate, environment, metrics_file, trace_file,
+        log_file, no_log_file, summary_only, profile, journal, record_file, replay_file, preserve_timing):
     ctx.ensure_object(dict)
     ctx.obj['user'] = username
     ctx.obj['passwd'] = password
     ctx.obj['oauth_token'] = oauth_token
     ctx.obj['impersonate'] = impersonate
     ctx.obj['environment'] = environment
-    pass
+    ctx.obj['journal'] = journal
+    if log_file or no_log_file or summary_only:
+        configure_logging(log_file='' if no_log_file else log_file, summary_only=summary_only)
+    if metrics_file:
+        vac.METRICS = RequestMetrics()
+        ctx.call_on_close(lambda: vac.METRICS.write_openmetrics(metrics_file))
+    if trace_file:
+        vac.TRACER = Tracer(JsonFileExporter(trace_file), keep=False)
+    if profile:
+        ctx.with_resource(Profiler())
+    if record_file and replay_file:
+        raise click.BadParameter('Use either --record or --replay', param_hint='--replay')
+    if record_file:
+        ctx.with_resource(Recorder(record_file))
+    elif replay_file:
+        ctx.with_resource(Replayer(replay_file, preserve_timing=preserve_timing))
 
 
 @api.command(short_help='test the api response')
@@ -145,7 +189,7 @@ def test(ctx):
             vds.environment = environment
             click.echo(vds)
             start = time.time()
-            status_uri = f'http://{vds.host}/api/v2/status/'
+            status_uri = f'{vds.base_url}/api/v2/status/'
             bv = vds.get_content(status_uri)['backend_version']
             click.echo(f"backend version: {bv}")
             vds.logger.info(f'API RESPONSE TIME: {time.time() - start:0.4f} seconds')
@@ -167,7 +211,7 @@ def info(ctx, all_info, user_, product_list, roi):
         vds.host = ctx.obj['environment']
     if ctx.obj['impersonate']:
         vds.impersonate(ctx.obj['impersonate'])
-    bv = vds.get_content(f'http://{vds.host}/api/v2/status/')['backend_version']
+    bv = vds.get_content(f'{vds.base_url}/api/v2/status/')['backend_version']
     click.echo(f"backend version: {bv}")
     if not (user_ or product_list or roi):
         all_info = True
@@ -212,12 +256,17 @@ def info(ctx, all_info, user_, product_list, roi):
 @click.option('--n_proc', '-n', default=4, type=click.IntRange(1, 8), help='Number of simultaneous calls to the API', show_default=True)
 @click.option('--outfold', '-o', help='Path to output the data (created if non-existent)')
 @click.option('--zipped', '-z', is_flag=True, default=False, help='Return zip folders with all files included')
+@click.option('--plan', is_flag=True, default=False, help='Only show the expected jobs, files, size and duration')
+@click.option('--reuse', is_flag=True, default=False, help='Download results of identical previous requests if available')
+@click.option('--mosaic', type=click.Choice(['netcdf4', 'zarr']),
+              help='Merge the downloaded files of each product into one netCDF or Zarr store')
 @click.option('--verbose/--no-verbose', '-v', default=False, help='Set debug statements on')
 @click.pass_context
 def grid(ctx, config_file, products, lon_range, lat_range, date_range,
-         fmt, n_proc, outfold, zipped, verbose):
+         fmt, n_proc, outfold, zipped, plan, reuse, mosaic, verbose):
 
-    vds = VdsApiV2(ctx.obj['user'], ctx.obj['passwd'],  oauth_token=ctx.obj['oauth_token'], debug=False)
+    vds = VdsApiV2(ctx.obj['user'], ctx.obj['passwd'], oauth_token=ctx.obj['oauth_token'], debug=False,
+                   journal=ctx.obj['journal'])
     if ctx.obj['environment'] is not None:
         vds.host = ctx.obj['environment']
     if ctx.obj['impersonate']:
@@ -230,7 +279,8 @@ def grid(ctx, config_file, products, lon_range, lat_range, date_range,
         of = getpar_fromtext(config_file, 'outfold')
         if of:
             vds.outfold = outfold
-    download_if_unfinished(vds, n_jobs=n_proc)
+    if not plan:
+        download_if_unfinished(vds, n_jobs=n_proc)
     products = list(products) if products else None
     vds.gen_gridded_data_request(gen_uri=False, config_file=config_file, products=products,
                                  start_date=date_range[0], end_date=date_range[1],
@@ -238,8 +288,19 @@ def grid(ctx, config_file, products, lon_range, lat_range, date_range,
                                  lon_min=(lon_range[0] if lon_range else None), lon_max=(lon_range[1] if lon_range else None),
                                  file_format=fmt, zipped=zipped, nrequests=n_proc)
     vds.log_config()
-    vds.submit_async_requests()
+    if plan:
+        click.echo(vds.plan(n_jobs=n_proc))
+        return
+    if mosaic and zipped:
+        raise click.BadParameter('Zipped files can not be mosaicked', param_hint='--mosaic')
+    n_outputs, n_skipped = len(vds._outputs), len(vds._skipped)
+    vds.submit_async_requests(reuse_results=reuse)
     vds.download_async_files(n_proc=n_proc)
+    if mosaic:
+        # Only the files of this run, not those of earlier runs or unfinished jobs in outfold
+        files = vds._outputs[n_outputs:] + vds._skipped[n_skipped:]
+        for product in vds._config['products']:
+            mosaic_grids(vds.outfold, product, file_format=mosaic, files=files, logger=vds.logger)
     vds.summary()
     vds.logger.info(' ================== Finished ==================')
 
@@ -264,13 +325,20 @@ def grid(ctx, config_file, products, lon_range, lat_range, date_range,
 @click.option('-t', type=int, help='Rootzone soil moisture parameter (days) (not for streaming)')
 @click.option('--provide-coverage/--no-provide-coverage', '-cov', is_flag=True, default=False, show_default=True,
               help='Provide coverage column for ROI time-series')
+@click.option('--snap-to-grid', is_flag=True, default=False,
+              help='Request each product pixel only once for points falling in the same pixel')
 @click.option('--outfold', '-o', help='Path to output the data (created if no-existent)')
+@click.option('--plan', is_flag=True, default=False, help='Only show the expected jobs, files, size and duration')
+@click.option('--reuse', is_flag=True, default=False, help='Download results of identical previous requests if available')
+@click.option('--parquet', type=click.Path(file_okay=False),
+              help='Also write the downloaded csv time-series to a Parquet dataset partitioned by product')
 @click.option('--verbose/--no-verbose', '-v', default=False, help='Set debug statements on')
 @click.pass_context
 def ts(ctx, config_file, products, latlons, rois, date_range, fmt,
-       masked, av_win, backward, clim, t, provide_coverage, outfold, verbose):
+       masked, av_win, backward, clim, t, provide_coverage, snap_to_grid, outfold, plan, reuse, parquet, verbose):
 
-    vds = VdsApiV2(ctx.obj['user'], ctx.obj['passwd'], oauth_token=ctx.obj['oauth_token'], debug=False)
+    vds = VdsApiV2(ctx.obj['user'], ctx.obj['passwd'], oauth_token=ctx.obj['oauth_token'], debug=False,
+                   journal=ctx.obj['journal'])
     if ctx.obj['environment'] is not None:
         vds.host = ctx.obj['environment']
     if ctx.obj['impersonate']:
@@ -284,7 +352,8 @@ def ts(ctx, config_file, products, latlons, rois, date_range, fmt,
         if of:
             vds.outfold = of
     products = list(products) if products else None
-    download_if_unfinished(vds, 4)
+    if not plan:
+        download_if_unfinished(vds, 4)
     lats, lons = map(list, zip(*latlons)) if latlons else (None, None)
     rois = list(rois) if rois else None
     av_win_dir = 'backward' if backward else 'center'
@@ -293,11 +362,41 @@ def ts(ctx, config_file, products, latlons, rois, date_range, fmt,
                                  end_time=date_range[1] if date_range else None,
                                  lats=lats, lons=lons, rois=rois,
                                  av_win=av_win, av_win_dir=av_win_dir, masked=masked, clim=clim, t=t,
-                                 provide_coverage=provide_coverage,
+                                 provide_coverage=provide_coverage, snap_to_grid=snap_to_grid,
                                  file_format=fmt)
     vds.log_config()
-    vds.submit_async_requests()
-    vds.download_async_files(n_proc=8)
+    if plan:
+        click.echo(vds.plan(n_jobs=8))
+        return
+    if parquet and fmt != 'csv':
+        raise click.BadParameter('Parquet output requires --format csv', param_hint='--parquet')
+    vds.submit_async_requests(reuse_results=reuse)
+    vds.download_async_files(n_proc=8, parquet=parquet)
+    vds.summary()
+    vds.logger.info(' ================== Finished ==================')
+
+
+@api.command(short_help='Run all grid and ts jobs of a manifest file')
+@click.argument('manifest', type=click.Path(exists=True))
+@click.option('--n_proc', '-n', default=4, type=click.IntRange(1, 8), help='Number of simultaneous calls to the API', show_default=True)
+@click.option('--outfold', '-o', help='Path to output the data for jobs without outfold (created if non-existent)')
+@click.option('--verbose/--no-verbose', '-v', default=False, help='Set debug statements on')
+@click.pass_context
+def run(ctx, manifest, n_proc, outfold, verbose):
+
+    manifest = Manifest.from_file(manifest)
+    vds = VdsApiV2(ctx.obj['user'], ctx.obj['passwd'], oauth_token=ctx.obj['oauth_token'], debug=False,
+                   journal=ctx.obj['journal'])
+    if ctx.obj['environment'] is not None:
+        vds.host = ctx.obj['environment']
+    if ctx.obj['impersonate']:
+        vds.impersonate(ctx.obj['impersonate'])
+    vds.streamlevel = 10 if verbose else 20
+    click.echo(vds)
+    if outfold:
+        vds.outfold = outfold
+    download_if_unfinished(vds, n_jobs=n_proc)
+    run_manifest(manifest, vds=vds, n_proc=n_proc)
     vds.summary()
     vds.logger.info(' ================== Finished ==================')
 
@@ -3,25 +3,44 @@
 import sys
 import os
 import time
+import threading
 from math import floor
 from typing import Optional
-from collections import OrderedDict
+from hashlib import blake2b
+from itertools import islice
 import re
+import shutil
 from glob import glob
 import json
 from datetime import datetime, timedelta
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Module
 from vds_api_client.vds_api_base import VdsApiBase, configure
+from vds_api_client.cache import LRUCache, MISSING
+from vds_api_client.columnar import ParquetTimeSeriesWriter, ts_locations, TS_ENDPOINTS
+from vds_api_client.grid import pixel_size, unique_pixels
+from vds_api_client.journal import JobJournal, endpoint_of
+from vds_api_client.planner import RequestPlan
+from vds_api_client.parsing import read_time_series_csv
+from vds_api_client.reuse import previous_results, request_key, is_reusable
+from vds_api_client import log
+from vds_api_client.profiling import timed_stage
 
 # External packages
 import requests
 from retrying import retry
 from joblib import Parallel, delayed
+import numpy as np
 import pandas as pd
 
 
+# Date chunks for the synchronous roi time-series
+AVG_WINDOW_DAYS = 20
+MIN_CHUNK_DAYS = 30
+MAX_CHUNK_DAYS = 3650
+
+
 def progress_bar(n, nchar=25):
     """
     Show a progress bar in stderr with nchar characters for the actual bar
@@ -39,6 +58,39 @@ def progress_bar(n, nchar=25):
     # sys.stderr.flush()
 
 
+def unique_everseen(uris):
+    """
+    Lazily drop repeated uris, keeping the first occurrence
+
+    Only a 16 byte digest of each uri is remembered instead of the full string
+
+    Parameters
+    ----------
+    uris: iterable of str
+
+    Yields
+    ------
+    uri: str
+    """
+    seen = set()
+    for uri in uris:
+        key = blake2b(uri.encode(), digest_size=16).digest()
+        if key not in seen:
+            seen.add(key)
+            yield uri
+
+
+def _as_coordinates(values):
+    """
+    Coordinates as list or array, NumPy arrays and DataFrame columns are kept as array
+    """
+    if values is None or type(values) in [list, tuple]:
+        return values
+    elif isinstance(values, (np.ndarray, pd.Series, pd.Index)):
+        return np.asarray(values, dtype=float).ravel()
+    return [values]
+
+
 def _no_type_error(exception):
     return not isinstance(exception, TypeError) and not isinstance(exception, KeyboardInterrupt)
 
@@ -50,13 +102,31 @@ def _http_error(exception):
 class VdsApiV2(VdsApiBase):
     """
         Extension of the VdsApiBase class with all api/v2 related methods
+
+    Parameters
+    ----------
+    username, password, oauth_token, debug:
+        See VdsApiBase
+    journal: str or JobJournal, optional
+        Job journal recording the submitted, ready and downloaded jobs, used by
+        `plan` and `find_reusable_results`. No journal is written if not given
     """
-    def __init__(self, username=None, password=None, oauth_token:Optional[str]=None, debug=True):
+    def __init__(self, username=None, password=None, oauth_token:Optional[str]=None, debug=True, journal=None):
         super(VdsApiV2, self).__init__(username, password, oauth_token=oauth_token, debug=debug)
         self.async_requests = []
         self.uuids = []
         self._remove_after_dowload = []
         self._wait_time = 5
+        self._pixel_fanout = {}
+        self._uuid_requests = {}
+        self._download_uuids = {}
+        self._job_spans = {}
+        self.journal = journal if isinstance(journal, JobJournal) else JobJournal(journal)
+        self._previous_results = None
+        self._roi_chunk_days = 365
+        self._roi_chunk_lock = threading.Lock()
+        self.value_cache = LRUCache()
+        self.ts_store = None
         if glob('*.uuid'):
             self._get_uuid_save()
             self.logger.info('Not downloaded uuids found. Trigger <.queue_uuids_files()> '
@@ -99,7 +169,7 @@ class VdsApiV2(VdsApiBase):
         """
         Returns all previous requests
         """
-        rqsts = self.get_content(f'https://{self.host}/api/v2/api-requests/')['requests']
+        rqsts = self.get_content(f'{self.base_url}/api/v2/api-requests/')['requests']
         return None if not rqsts else rqsts
 
     def gen_gridded_data_request(self, gen_uri=True, config_file=None, products=None,
@@ -174,7 +244,7 @@ class VdsApiV2(VdsApiBase):
                                  lats=None, lons=None, rois=None,
                                  file_format=None,
                                  av_win=None, av_win_dir=None, masked=None, clim=None, t=None,
-                                 provide_coverage=None,
+                                 provide_coverage=None, snap_to_grid=None,
                                  log_config=False):
         """
         Generate one or more uris for the `[point/roi]-time-series` enpoints.
@@ -193,9 +263,9 @@ class VdsApiV2(VdsApiBase):
             date string YYYY-MM-DD
         end_time: str or datetime
             date string YYYY-MM-DD
-        lats: list of float
+        lats: list of float or np.ndarray or pd.Series
             list of latitude values
-        lons: list or float
+        lons: list of float or np.ndarray or pd.Series
             list of longitude values
         rois: list of (int or str)
             Region id or name
@@ -216,6 +286,9 @@ class VdsApiV2(VdsApiBase):
             Calculate derived root zone as additional column with given smoothing `T` value (days)
         provide_coverage: bool
             Include coverage percentage in the output, roi-time-series only
+        snap_to_grid: bool
+            Snap lats/lons to the product grid and request each unique pixel
+            only once. Downloaded files are copied back to the original points
         log_config: bool
             Write the used configuration to the logging file and steam
         """
@@ -223,10 +296,8 @@ class VdsApiV2(VdsApiBase):
             start_time = start_time.strftime('%Y-%m-%d')
         if type(end_time) is datetime:
             end_time = end_time.strftime('%Y-%m-%d')
-        if (lons is not None) and (type(lons) not in [list, tuple]):
-            lons = [lons]
-        if (lats is not None) and (type(lats) not in [list, tuple]):
-            lats = [lats]
+        lons = _as_coordinates(lons)
+        lats = _as_coordinates(lats)
         if (rois is not None) and (type(rois) not in [list, tuple]):
             rois = [rois]
 
@@ -235,19 +306,19 @@ class VdsApiV2(VdsApiBase):
                       lats=lats, lons=lons, rois=rois, file_format=file_format,
                       av_win=av_win, av_win_dir=av_win_dir,
                       masked=masked, clim=clim, t=t,
-                      provide_coverage=provide_coverage)
+                      provide_coverage=provide_coverage, snap_to_grid=snap_to_grid)
         defaults = dict(file_format='csv', av_win=0, masked=False,
                         clim=False, t=None, av_win_dir='center',
-                        provide_coverage=False,
+                        provide_coverage=False, snap_to_grid=False,
                         lats=[], lons=[], rois=[])
         config = configure(config, defaults, config_file, self.logger)
         for key in ['lons', 'lats', 'rois', 'products']:
-            if type(config[key]) is not list:
+            if not isinstance(config[key], (list, np.ndarray)):
                 config[key] = [config[key]]
         config['products'] = self.check_valid_products(config['products'])
         config['rois'] = self.check_valid_rois(config['rois'])
         if ((not len(config['lons']) == len(config['lats']))
-                or (not config['lons'] and not config['rois'])):
+                or (len(config['lons']) == 0 and not config['rois'])):
             self.logger.warning('Set either lons/lats or rois, no configuration was done')
             return
         if config['av_win'] < 0:
@@ -274,66 +345,139 @@ class VdsApiV2(VdsApiBase):
             new settings are persistently changed. On the instance, call the attribute .config
             to see the names of the settings that can be changed
         """
+        uris = self.iter_uri(**kwargs)
+        if not add:
+            self.async_requests = []
+        self.async_requests.extend(uris)
+
+    def iter_uri(self, **kwargs):
+        """
+        Lazily generate the VanderSat API calls based on the configuration
+
+        Same as `gen_uri`, but the uris are yielded one by one (without duplicates)
+        instead of being stored in `.async_requests`. Use this for very large request
+        sets, `submit_async_requests` consumes it when no requests were generated yet.
+
+        Parameters
+        ----------
+        kwargs: any
+            Update config using additional key-value pairs, see `gen_uri`
+
+        Returns
+        -------
+        generator of str
+        """
         if self._config is None:
             error_msg = ('API was not configured. '
                          'Choose one of the configure methods to setup the parameters')
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
 
-        if not add:
-            self.async_requests = []
-
         self._config.update(kwargs)
-        products = self._config['products']
-
         if self._config['api_call'] == 'gridded-data':
-            start_dt = datetime.strptime(self._config['start_date'], '%Y-%m-%d')
-            end_dt = datetime.strptime(self._config['end_date'], '%Y-%m-%d')
-            # Split requests in time
-            if (end_dt - start_dt).days >= self._config['nrequests'] * 10:
-                diff = (end_dt - start_dt).days // self._config['nrequests']
-                splits = [(start_dt + timedelta(i * diff), start_dt + timedelta((i + 1) * diff - 1))
-                          for i in range(self._config['nrequests'] - 1)]
-                splits.append((start_dt + timedelta((self._config['nrequests']-1) * diff), end_dt))
-            else:
-                splits = [(start_dt, end_dt)]
-                if self._config['nrequests'] > 1:
-                    self.logger.info('Only 1 request made, it is not too large anyways right?')
-            for prod in products:
-                for start, stop in splits:
-                    uri = (f'https://{self.host}/api/v2/products/{prod}/gridded-data?'
-                           f'lat_min={self._config["lat_min"]}&lat_max={self._config["lat_max"]}'
-                           f'&lon_min={self._config["lon_min"]}&lon_max={self._config["lon_max"]}'
-                           f'&start_date={start:%Y-%m-%d}&end_date={stop:%Y-%m-%d}'
-                           f'&format={self._config["file_format"]}&zipped={json.dumps(self._config["zipped"])}')
-                    self.async_requests.append(uri)
-                    self.logger.debug(f'Generated URI for {prod} between {start} and {stop}: {uri}')
-
+            return unique_everseen(self._iter_gridded_uri())
         elif self._config['api_call'] == 'time-series':
-            locs = {'point-time-series': [f'lat={lat}&lon={lon}'
-                                          for lat, lon in zip(self._config['lats'], self._config['lons'])],
-                    'roi-time-series': [f'roi_id={self.rois[roi].id}' for roi in self._config['rois']]}
-            for prod in products:
-                for endpnt, loc_list in locs.items():
-                    for loc in loc_list:
-                        uri = (f'https://{self.host}/api/v2/products/{prod}/{endpnt}?'
-                               f'start_time={self._config["start_time"]}'
-                               f'&end_time={self._config["end_time"]}'
-                               f'&{loc}&format={self._config["file_format"]}'
-                               f'&avg_window_days={self._config["av_win"]}&avg_window_direction={self._config["av_win_dir"]}'
-                               f'&include_masked_data={json.dumps(self._config["masked"])}'
-                               f'&climatology={json.dumps(self._config["clim"])}')
-                        if self._config['t'] is not None:
-                            uri += f'&exp_filter_t={self._config["t"]:d}'
-                        if loc.startswith('roi_id'):
-                            uri += f'&provide_coverage={json.dumps(self._config["provide_coverage"])}'
-                        self.async_requests.append(uri)
-                        self.logger.debug(f'Generated URI: {uri}')
-
+            return unique_everseen(self._iter_time_series_uri())
         else:
             self.logger.error("Only 'gridded-data' and [point/roi]-time-series supported for now")
             raise NotImplementedError
 
+    def _iter_gridded_uri(self):
+        start_dt = datetime.strptime(self._config['start_date'], '%Y-%m-%d')
+        end_dt = datetime.strptime(self._config['end_date'], '%Y-%m-%d')
+        # Split requests in time
+        if (end_dt - start_dt).days >= self._config['nrequests'] * 10:
+            diff = (end_dt - start_dt).days // self._config['nrequests']
+            splits = [(start_dt + timedelta(i * diff), start_dt + timedelta((i + 1) * diff - 1))
+                      for i in range(self._config['nrequests'] - 1)]
+            splits.append((start_dt + timedelta((self._config['nrequests']-1) * diff), end_dt))
+        else:
+            splits = [(start_dt, end_dt)]
+            if self._config['nrequests'] > 1:
+                self.logger.info('Only 1 request made, it is not too large anyways right?')
+        for prod in self._config['products']:
+            for start, stop in splits:
+                uri = (f'{self.base_url}/api/v2/products/{prod}/gridded-data?'
+                       f'lat_min={self._config["lat_min"]}&lat_max={self._config["lat_max"]}'
+                       f'&lon_min={self._config["lon_min"]}&lon_max={self._config["lon_max"]}'
+                       f'&start_date={start:%Y-%m-%d}&end_date={stop:%Y-%m-%d}'
+                       f'&format={self._config["file_format"]}&zipped={json.dumps(self._config["zipped"])}')
+                self.logger.debug('Generated URI for %s between %s and %s: %s', prod, start, stop, uri)
+                yield uri
+
+    def _iter_time_series_uri(self):
+        query = (f'&format={self._config["file_format"]}'
+                 f'&avg_window_days={self._config["av_win"]}&avg_window_direction={self._config["av_win_dir"]}'
+                 f'&include_masked_data={json.dumps(self._config["masked"])}'
+                 f'&climatology={json.dumps(self._config["clim"])}')
+        if self._config['t'] is not None:
+            query += f'&exp_filter_t={self._config["t"]:d}'
+        roi_ids = [self.rois[roi].id for roi in self._config['rois']]
+        for prod in self._config['products']:
+            base = (f'{self.base_url}/api/v2/products/{prod}/{{}}?'
+                    f'start_time={self._config["start_time"]}'
+                    f'&end_time={self._config["end_time"]}&')
+            point_base = base.format('point-time-series')
+            for loc, points in self._point_locs(prod):
+                uri = point_base + loc + query
+                if points is not None:
+                    self._pixel_fanout[uri] = points
+                self.logger.debug('Generated URI: %s', uri)
+                yield uri
+            roi_base = base.format('roi-time-series')
+            for roi_id in roi_ids:
+                uri = (roi_base + f'roi_id={roi_id}' + query
+                       + f'&provide_coverage={json.dumps(self._config["provide_coverage"])}')
+                self.logger.debug('Generated URI: %s', uri)
+                yield uri
+
+    def _point_locs(self, product):
+        """
+        Location query strings for the configured points of one product
+
+        Without `snap_to_grid` every point is a location of its own. Otherwise points
+        are snapped to the product grid and each unique pixel is requested once,
+        together with the original points that should receive its output.
+
+        Yields
+        ------
+        tuple
+            (location query, original (lat, lon) points or None)
+        """
+        lats, lons = self._config['lats'], self._config['lons']
+        if not self._config.get('snap_to_grid'):
+            for lat, lon in zip(lats, lons):
+                yield f'lat={lat}&lon={lon}', None
+            return
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        cell_lats, cell_lons, inverse = unique_pixels(lats, lons, pixel_size(product))
+        self.logger.info('%d points of %s fall in %d unique pixels', len(lats), product, len(cell_lats))
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(cell_lats)))[:-1])
+        for lat, lon, group in zip(cell_lats, cell_lons, groups):
+            yield f'lat={lat}&lon={lon}', list(zip(lats[group].tolist(), lons[group].tolist()))
+
+    def plan(self, n_jobs=1):
+        """
+        Dry-run the generated requests without submitting them
+
+        Reports the number of jobs, the expected number of files and bytes,
+        the files that were already downloaded to `.outfold` and the expected
+        duration based on the throughput recorded in the job journal.
+
+        Parameters
+        ----------
+        n_jobs: int
+            Number of jobs expected to be processed simultaneously
+
+        Returns
+        -------
+        RequestPlan
+        """
+        uris = self.async_requests if self.async_requests else self.iter_uri()
+        return RequestPlan(uris, outfold=self.outfold, throughput=self.journal.throughput(), n_jobs=n_jobs)
+
     def _extract_fn(self, uri, out_path=None):
         outprod = re.sub('/download$', '', uri).split('/')[-1]
         fp = os.path.join(self.outfold if out_path is None else out_path, outprod)
@@ -346,20 +490,161 @@ class VdsApiV2(VdsApiBase):
             if uuids_new:
                 self.logger.info('Undownloaded uuids, now added to list')
                 self.uuids.extend(uuids_new)
+            for uuid in uuids_new:
+                self._load_uuid_save(uuid)
+
+    def _load_uuid_save(self, uuid):
+        with open(f'{uuid}.uuid', 'r') as uuid_save:
+            lines = uuid_save.read().splitlines()
+        if lines:
+            self._uuid_requests[uuid] = lines[0]
+        if len(lines) > 1 and lines[0] not in self._pixel_fanout:
+            self._pixel_fanout[lines[0]] = [tuple(point) for point in json.loads(lines[1])]
+
+    @timed_stage('fan_out')
+    def _fan_out_pixels(self):
+        """
+        Copy the downloaded output of each snapped pixel to the original points
+
+        The coordinates in the filename of the pixel output are replaced by
+        those of the original point. Download calls which were not the result
+        of a snapped request are left untouched.
+        """
+        for call, uuid in self._download_uuids.items():
+            points = self._pixel_fanout.get(self._uuid_requests.get(uuid))
+            fp = self._extract_fn(call)
+            if not points or not os.path.exists(fp):
+                continue
+            query = dict(param.split('=', 1) for param in self._uuid_requests[uuid].split('?', 1)[1].split('&'))
+            cell = f'_{float(query["lon"]):.6f}_{float(query["lat"]):.6f}_'
+            if cell not in os.path.basename(fp):
+                self.logger.warning('Pixel coordinates %s not found in %s, appending those of the points instead',
+                                    cell.strip('_'), os.path.basename(fp))
+            fps_out = []
+            for lat, lon in points:
+                if cell in os.path.basename(fp):
+                    fn = os.path.basename(fp).replace(cell, f'_{lon:.6f}_{lat:.6f}_')
+                else:
+                    base, ext = os.path.splitext(os.path.basename(fp))
+                    fn = f'{base}_{lon:.6f}_{lat:.6f}{ext}'
+                fps_out.append(os.path.join(os.path.dirname(fp), fn))
+            for fp_out in fps_out:
+                if fp_out != fp:
+                    shutil.copyfile(fp, fp_out)
+            if fp not in fps_out:
+                os.remove(fp)
+            self.logger.debug('Pixel output %s copied to %d points', os.path.basename(fp), len(points))
+        self._download_uuids = {}
+
+    def _submit_job(self, call, generated):
+        """
+        Submit a request, starting the span of its job when tracing
+
+        Parameters
+        ----------
+        call: str
+        generated: tuple of float
+            Start and end time of the generation of the batch of uris the call belongs to
+        """
+        if self.tracer is None:
+            return self._submit_v2_req(call)
+        job = self.tracer.start_span('job', start=generated[0], uri=call, endpoint=endpoint_of(call))
+        self.tracer.record_span('generate', job, *generated)
+        try:
+            with self.tracer.span('submit', job):
+                uuid = self._submit_v2_req(call)
+        except Exception as e:
+            self.tracer.end_span(job, error=e)
+            raise
+        job.set_attribute('uuid', uuid)
+        self._job_spans[uuid] = job
+        return uuid
+
+    def _job_span(self, uuid):
+        """
+        Span of a job, started now for uuids which were submitted before tracing
+        """
+        if uuid not in self._job_spans:
+            self._job_spans[uuid] = self.tracer.start_span('job', uuid=uuid, uri=self._uuid_requests.get(uuid))
+        return self._job_spans[uuid]
+
+    def _job_span_of(self, uri):
+        return self._job_spans.get(self._download_uuids.get(uri))
+
+    def _end_job_spans(self, uuids):
+        if self.tracer is None:
+            return
+        for uuid in uuids:
+            job = self._job_spans.pop(uuid, None)
+            if job is not None:
+                self.tracer.end_span(job)
 
     @retry(wait_exponential_multiplier=5000, wait_exponential_max=15000,
            stop_max_attempt_number=3, retry_on_exception=_http_error)
     def _submit_v2_req(self, call):
-        self.logger.debug(f'Submitting async. request with uri=\n{call}')
+        self.logger.debug('Submitting async. request with uri=\n%s', call)
         r1_dict = self.get_content(call)
         uuid = r1_dict['uuid']
+        self._save_uuid(uuid, call)
+        self.journal.record('submitted', uuid=uuid, uri=call)
+        self.logger.info('Received response uuid: %s', uuid)
+        return uuid
+
+    def _save_uuid(self, uuid, call):
         with open(f'{uuid}.uuid', 'w') as uuid_save:
             uuid_save.write(f'{call}' + '\n')
+            if call in self._pixel_fanout:
+                uuid_save.write(json.dumps(self._pixel_fanout[call]) + '\n')
             uuid_save.flush()
-        self.logger.info(f'Received response uuid: {uuid}')
-        return uuid
+        self._uuid_requests[uuid] = call
+
+    def find_reusable_results(self, uris, n_jobs=8):
+        """
+        Find previous requests for the same uris which can still be downloaded
+
+        Uris are matched against the previous requests of this account and the
+        local job journal. The status of each match is checked, most recent first,
+        the uris are checked concurrently.
+
+        Parameters
+        ----------
+        uris: list of str
+        n_jobs: int
+            Maximum number of simultaneous status requests
 
-    def submit_async_requests(self, n_jobs=1, queue_files=True):
+        Returns
+        -------
+        dict
+            uri -> uuid of a previous request with the same uri
+        """
+        if self._previous_results is None:
+            try:
+                prev_requests = self.get_prev_requests()
+            except requests.exceptions.RequestException as e:
+                self.logger.warning(f'Could not load previous requests: {e}')
+                prev_requests = None
+            self._previous_results = previous_results(prev_requests, self.journal, host=self.host)
+
+        def find(uri):
+            for uuid in self._previous_results.get(request_key(uri), []):
+                status_url = f'{self.base_url}/api/v2/api-requests/{uuid}/status'
+                try:
+                    status = self.get_content(status_url)
+                except requests.exceptions.RequestException:
+                    continue
+                if is_reusable(status):
+                    return uuid
+            return None
+
+        candidates = [uri for uri in uris if request_key(uri) in self._previous_results]
+        if not candidates:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(min(n_jobs, len(candidates)), 1)) as executor:
+            uuids = list(executor.map(find, candidates))
+        return {uri: uuid for uri, uuid in zip(candidates, uuids) if uuid is not None}
+
+    @timed_stage('submit')
+    def submit_async_requests(self, n_jobs=1, queue_files=True, batch_size=1000, reuse_results=False):
         """
         Submit the requests to the VanderSat backend to start the
         processing jobs and retrieve the uuids attached to each job
@@ -368,6 +653,10 @@ class VdsApiV2(VdsApiBase):
         the files attached to the received uuids after they finished
         processing
 
+        When no requests were generated yet, the uris are generated lazily
+        from the configuration and submitted in batches, so the full set
+        of uris is never kept in memory.
+
         Parameters
         ----------
         n_jobs: int
@@ -377,16 +666,39 @@ class VdsApiV2(VdsApiBase):
         queue_files: bool
             Also queue files once all processing is finished. This can
             take a long time.
+        batch_size: int
+            Number of uris taken from the (lazy) request queue at once.
+            The next batch is only generated after the previous one was submitted
+        reuse_results: bool
+            Do not submit uris for which a previous request (of this account or
+            in the job journal) can still be downloaded, but queue its uuid instead
         """
-        if not self.async_requests:
-            self.gen_uri()
-
-        self.async_requests = list(OrderedDict.fromkeys(self.async_requests))
+        if self.async_requests:
+            uris = unique_everseen(self.async_requests)
+        else:
+            uris = self.iter_uri()
 
-        n_jobs = min(min(max(len(self.async_requests), 1), n_jobs), 8)
-        uuids = Parallel(n_jobs=n_jobs, require='sharedmem')(delayed(self._submit_v2_req)(call)
-                                                             for call in self.async_requests)
-        self.uuids.extend(uuids)
+        n_jobs = min(max(n_jobs, 1), 8)
+        self._previous_results = None
+        with Parallel(n_jobs=n_jobs, require='sharedmem') as parallel:
+            while True:
+                generated = time.time()
+                batch = list(islice(uris, batch_size))
+                if not batch:
+                    break
+                generated = (generated, time.time())
+                if reuse_results:
+                    reused = self.find_reusable_results(batch)
+                    for call, uuid in reused.items():
+                        self.logger.info('Reusing results of uuid %s for uri: %s', uuid, call)
+                        self._save_uuid(uuid, call)
+                        if self.tracer is not None:
+                            self._job_spans[uuid] = self.tracer.start_span('job', start=generated[0], uri=call,
+                                                                           uuid=uuid, reused=True)
+                    self.uuids.extend(reused.values())
+                    batch = [call for call in batch if call not in reused]
+                uuids = parallel(delayed(self._submit_job)(call, generated) for call in batch)
+                self.uuids.extend(uuids)
         self.async_requests = []
         if queue_files:
             self.queue_uuids_files()
@@ -394,36 +706,81 @@ class VdsApiV2(VdsApiBase):
     @retry(wait_exponential_multiplier=5000, wait_exponential_max=15000,
            stop_max_attempt_number=7, retry_on_exception=_no_type_error)
     def _uuid_status(self, uuid, wait_for_complete=True):
-        status_url = f'https://{self.host}/api/v2/api-requests/{uuid}/status'
-        self.logger.debug(f'Status request for UUID: {uuid}')
+        status_url = f'{self.base_url}/api/v2/api-requests/{uuid}/status'
+        self.logger.debug('Status request for UUID: %s', uuid)
         status_dict = self.get_content(status_url)
+        show_progress = not log.pipeline().summary_only
         while (status_dict['percentage'] < 100 or status_dict['processing_status'] != 'Ready'
                 or status_dict.get('data') is None) and wait_for_complete:
             time.sleep(self._wait_time)
             status_dict = self.get_content(status_url)
-            _ = sys.stderr.write('\t' * 20 + '\b\r')
-            progress_bar(status_dict['percentage'] / 100.0)
-        self.logger.info(f'Ready for download UUID: {uuid}')
+            if show_progress:
+                _ = sys.stderr.write('\t' * 20 + '\b\r')
+                progress_bar(status_dict['percentage'] / 100.0)
+        self.logger.info('Ready for download UUID: %s', uuid)
         return status_dict
 
+    @timed_stage('poll')
     def queue_uuids_files(self, uuids=None):
         if uuids is None:
             self._get_uuid_save()
             uuids = self.uuids
-        if type(uuids) not in [list, set, tuple]:
-            uuids = set(uuids)
-        while uuids:
+        elif isinstance(uuids, str):
+            uuids = [uuids]
+        queued = set(uuids)
+        if uuids is not self.uuids:  # Queue the requested uuids first
+            self.uuids = list(dict.fromkeys(uuids)) + [uuid for uuid in self.uuids if uuid not in queued]
+        while self.uuids and self.uuids[0] in queued:
             uuid = self.uuids.pop(0)
-            content = self._uuid_status(uuid)
+            if self.tracer is None:
+                content = self._uuid_status(uuid)
+            else:
+                with self.tracer.span('poll', self._job_span(uuid)) as span:
+                    content = self._uuid_status(uuid)
+                    span.set_attribute('files', len(content['data']))
             data = content['data']
-            self._api_calls += [f'https://{self.host}{fileloc}/download' for fileloc in data]
+            self.journal.record('ready', uuid=uuid, files=len(data))
+            calls = [f'{self.base_url}{fileloc}/download' for fileloc in data]
+            self._download_uuids.update({call: uuid for call in calls})
+            self._api_calls += calls
             self._remove_after_dowload.append(uuid)
 
-    def download_async_files(self, uuids=None, n_proc=1):
+    def download_async_files(self, uuids=None, n_proc=1, parquet=None):
+        """
+        Download the files of finished requests to `.outfold`
+
+        Parameters
+        ----------
+        uuids: list of str, optional
+            Only download these uuids, all submitted and unfinished uuids if not given
+        n_proc: int
+            Number of simultaneous downloads
+        parquet: str, optional
+            Also stream downloaded csv time-series into the Parquet dataset at this path,
+            partitioned by product, see `vds_api_client.columnar.ParquetTimeSeriesWriter`
+        """
         self.queue_uuids_files(uuids)
         self._api_calls = list(set(self._api_calls))  # Remove double entries
-        self.bulk_download(n_proc)
+        n_outputs = len(self._outputs)
+        start = time.time()
+        if parquet is None:
+            self.bulk_download(n_proc)
+        else:
+            with ParquetTimeSeriesWriter(parquet) as writer:
+                hook = self._parquet_hook(writer)
+                self.output_hooks.append(hook)
+                try:
+                    self.bulk_download(n_proc)
+                finally:
+                    self.output_hooks.remove(hook)
+            self.logger.info(f'Wrote {writer.rows} time-series rows to {parquet}')
+        outputs = [fn.decode() for fn in self._outputs[n_outputs:]]
+        self.journal.record('downloaded', uuids=self._remove_after_dowload, files=len(outputs),
+                            bytes=sum(os.path.getsize(fn) for fn in outputs if os.path.exists(fn)),
+                            seconds=time.time() - start)
+        self._fan_out_pixels()
         uuids = self._remove_after_dowload
+        self._end_job_spans(uuids)
         with open(time.strftime('download_%Y-%m-%dT%H%M%S.uuids'), 'w') as f:
             f.write('\n'.join(uuids) + '\n')
             f.flush()
@@ -431,6 +788,22 @@ class VdsApiV2(VdsApiBase):
             if os.path.exists(uuid + '.uuid'):
                 os.remove(uuid + '.uuid')
 
+    def _parquet_hook(self, writer):
+        """
+        Output hook which adds each downloaded csv time-series to a Parquet writer
+        """
+        calls = {os.path.basename(self._extract_fn(call)): call for call in self._api_calls}
+
+        def hook(fn):
+            uri = self._uuid_requests.get(self._download_uuids.get(calls.get(os.path.basename(fn))))
+            if uri is None or endpoint_of(uri) not in TS_ENDPOINTS or not fn.endswith('.csv'):
+                self.logger.debug('%s is no csv time-series, not added to Parquet', os.path.basename(fn))
+                return
+            product, locations = ts_locations(uri, self._pixel_fanout.get(uri))
+            writer.write_file(fn, product, locations)
+
+        return hook
+
     def get_value(self, product, date, lon, lat):
         """
         Get product values at these indices and return them as arrays
@@ -448,17 +821,91 @@ class VdsApiV2(VdsApiBase):
         """
         self.check_valid_products(product)
         date = date if isinstance(date, str) else date.strftime('%Y-%m-%dT%H%M%S')
-        uri = f'http://{self.host}/api/v2/products/{product}/point-value?lat={lat}&lon={lon}&date={date}'
+        uri = f'{self.base_url}/api/v2/products/{product}/point-value?lat={lat}&lon={lon}&date={date}'
         return self.get_content(uri)['value']
 
-    @retry(wait_exponential_multiplier=1_000,
-           stop_max_attempt_number=3,
-           retry_on_exception=lambda exception: isinstance(exception, requests.Timeout))
-    def get_roi_df(self, product, roi, start_date, end_date, provide_coverage=False):
+    @timed_stage('point_values')
+    def get_values(self, product, dates, lats, lons, n_jobs=8, as_frame=False):
+        """
+        Get product values for many dates and points at once
+
+        Points falling in the same product pixel are requested once, values are fetched
+        concurrently and kept in `.value_cache` (keyed by product, pixel and date),
+        replace it by e.g. a `TieredCache(LRUCache(), DiskCache(path))` to persist them.
+
+        Parameters
+        ----------
+        product: str
+            Product api_name
+        dates: str or datetime or array_like
+            Date(s) of the requested points
+        lats: float or array_like
+            Latitude(s) of requested points
+        lons: float or array_like
+            Longitude(s) of requested points
+        n_jobs: int
+            Maximum number of simultaneous requests
+        as_frame: bool
+            Return a DataFrame with date, lat, lon and value columns instead of an array
+
+        Returns
+        -------
+        np.ndarray or pd.DataFrame
+            values aligned with the (broadcasted) input, NaN where no value was found
+        """
+        product = self.check_valid_products(product)[0]
+        dates = pd.to_datetime(np.atleast_1d(np.asarray(dates, dtype=object)))
+        lats, lons = np.atleast_1d(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+        date_idx, lats, lons = np.broadcast_arrays(np.arange(len(dates)), lats, lons)
+        try:
+            cell_lats, cell_lons, inverse = unique_pixels(lats, lons, pixel_size(product))
+        except ValueError:
+            cell_lats, cell_lons, inverse = lats, lons, np.arange(lats.size)
+        date_strs = dates.strftime('%Y-%m-%dT%H%M%S')
+        keys = [(product, float(cell_lats[i]), float(cell_lons[i]), date_strs[d])
+                for i, d in zip(inverse, date_idx)]
+        # Values of this call are kept here, the cache may evict them before the result is built
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.value_cache.get(key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.logger.debug('%d values requested, %d unique values not in cache', len(keys), len(missing))
+
+        def fetch(key):
+            _, lat, lon, date = key
+            uri = f'{self.base_url}/api/v2/products/{product}/point-value?lat={lat}&lon={lon}&date={date}'
+            try:
+                value = self.get_content(uri)['value']
+            except requests.exceptions.RequestException as e:
+                self.logger.warning(f'No value for {key}: {e}')
+                return
+            found[key] = value
+            self.value_cache.set(key, value)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(min(n_jobs, len(missing)), 1)) as executor:
+                list(executor.map(fetch, missing))
+        values = np.array([found.get(key) for key in keys], dtype=float)
+        if as_frame:
+            return pd.DataFrame({'date': dates[date_idx], 'lat': lats, 'lon': lons, 'value': values})
+        return values
+
+    @timed_stage('roi_time_series')
+    def get_roi_df(self, product, roi, start_date, end_date, provide_coverage=False, timeout=5,
+                   chunk_days=None, n_jobs=4):
         """
         Method to querry streamed json output and transform this into
         a pandas DataFrame
 
+        Long date ranges are split in chunks which are fetched concurrently.
+        The chunk size adapts to the observed response times, and a chunk
+        which times out is split in two instead of being retried as a whole.
+        With a `.ts_store` only the dates which are not stored yet are fetched.
+
         Parameters
         ----------
         product: str
@@ -472,24 +919,207 @@ class VdsApiV2(VdsApiBase):
         provide_coverage: Bool, optional
             If True, the coverage parameter will be
             included. Default is False.
+        timeout: float, optional
+            Seconds to wait for each response, retried 3 times on a timeout
+        chunk_days: int, optional
+            Fixed number of days per request, adapted to the response times if not set
+        n_jobs: int, optional
+            Maximum number of chunks requested simultaneously
 
         Returns
         -------
         dfs_list: list of pd.DataFrame
 
         """
+        if chunk_days is not None and chunk_days <= 0:
+            raise ValueError('chunk_days must be positive')
         roi_id = self.rois[roi].id
-        uri = (f'https://{self.host}/api/v2/products/{product}/roi-time-series-sync?'
-               f'roi_id={roi_id}&start_time={start_date}&end_time={end_date}&climatology=true&'
+        start = datetime.strptime(str(start_date)[:10], '%Y-%m-%d')
+        end = datetime.strptime(str(end_date)[:10], '%Y-%m-%d')
+        if self.ts_store is None:
+            return self._fetch_roi_df(product, roi_id, start, end, provide_coverage, timeout, chunk_days, n_jobs)
+        key = self.ts_store.register(product, f'roi_{roi_id}', provide_coverage=provide_coverage,
+                                     avg_window_days=AVG_WINDOW_DAYS, avg_window_direction='backward',
+                                     climatology=True)
+        for gap_start, gap_end in self.ts_store.missing(key, start, end):
+            self.logger.debug('Fetching %s for roi %s from %s to %s', product, roi_id, gap_start.date(), gap_end.date())
+            fetched = time.time()
+            df = self._fetch_roi_df(product, roi_id, gap_start, gap_end, provide_coverage, timeout, chunk_days, n_jobs)
+            self.ts_store.append(key, df, gap_start, gap_end, fetched=fetched)
+        return self.ts_store.read(key, start, end)
+
+    def _fetch_roi_df(self, product, roi_id, start, end, provide_coverage, timeout, chunk_days, n_jobs):
+        """
+        Get the roi time-series between start and end from the api, in concurrent chunks
+
+        Every request starts AVG_WINDOW_DAYS earlier than its first date (see `_get_roi_chunk`),
+        so the values do not depend on how the range is split.
+        """
+        if chunk_days is None:
+            with self._roi_chunk_lock:
+                chunk_days = self._roi_chunk_days
+        if (end - start).days < chunk_days:
+            return self._get_roi_range(product, roi_id, start, end, provide_coverage, timeout)
+        chunks = [(chunk_start, min(chunk_start + timedelta(chunk_days - 1), end))
+                  for chunk_start in pd.date_range(start, end, freq=f'{chunk_days}D').to_pydatetime()]
+        self.logger.debug('Requesting %s for roi %s in %d chunks of %d days', product, roi_id, len(chunks), chunk_days)
+        with ThreadPoolExecutor(max_workers=max(min(n_jobs, len(chunks)), 1)) as executor:
+            dfs = list(executor.map(lambda chunk: self._get_roi_range(product, roi_id, *chunk,
+                                                                      provide_coverage, timeout),
+                                    chunks))
+        df = pd.concat(dfs)
+        return df[~df.index.duplicated(keep='first')]
+
+    def _get_roi_range(self, product, roi_id, start, end, provide_coverage, timeout):
+        """
+        Get the roi time-series between start and end, splitting the range in half on a timeout
+        """
+        ndays = (end - start).days + 1
+        try:
+            if ndays <= MIN_CHUNK_DAYS:
+                return self._get_roi_chunk_retry(product, roi_id, start, end, provide_coverage, timeout)
+            return self._get_roi_chunk(product, roi_id, start, end, provide_coverage, timeout)
+        except requests.Timeout:
+            if ndays <= MIN_CHUNK_DAYS:
+                raise
+            with self._roi_chunk_lock:
+                self._roi_chunk_days = max(ndays // 2, MIN_CHUNK_DAYS)
+            self.logger.info(f'Timeout for {ndays} days of {product} for roi {roi_id}, splitting request')
+            mid = start + timedelta(ndays // 2)
+            return pd.concat([self._get_roi_range(product, roi_id, start, mid - timedelta(1),
+                                                  provide_coverage, timeout),
+                              self._get_roi_range(product, roi_id, mid, end, provide_coverage, timeout)])
+
+    def _get_roi_chunk(self, product, roi_id, start, end, provide_coverage, timeout):
+        """
+        Single roi-time-series-sync request. The request starts earlier so the backward
+        averaging window of the first dates is complete, these extra dates are dropped
+        """
+        request_start = start - timedelta(AVG_WINDOW_DAYS)
+        uri = (f'{self.base_url}/api/v2/products/{product}/roi-time-series-sync?'
+               f'roi_id={roi_id}&start_time={request_start:%Y-%m-%d}&end_time={end:%Y-%m-%d}&climatology=true&'
                f'avg_window_direction=backward&provide_coverage={str(provide_coverage).lower()}'
-               f'&avg_window_days=20&format=csv')
-        r = self.get(uri, timeout=5)
-        csv = BytesIO()
-        for chunk in r.iter_content(2048):
-            csv.write(chunk)
-        csv.seek(0)
-        df = pd.read_csv(csv, index_col=0, parse_dates=True, comment='#')
-        csv.close()
+               f'&avg_window_days={AVG_WINDOW_DAYS}&format=csv')
+        t0 = time.time()
+        r = self.get(uri, timeout=timeout)
+        df = read_time_series_csv(r.content)
+        self._adapt_chunk_days((end - request_start).days + 1, time.time() - t0, timeout)
+        start_ts = pd.Timestamp(start)
+        if getattr(df.index, 'tz', None) is not None:
+            start_ts = start_ts.tz_localize(df.index.tz)
+        return df[df.index >= start_ts]
+
+    _get_roi_chunk_retry = retry(wait_exponential_multiplier=1_000,
+                                 stop_max_attempt_number=3,
+                                 retry_on_exception=lambda exception: isinstance(exception, requests.Timeout)
+                                 )(_get_roi_chunk)
+
+    def _adapt_chunk_days(self, ndays, elapsed, timeout):
+        """
+        Aim for chunks that respond in a third of the timeout
+        """
+        if elapsed <= 0 or not timeout:
+            return
+        target_days = ndays * (timeout / 3) / elapsed
+        with self._roi_chunk_lock:
+            chunk_days = int((self._roi_chunk_days + target_days) / 2)
+            self._roi_chunk_days = min(max(chunk_days, MIN_CHUNK_DAYS), MAX_CHUNK_DAYS)
+
+    def iter_roi_dfs(self, products, rois, start_date, end_date, provide_coverage=False,
+                     n_jobs=8, timeout=5):
+        """
+        Retrieve roi time-series DataFrames for all products and rois concurrently,
+        yielding each result as soon as it is available
+
+        Parameters
+        ----------
+        products: list of str
+            Products to extract dataframes from
+        rois: list of (int or str)
+            Regions of interest to retrieve DataFrames from
+        start_date: str
+            start date to retrieve data yyyy-mm-dd
+        end_date: str
+            end date to retrieve data yyyy-mm-dd (inclusive)
+        provide_coverage: Bool, optional
+            Include the coverage column
+        n_jobs: int
+            Maximum number of simultaneous requests
+        timeout: float
+            Seconds to wait for each response, see `get_roi_df`
+
+        Yields
+        ------
+        tuple
+            (product, roi_id, pd.DataFrame), the DataFrame is None if the request failed
+        """
+        products = self.check_valid_products(products)
+        roi_ids = self.check_valid_rois(rois)
+        with ThreadPoolExecutor(max_workers=max(n_jobs, 1)) as executor:
+            futures = {executor.submit(self.get_roi_df, product, roi_id, start_date, end_date,
+                                       provide_coverage=provide_coverage, timeout=timeout, n_jobs=1):
+                       (product, roi_id)
+                       for product in products for roi_id in roi_ids}
+            try:
+                for future in as_completed(futures):
+                    product, roi_id = futures[future]
+                    try:
+                        df = future.result()
+                    except requests.exceptions.RequestException as e:
+                        self.logger.error(f'Failed to retrieve {product} for roi {roi_id}: {e}')
+                        df = None
+                    yield product, roi_id, df
+            except GeneratorExit:
+                # Closed before the end, e.g. by a break: do not start the remaining requests
+                # (as `executor.shutdown(cancel_futures=True)`, which needs python 3.9)
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def get_roi_dfs(self, products, rois, start_date, end_date, provide_coverage=False,
+                    n_jobs=8, timeout=5, callback=None):
+        """
+        Retrieve roi time-series for all products and rois concurrently as one DataFrame
+
+        Parameters
+        ----------
+        products: list of str
+            Products to extract dataframes from
+        rois: list of (int or str)
+            Regions of interest to retrieve DataFrames from
+        start_date: str
+            start date to retrieve data yyyy-mm-dd
+        end_date: str
+            end date to retrieve data yyyy-mm-dd (inclusive)
+        provide_coverage: Bool, optional
+            Include the coverage column
+        n_jobs: int
+            Maximum number of simultaneous requests
+        timeout: float
+            Seconds to wait for each response, see `get_roi_df`
+        callback: callable, optional
+            Called as callback(product, roi_id, df) for every partial result
+
+        Returns
+        -------
+        pd.DataFrame
+            All time-series with a (product, roi_id, date) MultiIndex, in the
+            order of products and rois. Failed requests are left out.
+        """
+        results = {}
+        for product, roi_id, df in self.iter_roi_dfs(products, rois, start_date, end_date,
+                                                      provide_coverage=provide_coverage,
+                                                      n_jobs=n_jobs, timeout=timeout):
+            if callback is not None:
+                callback(product, roi_id, df)
+            if df is not None:
+                results[(product, roi_id)] = df
+        keys = [(product, roi_id) for product in self.check_valid_products(products)
+                for roi_id in self.check_valid_rois(rois) if (product, roi_id) in results]
+        if not keys:
+            return pd.DataFrame()
+        df = pd.concat([results[key] for key in keys], keys=keys)
+        df.index.names = ['product', 'roi_id'] + list(df.index.names[2:])
         return df
 
 # EOF
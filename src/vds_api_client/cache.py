@@ -0,0 +1,159 @@
+import sys
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Thread-safe in-memory cache which evicts the least recently used items
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of items
+    maxbytes: int, optional
+        Maximum total size of the values, measured with `sizeof`
+    sizeof: callable
+        Size of a value in bytes, only used with maxbytes
+    """
+    def __init__(self, maxsize=100_000, maxbytes=None, sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+                return self._items[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._discard(key)
+            self._items[key] = value
+            if self.maxbytes is not None:
+                self._sizes[key] = self.sizeof(value)
+                self.nbytes += self._sizes[key]
+            while len(self._items) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self._discard(next(iter(self._items)))
+
+    def _discard(self, key):
+        if self._items.pop(key, MISSING) is not MISSING:
+            self.nbytes -= self._sizes.pop(key, 0)
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+class DiskCache(object):
+    """
+    Persistent cache of json serializable values in a sqlite database
+
+    Parameters
+    ----------
+    path: str
+        Location of the sqlite database, created if it does not exist
+    """
+    def __init__(self, path='vds_api_cache.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    @staticmethod
+    def _key(key):
+        return key if isinstance(key, str) else json.dumps(key)
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM cache WHERE key = ?', (self._key(key),)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                             (self._key(key), json.dumps(value)))
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM cache WHERE key = ?', (self._key(key),))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM cache')
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class TieredCache(object):
+    """
+    Chain of caches, e.g. a small LRUCache in front of a DiskCache. Values found
+    in a later cache are copied to the earlier ones
+
+    Parameters
+    ----------
+    caches: LRUCache or DiskCache
+    """
+    def __init__(self, *caches):
+        self.caches = caches
+
+    def __contains__(self, key):
+        return any(key in cache for cache in self.caches)
+
+    def get(self, key, default=MISSING):
+        for i, cache in enumerate(self.caches):
+            value = cache.get(key)
+            if value is not MISSING:
+                for earlier in self.caches[:i]:
+                    earlier.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value):
+        for cache in self.caches:
+            cache.set(key, value)
+
+    def delete(self, key):
+        for cache in self.caches:
+            cache.delete(key)
+
+    def clear(self):
+        for cache in self.caches:
+            cache.clear()
+
+# EOF
@@ -0,0 +1,100 @@
+import re
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import Future
+
+# Path regexes of the read-only GET endpoints which are coalesced by Requester.get. Job
+# submissions (also GET requests) and job statuses are always sent separately
+READ_ONLY_ENDPOINTS = [
+    r'/api/v2/products/?$',
+    r'/api/v2/products/[^/]+/point-value$',
+    r'/api/v2/rois/?$',
+    r'/api/v2/rois/\d+$',
+    r'/api/v2/users/me$',
+    r'/api/v2/status/?$',
+]
+
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent identical calls into one
+
+    The first caller of a key (the leader) runs the call, callers arriving
+    with the same key while it is in flight wait for its outcome instead of
+    running the call again. Exceptions are raised in all waiting callers.
+
+    Parameters
+    ----------
+    endpoints: list of str
+        Path regexes of the uris which `Requester.get` coalesces, see `coalesces`
+
+    Attributes
+    ----------
+    calls: int
+        Number of calls which were run
+    shared: int
+        Number of callers which received the outcome of another call
+    """
+    def __init__(self, endpoints=READ_ONLY_ENDPOINTS):
+        self.endpoints = [re.compile(endpoint) for endpoint in endpoints]
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def __str__(self):
+        return f'SingleFlight(calls={self.calls}, shared={self.shared}, in_flight={len(self._futures)})'
+
+    def __repr__(self):
+        return str(self)
+
+    def coalesces(self, uri):
+        """
+        Whether GET requests of this uri may be coalesced, only read-only endpoints are
+        """
+        path = urlsplit(uri).path
+        return any(endpoint.search(path) for endpoint in self.endpoints)
+
+    def do(self, key, fn, share=None):
+        """
+        Run fn, or wait for the in-flight call with the same key
+
+        Parameters
+        ----------
+        key: hashable
+        fn: callable
+            fn() -> result, only called by the leader
+        share: callable, optional
+            share(result) -> result given to the waiting callers, e.g. a copy
+
+        Returns
+        -------
+        object
+            result of fn
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            result = future.result()
+            return share(result) if share is not None else result
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key):
+        with self._lock:
+            del self._futures[key]
+
+# EOF
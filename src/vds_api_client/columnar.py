@@ -0,0 +1,196 @@
+import os
+import uuid
+
+import numpy as np
+
+from vds_api_client.journal import endpoint_of
+from vds_api_client.parsing import read_time_series_csv
+from vds_api_client.planner import _product, _query
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+TS_ENDPOINTS = {'point-time-series', 'roi-time-series'}
+
+
+def ts_locations(uri, points=None):
+    """
+    Product and locations of the output of a time-series request
+
+    Parameters
+    ----------
+    uri: str
+        [point/roi]-time-series request uri
+    points: list of tuple, optional
+        Original (lat, lon) points of a snapped pixel request
+
+    Returns
+    -------
+    product: str
+    locations: list of tuple
+        (location_id, lat, lon) with NaN coordinates for rois
+    """
+    if endpoint_of(uri) not in TS_ENDPOINTS:
+        raise ValueError(f'Not a time-series request: {uri}')
+    query = _query(uri)
+    if 'roi_id' in query:
+        return _product(uri), [(f'roi_{query["roi_id"]}', np.nan, np.nan)]
+    if not points:
+        points = [(float(query['lat']), float(query['lon']))]
+    return _product(uri), [(f'{lat:.6f}_{lon:.6f}', lat, lon) for lat, lon in points]
+
+
+class ParquetTimeSeriesWriter(object):
+    """
+    Stream time-series into a Parquet dataset partitioned by product
+
+    Rows are buffered and written as row groups to one open file per product
+    (`<path>/product=<product>/part-<id>.parquet`), so large campaigns result in
+    a few large files instead of many small ones. Every series gets a
+    `location_id` column (`roi_<id>` or `<lat>_<lon>`) next to its coordinates.
+    Files are only complete after `close`, use the writer as a context manager.
+
+    Parameters
+    ----------
+    path: str
+        Root folder of the dataset, created if it does not exist
+    compression: str
+        Parquet compression codec
+    row_group_size: int
+        Number of buffered rows per product before a row group is written
+    """
+    def __init__(self, path, compression='zstd', row_group_size=100_000):
+        if pa is None:
+            raise ImportError('Writing Parquet requires the `pyarrow` package (pip install vds-api-client[fast])')
+        self.path = path
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._writers = {}
+        self._buffers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, df, product, location_id, lat=np.nan, lon=np.nan):
+        """
+        Add a single time-series
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            Time-series indexed by date
+        product: str
+        location_id: str
+        lat: float
+        lon: float
+        """
+        df = df.reset_index()
+        df = df.rename(columns={df.columns[0]: 'date'})
+        df.insert(1, 'location_id', location_id)
+        df.insert(2, 'lat', float(lat))
+        df.insert(3, 'lon', float(lon))
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata()
+        buffer = self._buffers.get(product)
+        schema = buffer[0].schema if buffer else getattr(self._writers.get(product), 'schema', None)
+        if schema is not None and not schema.equals(table.schema):  # e.g. an extra coverage column
+            self._flush(product)
+            self._close_writer(product)
+        buffer = self._buffers.setdefault(product, [])
+        buffer.append(table)
+        self.rows += len(df)
+        if sum(len(t) for t in buffer) >= self.row_group_size:
+            self._flush(product)
+
+    def write_file(self, fn, product, locations):
+        """
+        Add a downloaded csv time-series file for one or more locations
+
+        Parameters
+        ----------
+        fn: str
+            Path of the csv file
+        product: str
+        locations: list of tuple
+            (location_id, lat, lon), see `ts_locations`
+        """
+        with open(fn, 'rb') as f:
+            df = read_time_series_csv(f.read())
+        for location_id, lat, lon in locations:
+            self.write(df, product, location_id, lat, lon)
+
+    def _flush(self, product):
+        buffer = self._buffers.get(product)
+        if not buffer:
+            return
+        table = pa.concat_tables(buffer)
+        if product not in self._writers:
+            folder = os.path.join(self.path, f'product={product}')
+            os.makedirs(folder, exist_ok=True)
+            fn = os.path.join(folder, f'part-{uuid.uuid4().hex}.parquet')
+            self._writers[product] = pq.ParquetWriter(fn, table.schema, compression=self.compression)
+        self._writers[product].write_table(table)
+        self._buffers[product] = []
+
+    def _close_writer(self, product):
+        writer = self._writers.pop(product, None)
+        if writer is not None:
+            writer.close()
+
+    def close(self):
+        """
+        Write the remaining rows and finalize all files
+        """
+        for product in list(self._buffers):
+            self._flush(product)
+            self._close_writer(product)
+
+
+def read_time_series_dataset(path, products=None, location_ids=None, columns=None):
+    """
+    Load (part of) a Parquet time-series dataset
+
+    Parameters
+    ----------
+    path: str
+        Root folder of the dataset
+    products: list of str, optional
+        Only load these products
+    location_ids: list of str, optional
+        Only load these locations
+    columns: list of str, optional
+        Only load these value columns
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by (product, location_id, date)
+    """
+    if pa is None:
+        raise ImportError('Reading Parquet requires the `pyarrow` package (pip install vds-api-client[fast])')
+    dataset = pa_ds.dataset(path, format='parquet', partitioning='hive')
+    # Files may differ in columns, e.g. when only some requests provide coverage
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()] + [dataset.schema])
+    dataset = pa_ds.dataset(path, schema=schema, format='parquet', partitioning='hive')
+    filters = []
+    if products is not None:
+        filters.append(pa_ds.field('product').isin(list(products)))
+    if location_ids is not None:
+        filters.append(pa_ds.field('location_id').isin(list(location_ids)))
+    if columns is not None:
+        columns = ['product', 'location_id', 'date', 'lat', 'lon'] + [c for c in columns if c not in ['lat', 'lon']]
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    df['product'] = df['product'].astype(str)
+    return df.set_index(['product', 'location_id', 'date']).sort_index()
+
+# EOF
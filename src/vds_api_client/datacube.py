@@ -0,0 +1,178 @@
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import dask
+    import dask.array as da
+    import xarray as xr
+except ImportError:
+    xr = None
+
+try:
+    import rasterio
+except ImportError:
+    rasterio = None
+
+GRID_EXTENSIONS = {'.tif': 'gtiff', '.tiff': 'gtiff', '.nc': 'netcdf4'}
+
+# Names of the files of the gridded-data endpoint, ending in the first 5 characters of the uuid
+_grid_fn = re.compile(r'^(?P<product>.+)_(?P<date>\d{4}-\d{2}-\d{2}T\d{6})'
+                      r'_(?P<lon_min>-?\d+\.\d+)_(?P<lat_max>-?\d+\.\d+)_(?P<lon_max>-?\d+\.\d+)_(?P<lat_min>-?\d+\.\d+)'
+                      r'(?:_[0-9a-f]{5})?(?P<ext>\.tiff?|\.nc)$')
+
+
+def index_grids(outfold, product=None, files=None):
+    """
+    Index the downloaded gridded files in a folder by product, date and bounding box
+
+    Parameters
+    ----------
+    outfold: str
+        Folder with downloaded files
+    product: str, optional
+        Only index the files of this product
+    files: list of str, optional
+        Only index these files in `outfold`, all files in `outfold` if not given
+
+    Returns
+    -------
+    pd.DataFrame
+        product, date, lon_min, lat_max, lon_max, lat_min and path of each file, sorted by product and date
+    """
+    records = []
+    names = os.listdir(outfold or '.') if files is None else {os.path.basename(os.fsdecode(fn)) for fn in files}
+    for fn in sorted(names):
+        match = _grid_fn.match(fn)
+        if match is None or (product is not None and match['product'].lower() != product.lower()):
+            continue
+        records.append(dict(product=match['product'], date=datetime.strptime(match['date'], '%Y-%m-%dT%H%M%S'),
+                            lon_min=float(match['lon_min']), lat_max=float(match['lat_max']),
+                            lon_max=float(match['lon_max']), lat_min=float(match['lat_min']),
+                            path=os.path.join(outfold or '.', fn)))
+    columns = ['product', 'date', 'lon_min', 'lat_max', 'lon_max', 'lat_min', 'path']
+    df = pd.DataFrame(records, columns=columns)
+    return df.sort_values(['product', 'date'], kind='stable').reset_index(drop=True)
+
+
+def grid_coords(path):
+    """
+    Latitudes (north to south) and longitudes (west to east) of the pixel centers of a file
+
+    Parameters
+    ----------
+    path: str
+        GeoTIFF or netCDF file
+
+    Returns
+    -------
+    tuple of np.ndarray
+    """
+    if GRID_EXTENSIONS[os.path.splitext(path)[1].lower()] == 'gtiff':
+        if rasterio is None:
+            raise ImportError('Reading GeoTIFF files requires the `rasterio` package')
+        with rasterio.open(path) as src:
+            transform = src.transform
+            lons = transform.c + (np.arange(src.width) + 0.5) * transform.a
+            lats = transform.f + (np.arange(src.height) + 0.5) * transform.e
+        return np.round(lats, 8), np.round(lons, 8)
+    with xr.open_dataset(path) as ds:
+        lat_name, lon_name = _lat_lon_names(ds)
+        return np.sort(ds[lat_name].values)[::-1], np.sort(ds[lon_name].values)
+
+
+def _lat_lon_names(ds):
+    names = list(ds.dims)
+    lat_name = next(name for name in names if name.lower().startswith('lat') or name.lower() == 'y')
+    lon_name = next(name for name in names if name.lower().startswith('lon') or name.lower() == 'x')
+    return lat_name, lon_name
+
+
+def read_grid(path):
+    """
+    Values of the first band or data variable of a file, north up with NaN as no-data
+
+    Parameters
+    ----------
+    path: str
+        GeoTIFF or netCDF file
+
+    Returns
+    -------
+    np.ndarray
+        float32 array of shape (lat, lon)
+    """
+    if GRID_EXTENSIONS[os.path.splitext(path)[1].lower()] == 'gtiff':
+        if rasterio is None:
+            raise ImportError('Reading GeoTIFF files requires the `rasterio` package')
+        with rasterio.open(path) as src:
+            return src.read(1, masked=True).astype('float32').filled(np.nan)
+    with xr.open_dataset(path) as ds:
+        lat_name, lon_name = _lat_lon_names(ds)
+        var = next(var for var in ds.data_vars.values() if {lat_name, lon_name}.issubset(var.dims))
+        var = var.load().squeeze(drop=True).transpose(lat_name, lon_name).sortby(lat_name, ascending=False)
+        return var.values.astype('float32')
+
+
+def _read_checked(path, shape):
+    values = read_grid(path)
+    if values.shape != shape:
+        raise ValueError(f'{os.path.basename(path)} has shape {values.shape} instead of {shape}, '
+                         f'files of one datacube should share the same grid')
+    return values
+
+
+def open_datacube(outfold, product, bbox=None, chunks=None):
+    """
+    Lazily open the downloaded gridded files of a product as a time x lat x lon array
+
+    Files are indexed by their names and only read when values are computed,
+    one file per chunk along time. Only the grid of the first file is read
+    when opening.
+
+    Parameters
+    ----------
+    outfold: str
+        Folder with downloaded files
+    product: str
+        Product api_name
+    bbox: tuple of float, optional
+        (lon_min, lat_max, lon_max, lat_min) of the requested area, required
+        when the folder contains files of several areas (e.g. spatial tiles)
+    chunks: dict, optional
+        Rechunk the dask array, e.g. {'time': 10, 'lat': 500, 'lon': 500}
+
+    Returns
+    -------
+    xarray.DataArray
+        dask backed array with `time`, `lat` and `lon` coordinates
+    """
+    if xr is None:
+        raise ImportError('open_datacube requires the `xarray` and `dask` packages (pip install vds-api-client[datacube])')
+    index = index_grids(outfold, product)
+    if index.empty:
+        raise FileNotFoundError(f'No gridded files of {product} found in {outfold}')
+    bboxes = index[['lon_min', 'lat_max', 'lon_max', 'lat_min']].drop_duplicates()
+    if bbox is not None:
+        index = index[np.isclose(index[['lon_min', 'lat_max', 'lon_max', 'lat_min']], bbox).all(axis=1)]
+        if index.empty:
+            raise ValueError(f'No files of {product} with bounding box {bbox}, choose from {bboxes.values.tolist()}')
+    elif len(bboxes) > 1:
+        raise ValueError(f'Files of {product} cover {len(bboxes)} areas, select one with bbox or mosaic them first. '
+                         f'Areas: {bboxes.values.tolist()}')
+    index = index.drop_duplicates('date', keep='last')
+    lats, lons = grid_coords(index['path'].iloc[0])
+    shape = (len(lats), len(lons))
+    read = dask.delayed(_read_checked, pure=True)
+    data = da.stack([da.from_delayed(read(path, shape), shape=shape, dtype='float32') for path in index['path']])
+    cube = xr.DataArray(data, dims=('time', 'lat', 'lon'),
+                        coords={'time': index['date'].values, 'lat': lats, 'lon': lons},
+                        name=index['product'].iloc[0], attrs={'files': index['path'].tolist()})
+    if chunks:
+        cube = cube.chunk(chunks)
+    return cube
+
+# EOF
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+AV_WIN_DIRECTIONS = {'center', 'backward'}
+
+
+def _as_series(series):
+    if not isinstance(series.index, pd.DatetimeIndex):
+        raise TypeError('Time-series should be indexed by date')
+    return series.sort_index().astype(float)
+
+
+def moving_average(series, av_win, av_win_dir='center'):
+    """
+    Running mean over all observations within `av_win` days
+
+    Same as the `avg_window_days` and `avg_window_direction` options of the
+    time-series endpoints: a centered window covers the dates from `av_win`
+    days before until `av_win` days after each date, a backward window the
+    dates from `av_win` days before up to and including each date. Missing
+    values are ignored.
+
+    Parameters
+    ----------
+    series: pd.Series
+        Time-series indexed by date
+    av_win: int
+        Window size in days
+    av_win_dir: str
+        One of {'center', 'backward'}
+
+    Returns
+    -------
+    pd.Series
+    """
+    if av_win < 0:
+        raise ValueError('No window_size < 0 allowed, please revise settings')
+    if av_win_dir not in AV_WIN_DIRECTIONS:
+        raise ValueError('Window direction should be in {"center", "backward"}')
+    series = _as_series(series)
+    if av_win_dir == 'center':
+        return series.rolling(f'{2 * av_win + 1}D', center=True, min_periods=1).mean()
+    return series.rolling(f'{av_win + 1}D', min_periods=1).mean()
+
+
+def climatology(series):
+    """
+    Mean value of each calendar day over all years of the series
+
+    The server computes the climatology over the full record of the product,
+    so the result only matches when the series covers that full record.
+
+    Parameters
+    ----------
+    series: pd.Series
+        Time-series indexed by date, usually the moving average
+
+    Returns
+    -------
+    pd.Series
+        climatology at the dates of the series
+    """
+    series = _as_series(series)
+    day = series.index.month * 100 + series.index.day
+    return series.groupby(day).transform('mean')
+
+
+def exp_filter(series, t):
+    """
+    Root zone index using the exponential filter with characteristic time `t`
+
+    Same as the `exp_filter_t` option of the time-series endpoints. The
+    recursive filter (Albergel et al., 2008)
+
+        SWI_n = SWI_n-1 + K_n * (ms_n - SWI_n-1),  K_n = K_n-1 / (K_n-1 + exp(-(t_n - t_n-1) / T))
+
+    equals the average of all previous observations weighted by
+    exp(-(t_n - t_i) / T), which is computed at once with `pd.Series.ewm`.
+    Missing observations are skipped.
+
+    Parameters
+    ----------
+    series: pd.Series
+        Time-series indexed by date
+    t: int
+        Characteristic time length T in days
+
+    Returns
+    -------
+    pd.Series
+    """
+    if t <= 0:
+        raise ValueError('The exponential filter needs a characteristic time T > 0')
+    series = _as_series(series)
+    valid = series.dropna()
+    swi = valid.ewm(halflife=pd.Timedelta(days=t * np.log(2)), times=valid.index).mean()
+    return swi.reindex(series.index).ffill()
+
+
+def add_derived_columns(df, column=None, av_win=0, av_win_dir='center', clim=False, t=None):
+    """
+    Derive averaging, climatology and root zone columns from a raw time-series
+
+    Uses the same options as `VdsApiV2.gen_time_series_requests`, so different
+    settings can be compared locally on a series that was downloaded once.
+    Columns are named after their settings, e.g. `<column>_avg_20d_backward`,
+    `<column>_clim` and `<column>_exp_filter_t10`.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Time-series indexed by date
+    column: str, optional
+        Column with the raw values, the first column if not given
+    av_win: int
+        Add a running mean with an `av_win` day window, see `moving_average`
+    av_win_dir: str
+        One of {'center', 'backward'}
+    clim: bool
+        Add the climatology of the running mean (of the raw values if `av_win` is 0)
+    t: int, optional
+        Add the exponential filter root zone index with this characteristic time
+
+    Returns
+    -------
+    pd.DataFrame
+        copy of df with the derived columns
+    """
+    column = df.columns[0] if column is None else column
+    df = df.sort_index().copy()
+    average = df[column]
+    if av_win:
+        average = moving_average(df[column], av_win, av_win_dir)
+        df[f'{column}_avg_{av_win}d_{av_win_dir}'] = average
+    if clim:
+        df[f'{column}_clim'] = climatology(average)
+    if t is not None:
+        df[f'{column}_exp_filter_t{t}'] = exp_filter(df[column], t)
+    return df
+
+# EOF
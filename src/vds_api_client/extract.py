@@ -0,0 +1,210 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import xarray as xr
+except ImportError:
+    xr = None
+
+
+def _polygons(geojson):
+    """
+    Rings of all polygons in a geojson geometry, feature or feature collection
+
+    Yields
+    ------
+    list of np.ndarray
+        exterior ring followed by the holes, as (n, 2) arrays of lon, lat
+    """
+    if isinstance(geojson, (str, bytes)):
+        geojson = json.loads(geojson)
+    kind = geojson.get('type')
+    if kind == 'FeatureCollection':
+        for feature in geojson['features']:
+            yield from _polygons(feature)
+    elif kind == 'Feature':
+        yield from _polygons(geojson['geometry'])
+    elif kind == 'GeometryCollection':
+        for geometry in geojson['geometries']:
+            yield from _polygons(geometry)
+    elif kind == 'Polygon':
+        yield [np.asarray(ring, dtype=float)[:, :2] for ring in geojson['coordinates']]
+    elif kind == 'MultiPolygon':
+        for polygon in geojson['coordinates']:
+            yield [np.asarray(ring, dtype=float)[:, :2] for ring in polygon]
+    else:
+        raise ValueError(f'Unsupported geometry type {kind}, only (Multi)Polygons can be used as roi')
+
+
+def _in_ring(ring, lons, lats):
+    """
+    Even-odd test of points against one ring, vectorized over the points
+    """
+    inside = np.zeros(np.broadcast(lons, lats).shape, dtype=bool)
+    for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:]):
+        if y0 == y1:
+            continue
+        crosses = (y0 > lats) != (y1 > lats)
+        x_cross = x0 + (lats - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (lons < x_cross)
+    return inside
+
+
+class RoiMask(object):
+    """
+    Pixels of a grid with their center inside a roi geometry
+
+    The mask only covers the bounding box of the geometry, given by the
+    row and column slices into the grid.
+
+    Parameters
+    ----------
+    geojson: dict or str
+        (Multi)Polygon geometry, feature or feature collection in lon/lat
+    lats: np.ndarray
+        Pixel center latitudes of the grid
+    lons: np.ndarray
+        Pixel center longitudes of the grid
+    """
+    def __init__(self, geojson, lats, lons):
+        polygons = list(_polygons(geojson))
+        lats, lons = np.asarray(lats), np.asarray(lons)
+        points = np.concatenate([polygon[0] for polygon in polygons])
+        rows = np.flatnonzero((lats >= points[:, 1].min()) & (lats <= points[:, 1].max()))
+        cols = np.flatnonzero((lons >= points[:, 0].min()) & (lons <= points[:, 0].max()))
+        if rows.size == 0 or cols.size == 0:
+            self.rows, self.cols = slice(0, 0), slice(0, 0)
+            self.mask = np.zeros((0, 0), dtype=bool)
+            return
+        self.rows = slice(rows[0], rows[-1] + 1)
+        self.cols = slice(cols[0], cols[-1] + 1)
+        grid_lons, grid_lats = np.meshgrid(lons[self.cols], lats[self.rows])
+        self.mask = np.zeros(grid_lats.shape, dtype=bool)
+        for polygon in polygons:
+            inside = _in_ring(polygon[0], grid_lons, grid_lats)
+            for hole in polygon[1:]:
+                inside &= ~_in_ring(hole, grid_lons, grid_lats)
+            self.mask |= inside
+
+    @property
+    def npixels(self):
+        return int(self.mask.sum())
+
+
+def roi_masks(rois, lats, lons):
+    """
+    Precompute the pixel masks of rois on a grid
+
+    Parameters
+    ----------
+    rois: iterable of Roi or dict
+        `vds_api_client.types.Roi` objects or a mapping of roi id -> geojson
+    lats: np.ndarray
+        Pixel center latitudes of the grid
+    lons: np.ndarray
+        Pixel center longitudes of the grid
+
+    Returns
+    -------
+    dict
+        roi id -> RoiMask
+    """
+    items = rois.items() if isinstance(rois, dict) else ((roi.id, roi.geojson) for roi in rois)
+    return {roi_id: RoiMask(geojson, lats, lons) for roi_id, geojson in items}
+
+
+def pixel_indices(coords, values):
+    """
+    Index of the pixel each value falls in, -1 outside of the grid
+
+    Parameters
+    ----------
+    coords: np.ndarray
+        Regularly spaced pixel centers, ascending or descending
+    values: array_like
+
+    Returns
+    -------
+    np.ndarray
+    """
+    coords = np.asarray(coords, dtype=float)
+    values = np.asarray(values, dtype=float)
+    step = coords[1] - coords[0] if coords.size > 1 else 1.
+    index = np.floor((values - coords[0]) / step + 0.5).astype(int)
+    index[(index < 0) | (index >= coords.size) | np.isnan(values)] = -1
+    return index
+
+
+def point_series(cube, lats, lons):
+    """
+    Time-series of the pixels containing each point
+
+    Parameters
+    ----------
+    cube: xarray.DataArray
+        time x lat x lon array, see `vds_api_client.datacube.open_datacube`
+    lats: array_like
+        Point latitudes
+    lons: array_like
+        Point longitudes
+
+    Returns
+    -------
+    pd.DataFrame
+        time x points, NaN for points outside of the grid
+    """
+    rows = pixel_indices(cube['lat'].values, lats)
+    cols = pixel_indices(cube['lon'].values, lons)
+    valid = (rows >= 0) & (cols >= 0)
+    values = np.full((cube.sizes['time'], valid.size), np.nan, dtype='float32')
+    if valid.any():
+        # Pointwise selection, every file is read once for all points
+        selected = cube.isel(lat=xr.Variable('point', rows[valid]), lon=xr.Variable('point', cols[valid]))
+        values[:, valid] = selected.transpose('time', 'point').values
+    return pd.DataFrame(values, index=pd.DatetimeIndex(cube['time'].values, name='date'))
+
+
+def zonal_stats(cube, masks, time_chunk=None):
+    """
+    Mean and coverage of each roi for all dates in one pass over the cube
+
+    Parameters
+    ----------
+    cube: xarray.DataArray
+        time x lat x lon array, see `vds_api_client.datacube.open_datacube`
+    masks: dict
+        roi id -> RoiMask, see `roi_masks`
+    time_chunk: int, optional
+        Number of dates loaded at once, the time chunks of the cube if not given
+
+    Returns
+    -------
+    pd.DataFrame
+        `mean` and `coverage` (percentage of valid pixels) indexed by (roi_id, date)
+    """
+    dates = pd.DatetimeIndex(cube['time'].values, name='date')
+    if time_chunk is None:
+        time_chunk = cube.chunks[0][0] if cube.chunks else len(dates)
+    means = {roi_id: np.full(len(dates), np.nan) for roi_id in masks}
+    coverage = {roi_id: np.zeros(len(dates)) for roi_id in masks}
+    for start in range(0, len(dates), time_chunk):
+        block = np.asarray(cube[start:start + time_chunk].values)
+        for roi_id, roi_mask in masks.items():
+            if roi_mask.npixels == 0:
+                continue
+            pixels = block[:, roi_mask.rows, roi_mask.cols][:, roi_mask.mask]
+            nvalid = np.isfinite(pixels).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[roi_id][start:start + time_chunk] = np.nansum(pixels, axis=1) / np.where(nvalid, nvalid, np.nan)
+            coverage[roi_id][start:start + time_chunk] = 100. * nvalid / roi_mask.npixels
+    frames = {roi_id: pd.DataFrame({'mean': means[roi_id], 'coverage': coverage[roi_id]}, index=dates)
+              for roi_id in masks}
+    if not frames:
+        return pd.DataFrame(columns=['mean', 'coverage'])
+    df = pd.concat(frames.values(), keys=frames.keys())
+    df.index.names = ['roi_id', 'date']
+    return df
+
+# EOF
@@ -0,0 +1,499 @@
+import sys
+import json
+import time
+import random
+import threading
+from uuid import uuid4
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import click
+
+import vds_api_client as vac
+from vds_api_client.metrics import endpoint_template
+from vds_api_client.faults import Fault, FaultScenario, resilience_report
+
+DEFAULT_PRODUCTS = ['SM-XN_V001_100', 'SM-LN_V001_100', 'TEMP-AMSR2-DESC_V001_100', 'VOD-XN_V001_100']
+_CHUNK = 64 * 2 ** 10
+
+
+class _Job(object):
+    def __init__(self, uri, files, submitted, stuck=None):
+        self.uri = uri
+        self.files = files
+        self.submitted = submitted
+        self.stuck = stuck  # (percentage, until) of a stuck job, until is None for ever
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeVdsApi/1.0'
+
+    def do_GET(self):
+        self.server.fake.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.fake.handle(self, 'POST')
+
+    def do_PUT(self):
+        self.server.fake.handle(self, 'PUT')
+
+    def do_DELETE(self):
+        self.server.fake.handle(self, 'DELETE')
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    block_on_close = False  # Pooled client connections stay open
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # Clients giving up on slow or truncated responses
+            super().handle_error(request, client_address)
+
+
+class FakeApiServer(object):
+    """
+    Local stand-in for the VanderSat API, e.g. for offline end-to-end tests and benchmarks
+
+    Implements the users/me, products, rois, status, api-requests, gridded-data, point-value,
+    point-time-series, roi-time-series and roi-time-series-sync endpoints, the status
+    of submitted jobs and the download of their files. Any username/password or token
+    is accepted. Jobs are processed in the background for `processing_time` seconds,
+    after which their files can be downloaded: one file of `file_size` bytes per day
+    for gridded-data and one csv file per time-series request.
+
+    The server runs in a background thread and registers itself as environment
+    `name`, see `Requester.add_environment`. Errors, delays, slow and truncated
+    responses and stuck jobs can be injected with a `FaultScenario`, see
+    `resilience_report` for the goodput, retry amplification and recovery time.
+
+    Parameters
+    ----------
+    processing_time: float
+        Seconds a submitted job takes to finish
+    file_size: int
+        Bytes of each gridded-data file
+    latency: float
+        Seconds added to every response
+    error_rate: float
+        Fraction of the job requests (submit, status, download and roi-time-series-sync) answered with a 503 error
+    products: list of str, optional
+        Api names of the available products, DEFAULT_PRODUCTS if not given
+    n_rois: int
+        Number of rois of the fake user
+    seed: int
+        Seed of the random errors
+    faults: FaultScenario or str, optional
+        Faults to inject, or the path of a scenario file, see `FaultScenario.from_file`
+    host: str
+    port: int
+        Port to listen on, a free port if 0
+    name: str
+        Name of the environment
+
+    Attributes
+    ----------
+    requests: dict
+        (method, endpoint template, status) -> number of requests received
+    bytes_sent: int
+        Bytes of the response bodies
+    records: list of tuple
+        (time, method, uri, status, bytes, fault kind or None) of every response
+    """
+    def __init__(self, processing_time=0., file_size=2 ** 20, latency=0., error_rate=0., products=None,
+                 n_rois=3, seed=0, faults=None, host='127.0.0.1', port=0, name='fake'):
+        if not 0 <= error_rate < 1:
+            raise ValueError('error_rate should be between 0 and 1')
+        self.processing_time = processing_time
+        self.file_size = file_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.products = list(DEFAULT_PRODUCTS if products is None else products)
+        self.rois = [{'id': 1000 + i, 'name': f'roi_{i}', 'description': 'Fake roi', 'area': 1e6 * (1 + i),
+                      'created_at': '2020-01-01T00:00:00.000000', 'display': True, 'labels': [],
+                      'geojson': {'type': 'Polygon', 'coordinates': [[[4 + i, 52], [4.1 + i, 52], [4.1 + i, 52.1],
+                                                                      [4 + i, 52.1], [4 + i, 52]]]}}
+                     for i in range(n_rois)]
+        self.name = name
+        self.faults = FaultScenario.from_file(faults) if isinstance(faults, str) else faults
+        self.jobs = {}
+        self.requests = {}
+        self.bytes_sent = 0
+        self.records = []
+        self._started = None
+        self._random = random.Random(seed)
+        self._block = bytes(random.Random(seed).getrandbits(8) for _ in range(_CHUNK))
+        self._lock = threading.Lock()
+        self._address = (host, port)
+        self._httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Start serving in a background thread and register the environment
+        """
+        self._httpd = _Server(self._address, _Handler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        self._started = time.time()
+        if self.faults is not None:
+            self.faults.start()
+        vac.ENVIRONMENTS[self.name] = self.base_url
+
+    def stop(self):
+        """
+        Stop the server and remove the environment, switching back to 'maps' if it was selected
+        """
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+        vac.ENVIRONMENTS.pop(self.name, None)
+        if vac.ENVIRONMENT == self.name:
+            vac.ENVIRONMENT = 'maps'
+
+    def summary(self):
+        """
+        Number of requests per method, endpoint and status
+
+        Returns
+        -------
+        dict
+        """
+        with self._lock:
+            return dict(self.requests)
+
+    def resilience(self):
+        """
+        Goodput, retry amplification and time to recovery of the requests so far, see `resilience_report`
+
+        Returns
+        -------
+        dict
+        """
+        with self._lock:
+            records = list(self.records)
+        return resilience_report(records, elapsed=time.time() - self._started)
+
+    # Request handling
+
+    def handle(self, handler, method):
+        path, _, query = handler.path.partition('?')
+        path = path.rstrip('/')
+        params = dict(parse_qsl(query))
+        handler.fault = None
+        if handler.headers.get('Content-Length'):
+            handler.rfile.read(int(handler.headers['Content-Length']))
+        if self.latency:
+            time.sleep(self.latency)
+        if 'Authorization' not in handler.headers:
+            return self._json(handler, method, 401, {'message': 'Not authorized'})
+        route = self._route(method, path)
+        if route is None:
+            return self._json(handler, method, 404, {'message': f'Not found: {path}'})
+        route, args, endpoint = route
+        if endpoint is not None and self.faults is not None:
+            handler.fault = self.faults.pick(endpoint)
+        elif endpoint is not None and self.error_rate and self._fail():
+            handler.fault = _ERROR
+        fault = handler.fault
+        if fault is not None and fault.kind == 'error':
+            headers = {} if fault.retry_after is None else {'Retry-After': str(fault.retry_after)}
+            return self._json(handler, method, fault.status, {'message': 'Injected error'}, headers)
+        if fault is not None and fault.kind == 'delay':
+            time.sleep(fault.seconds or 0)
+        route(handler, method, params, *args)
+
+    def _route(self, method, path):
+        parts = path.split('/')[3:]  # Without /api/v2
+        if method != 'GET':
+            if parts[:1] == ['rois']:
+                return self._roi_change, parts[1:], None
+            return None
+        if parts == ['users', 'me']:
+            return self._user, (), None
+        if parts == ['products']:
+            return self._products, (), None
+        if parts == ['rois']:
+            return self._rois, (), None
+        if len(parts) == 2 and parts[0] == 'rois':
+            return self._roi, (parts[1],), None
+        if parts == ['status']:
+            return self._status, (), None
+        if parts == ['api-requests']:
+            return self._api_requests, (), None
+        if (len(parts) == 3 and parts[0] == 'products'
+                and parts[2] in ('gridded-data', 'point-time-series', 'roi-time-series')):
+            return self._submit, (parts[1], parts[2]), 'submit'
+        if len(parts) == 3 and parts[0] == 'products' and parts[2] == 'roi-time-series-sync':
+            return self._roi_time_series_sync, (parts[1],), 'sync'
+        if len(parts) == 3 and parts[0] == 'products' and parts[2] == 'point-value':
+            return self._point_value, (parts[1],), 'sync'
+        if len(parts) == 3 and parts[0] == 'api-requests' and parts[2] == 'status':
+            return self._job_status, (parts[1],), 'status'
+        if len(parts) == 5 and parts[0] == 'api-requests' and parts[2] == 'data' and parts[4] == 'download':
+            return self._download, (parts[1], unquote(parts[3])), 'download'
+        return None
+
+    def _fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _count(self, handler, method, status, nbytes, fault=None):
+        key = (method, endpoint_template(handler.path.partition('?')[0]), status)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent += nbytes
+            self.records.append((time.time(), method, handler.path, status, nbytes, fault))
+
+    def _send(self, handler, method, status, headers, chunks, size):
+        """
+        Send a response, slowed down or truncated if a fault of that kind was picked
+
+        Parameters
+        ----------
+        handler: BaseHTTPRequestHandler
+        method: str
+        status: int
+        headers: dict
+        chunks: iterable of bytes
+            Body of the response
+        size: int
+            Length of the body
+        """
+        fault = getattr(handler, 'fault', None)
+        kind = None if fault is None else fault.kind
+        limit = int(size * fault.fraction) if kind == 'truncate' else size
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(size))
+        handler.end_headers()
+        sent = 0
+        for chunk in chunks:
+            chunk = chunk[:limit - sent]
+            if kind == 'slow':
+                step = max(fault.bytes_per_second // 10, 1)
+                for offset in range(0, len(chunk), step):
+                    time.sleep(len(chunk[offset:offset + step]) / fault.bytes_per_second)
+                    handler.wfile.write(chunk[offset:offset + step])
+            else:
+                handler.wfile.write(chunk)
+            sent += len(chunk)
+            if sent >= limit:
+                break
+        if kind == 'truncate':
+            handler.close_connection = True
+        self._count(handler, method, status, sent, kind)
+
+    def _json(self, handler, method, status, content, headers=None):
+        body = json.dumps(content).encode()
+        self._send(handler, method, status, dict(headers or {}, **{'Content-Type': 'application/json'}),
+                   [body], len(body))
+
+    def _user(self, handler, method, params):
+        self._json(handler, method, 200, {
+            'id': 1, 'name': 'Fake User', 'email': 'fake.user@example.com', 'roles': ['user'],
+            'login_count': 1, 'last_login_at': '2020-01-01T00:00:00',
+            'geojson_area_allowed': {'type': 'Polygon',
+                                     'coordinates': [[[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]]]}})
+
+    def _products(self, handler, method, params):
+        self._json(handler, method, 200, {'products': [
+            {'api_name': product, 'name': product, 'abbreviation': product.split('_')[0], 'unit': 'm3/m3',
+             'time_series_type': 'continuous', 'min_val': 0, 'max_val': 1} for product in self.products]})
+
+    def _rois(self, handler, method, params):
+        self._json(handler, method, 200, {'rois': [{key: value for key, value in roi.items() if key != 'geojson'}
+                                                   for roi in self.rois]})
+
+    def _find_roi(self, roi_id):
+        return next((roi for roi in self.rois if str(roi['id']) == roi_id), None)
+
+    def _roi(self, handler, method, params, roi_id):
+        roi = self._find_roi(roi_id)
+        if roi is None:
+            return self._json(handler, method, 404, {'message': f'Roi {roi_id} not found'})
+        self._json(handler, method, 200, roi)
+
+    def _roi_change(self, handler, method, params, roi_id=None):
+        if roi_id == 'show-hide-all':
+            return self._json(handler, method, 200, {'rois': [{'id': roi['id'], 'display': roi['display']}
+                                                              for roi in self.rois]})
+        roi = self._find_roi(roi_id)
+        if roi is None:
+            return self._json(handler, method, 404, {'message': f'Roi {roi_id} not found'})
+        if method == 'DELETE':
+            self.rois.remove(roi)
+        self._json(handler, method, 200, {'message': 'OK'})
+
+    def _status(self, handler, method, params):
+        self._json(handler, method, 200, {'backend_version': 'fake', 'status': 'OK'})
+
+    def _api_requests(self, handler, method, params):
+        with self._lock:
+            jobs = list(self.jobs.items())
+        self._json(handler, method, 200, {'requests': [dict(self._job_status_dict(uuid, job), uri=job.uri)
+                                                       for uuid, job in jobs]})
+
+    def _submit(self, handler, method, params, product, endpoint):
+        if product not in self.products:
+            return self._json(handler, method, 404, {'message': f'Product {product} not found'})
+        uuid = str(uuid4())
+        try:
+            files = self._files(product, endpoint, params, uuid)
+        except (KeyError, ValueError) as e:
+            return self._json(handler, method, 400, {'message': f'Invalid request: {e}'})
+        stuck = None
+        if handler.fault is not None and handler.fault.kind == 'stuck':
+            seconds = handler.fault.seconds
+            stuck = (handler.fault.percentage, None if seconds is None else time.time() + seconds)
+        with self._lock:
+            self.jobs[uuid] = _Job(handler.path, files, time.time(), stuck)
+        self._json(handler, method, 200, {'uuid': uuid})
+
+    def _roi_time_series_sync(self, handler, method, params, product):
+        try:
+            start = datetime.strptime(params['start_time'][:10], '%Y-%m-%d')
+            end = datetime.strptime(params['end_time'][:10], '%Y-%m-%d')
+            roi_id = int(params['roi_id'])
+        except (KeyError, ValueError) as e:
+            return self._json(handler, method, 400, {'message': f'Invalid request: {e}'})
+        columns = ['value', 'average', 'climatology']
+        if params.get('provide_coverage') == 'true':
+            columns.append('coverage')
+        body = (f'# product: {product}\n# roi_id: {roi_id}\n'.encode()
+                + _time_series_csv(start, end, columns, int(params.get('avg_window_days', 0))))
+        self._send(handler, method, 200, {'Content-Type': 'text/csv'}, [body], len(body))
+
+    def _point_value(self, handler, method, params, product):
+        try:
+            lat, lon = float(params['lat']), float(params['lon'])
+            date = datetime.strptime(params['date'][:10], '%Y-%m-%d')
+        except (KeyError, ValueError) as e:
+            return self._json(handler, method, 400, {'message': f'Invalid request: {e}'})
+        # Distinct for each location and date, so values which end up at the wrong point are noticed
+        self._json(handler, method, 200, {'value': round(lat * 1000 + lon + date.toordinal() % 1000 / 1000, 6)})
+
+    def _files(self, product, endpoint, params, uuid):
+        """
+        name -> (size, start date, end date) of the files of a job
+
+        Point time-series are named like those of the API, with the location
+        as `<lon>_<lat>` with 6 decimals and the first 5 characters of the uuid.
+        """
+        if endpoint == 'gridded-data':
+            start = datetime.strptime(params['start_date'], '%Y-%m-%d')
+            end = datetime.strptime(params['end_date'], '%Y-%m-%d')
+            ext = 'nc' if params.get('format') == 'netcdf4' else 'tif'
+            bounds = '_'.join(f'{float(params[key]):.6f}' for key in ('lon_min', 'lat_min', 'lon_max', 'lat_max'))
+            return {f'{product}_{start + timedelta(i):%Y-%m-%dT%H%M%S}_{bounds}.{ext}': (self.file_size, None, None)
+                    for i in range((end - start).days + 1)}
+        start = datetime.strptime(params['start_time'][:10], '%Y-%m-%d')
+        end = datetime.strptime(params['end_time'][:10], '%Y-%m-%d')
+        if endpoint == 'point-time-series':
+            fn = (f'ts_{product}_{start:%Y-%m-%dT%H%M%S}_{end:%Y-%m-%dT%H%M%S}_'
+                  f'{float(params["lon"]):.6f}_{float(params["lat"]):.6f}_{uuid[:5]}.csv')
+        else:
+            fn = f'{product}_{start:%Y-%m-%d}_{end:%Y-%m-%d}_roi_{int(params["roi_id"])}.csv'
+        return {fn: (None, start, end)}
+
+    def _job_status_dict(self, uuid, job):
+        now = time.time()
+        elapsed = now - job.submitted
+        done = elapsed >= self.processing_time
+        if job.stuck is not None and (job.stuck[1] is None or now < job.stuck[1]):
+            done = False
+            percentage = job.stuck[0]
+        else:
+            percentage = 100 if done else int(100 * elapsed / self.processing_time)
+        return {'uuid': uuid,
+                'percentage': percentage,
+                'processing_status': 'Ready' if done else 'Processing',
+                'data': [f'/api/v2/api-requests/{uuid}/data/{fn}' for fn in job.files] if done else None}
+
+    def _job_status(self, handler, method, params, uuid):
+        job = self.jobs.get(uuid)
+        if job is None:
+            return self._json(handler, method, 404, {'message': f'Request {uuid} not found'})
+        self._json(handler, method, 200, self._job_status_dict(uuid, job))
+
+    def _download(self, handler, method, params, uuid, fn):
+        job = self.jobs.get(uuid)
+        if job is None or fn not in job.files or self._job_status_dict(uuid, job)['data'] is None:
+            return self._json(handler, method, 404, {'message': f'File {fn} not found'})
+        size, start, end = job.files[fn]
+        if size is None:
+            chunks = [_time_series_csv(start, end)]
+            size = len(chunks[0])
+        else:
+            chunks = (self._block[:min(_CHUNK, size - offset)] for offset in range(0, size, _CHUNK))
+        self._send(handler, method, 200, {'Content-Type': 'application/octet-stream',
+                                          'Content-Disposition': f'attachment; filename={fn}'}, chunks, size)
+
+
+# Fault of the random errors of `error_rate`
+_ERROR = Fault('error', status=503)
+
+
+def _time_series_csv(start, end, columns=('value',), avg_window_days=None):
+    # Values depend on the date only, the average is the backward mean over avg_window_days
+    # of the requested dates, so like the API it is incomplete for the first days of a request
+    values = [round(0.2 + 0.1 * (((start + timedelta(i)).toordinal() % 30) / 30), 4)
+              for i in range((end - start).days + 1)]
+    window = avg_window_days or 1
+    lines = [','.join(['datetime'] + list(columns))]
+    for i, value in enumerate(values):
+        average = sum(values[max(i - window + 1, 0):i + 1]) / len(values[max(i - window + 1, 0):i + 1])
+        row = [f'{average:.6f}' if column == 'average' else f'{value:.4f}' for column in columns]
+        lines.append(','.join([f'{start + timedelta(i):%Y-%m-%d}'] + row))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@click.command(short_help='Run a local fake VanderSat API')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8080, show_default=True)
+@click.option('--processing-time', default=0., show_default=True, help='Seconds a submitted job takes to finish')
+@click.option('--file-size', default=2 ** 20, show_default=True, help='Bytes of each gridded-data file')
+@click.option('--latency', default=0., show_default=True, help='Seconds added to every response')
+@click.option('--error-rate', default=0., show_default=True,
+              help='Fraction of the job requests answered with a 503 error')
+@click.option('--faults', type=click.Path(exists=True, dir_okay=False),
+              help='Scenario file (.toml, .yaml or .json) of the faults to inject, the resilience is reported on exit')
+def main(host, port, processing_time, file_size, latency, error_rate, faults):
+    server = FakeApiServer(processing_time=processing_time, file_size=file_size, latency=latency,
+                           error_rate=error_rate, faults=faults, host=host, port=port)
+    server.start()
+    click.echo(f'Fake VanderSat API listening on {server.base_url}, press Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        if server.faults is not None:
+            for name, value in server.resilience().items():
+                click.echo(f'{name:>24s}: {value}')
+
+
+if __name__ == '__main__':
+    main()
+
+# EOF
@@ -0,0 +1,244 @@
+import os
+import json
+import random
+import threading
+from time import perf_counter
+
+try:
+    import tomllib as toml
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as toml
+    except ImportError:
+        toml = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+KINDS = ('error', 'delay', 'slow', 'truncate', 'stuck')
+ENDPOINTS = ('any', 'submit', 'status', 'download', 'sync')
+
+
+class Fault(object):
+    """
+    Fault injected in the responses of the fake API, see `FaultScenario`
+
+    Parameters
+    ----------
+    kind: str
+        One of
+        - 'error': respond with `status` instead, e.g. 429 or 503
+        - 'delay': respond `seconds` later
+        - 'slow': send the body at `bytes_per_second` (slow-loris downloads)
+        - 'truncate': close the connection after `fraction` of the body
+        - 'stuck': the job stays at `percentage` for `seconds` (forever if not given), for submits
+    endpoint: str
+        Requests the fault applies to, one of {'any', 'submit', 'status', 'download', 'sync'}
+    rate: float
+        Probability that a matching request gets the fault
+    start: float
+    end: float, optional
+        Seconds since the start of the scenario between which the fault is active, e.g. for bursts
+    count: int, optional
+        Maximum number of injections
+    status: int
+        Status code of 'error' faults
+    retry_after: float, optional
+        Retry-After header of 'error' faults
+    seconds: float, optional
+        Delay of 'delay' faults, duration of 'stuck' faults
+    bytes_per_second: int
+        Speed of 'slow' faults
+    fraction: float
+        Part of the body which is sent by 'truncate' faults
+    percentage: int
+        Progress of 'stuck' jobs
+    """
+    def __init__(self, kind, endpoint='any', rate=1., start=0., end=None, count=None, status=503, retry_after=None,
+                 seconds=None, bytes_per_second=2 ** 14, fraction=0.5, percentage=99):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown fault `{kind}`, choose from {list(KINDS)}')
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f'Unknown endpoint `{endpoint}`, choose from {list(ENDPOINTS)}')
+        if kind == 'stuck' and endpoint not in ('any', 'submit'):
+            raise ValueError("Stuck jobs are injected on submit, use endpoint 'submit'")
+        self.kind = kind
+        self.endpoint = 'submit' if kind == 'stuck' else endpoint
+        self.rate = rate
+        self.start = start
+        self.end = end
+        self.count = count
+        self.status = status
+        self.retry_after = retry_after
+        self.seconds = seconds
+        self.bytes_per_second = bytes_per_second
+        self.fraction = fraction
+        self.percentage = percentage
+        self.injected = 0
+
+    def __repr__(self):
+        return f'Fault({self.kind}, endpoint={self.endpoint}, rate={self.rate}, injected={self.injected})'
+
+    def matches(self, endpoint, elapsed):
+        return (self.endpoint in ('any', endpoint) and elapsed >= self.start
+                and (self.end is None or elapsed < self.end)
+                and (self.count is None or self.injected < self.count))
+
+
+class FaultScenario(object):
+    """
+    Seedable set of faults for `FakeApiServer`, for resilience and throughput tests
+
+    For every request the faults are checked in order and the first matching fault
+    which is drawn (with probability `rate`) is injected. With the same seed and
+    request order the same faults are injected.
+
+    Parameters
+    ----------
+    faults: list of Fault or dict
+        Faults or keyword arguments of `Fault`
+    seed: int
+    """
+    def __init__(self, faults, seed=0):
+        self.faults = [fault if isinstance(fault, Fault) else Fault(**fault) for fault in faults]
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._t0 = None
+
+    def __repr__(self):
+        return f'FaultScenario({self.faults}, seed={self.seed})'
+
+    @classmethod
+    def from_dict(cls, scenario):
+        """
+        Create a scenario from a (parsed) dictionary with `faults` and an optional `seed`
+        """
+        return cls(scenario.get('faults', []), seed=scenario.get('seed', 0))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Read a scenario from a .toml, .yaml/.yml or .json file, e.g.
+
+        .. code-block:: toml
+
+            seed = 42
+
+            [[faults]]
+            kind = "error"
+            endpoint = "download"
+            status = 503
+            rate = 0.1
+
+        Parameters
+        ----------
+        path: str
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.toml':
+            if toml is None:
+                raise ImportError('Reading TOML scenarios requires Python >= 3.11 or the `tomli` package')
+            with open(path, 'rb') as f:
+                return cls.from_dict(toml.load(f))
+        elif ext in ['.yaml', '.yml']:
+            if yaml is None:
+                raise ImportError('Reading YAML scenarios requires the `pyyaml` package')
+            with open(path, 'r') as f:
+                return cls.from_dict(yaml.safe_load(f))
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def start(self):
+        """
+        Start the clock of the fault windows and reset the random generator and counts
+        """
+        with self._lock:
+            self._t0 = perf_counter()
+            self._random = random.Random(self.seed)
+            for fault in self.faults:
+                fault.injected = 0
+
+    def pick(self, endpoint):
+        """
+        Fault to inject in a request, None for a normal response
+
+        Parameters
+        ----------
+        endpoint: str
+            One of {'submit', 'status', 'download', 'sync'}
+
+        Returns
+        -------
+        Fault or None
+        """
+        with self._lock:
+            if self._t0 is None:
+                self._t0 = perf_counter()
+            elapsed = perf_counter() - self._t0
+            for fault in self.faults:
+                if fault.matches(endpoint, elapsed) and self._random.random() < fault.rate:
+                    fault.injected += 1
+                    return fault
+        return None
+
+
+def resilience_report(records, elapsed=None):
+    """
+    Goodput, retry amplification and time to recovery of the requests received by a fake API
+
+    Parameters
+    ----------
+    records: list of tuple
+        (time, method, uri, status, bytes, fault kind or None) of every response, see `FakeApiServer.records`
+    elapsed: float, optional
+        Seconds of the run, from the first to the last response if not given
+
+    Returns
+    -------
+    dict
+        requests, unique_requests, retries (repeats of a request after it failed), retry_amplification
+        (requests per request which is not a retry, so status polls do not count), faults (per kind),
+        good_bytes, goodput (good bytes per second), efficiency (good / all bytes),
+        recovered and unrecovered requests which got a fault, mean and max time_to_recovery (seconds
+        from the first fault of a request until it succeeded)
+    """
+    records = sorted(records, key=lambda record: record[0])
+    if elapsed is None:
+        elapsed = records[-1][0] - records[0][0] if len(records) > 1 else 0.
+    faults = {}
+    first_fault = {}
+    recovery = {}
+    failing = set()
+    retries = 0
+    good_bytes = all_bytes = 0
+    for t, method, uri, status, nbytes, fault in records:
+        key = (method, uri)
+        all_bytes += nbytes
+        failed = fault in ('error', 'truncate') or status >= 400
+        if fault is not None:
+            faults[fault] = faults.get(fault, 0) + 1
+        if key in failing:
+            retries += 1
+        if failed:
+            failing.add(key)
+            first_fault.setdefault(key, t)
+        else:
+            failing.discard(key)
+            good_bytes += nbytes
+            if key in first_fault and key not in recovery:
+                recovery[key] = t - first_fault[key]
+    unique = len({(method, uri) for _, method, uri, *_ in records})
+    times = list(recovery.values())
+    return {'requests': len(records), 'unique_requests': unique, 'retries': retries,
+            'retry_amplification': len(records) / (len(records) - retries) if records else float('nan'),
+            'faults': faults, 'good_bytes': good_bytes,
+            'goodput': good_bytes / elapsed if elapsed else float('nan'),
+            'efficiency': good_bytes / all_bytes if all_bytes else float('nan'),
+            'recovered': len(times), 'unrecovered': len(set(first_fault).difference(recovery)),
+            'time_to_recovery_mean': sum(times) / len(times) if times else float('nan'),
+            'time_to_recovery_max': max(times) if times else float('nan')}
+
+# EOF
@@ -0,0 +1,90 @@
+import re
+
+import numpy as np
+
+
+def pixel_size(product):
+    """
+    Get the pixel size in degrees of a product from its api_name
+
+    The trailing number of an api_name is the grid resolution in meters
+    (e.g. `TEST-PRODUCT_V001_25000`), which maps onto a regular lat/lon
+    grid of resolution / 100 km degrees (25000 -> 0.25, 100 -> 0.001)
+
+    Parameters
+    ----------
+    product: str or vds_api_client.types.Product
+        Product api_name or Product object
+
+    Returns
+    -------
+    float
+        pixel size in degrees
+    """
+    api_name = getattr(product, 'api_name', product)
+    match = re.search(r'_(\d+)$', str(api_name))
+    if match is None:
+        raise ValueError(f'Cannot derive the grid resolution of product `{api_name}`')
+    return int(match.group(1)) / 1e5
+
+
+def snap_to_grid(lats, lons, pixel_size):
+    """
+    Snap coordinates to the center of the grid cell they fall in
+
+    Parameters
+    ----------
+    lats: array_like
+        latitude values
+    lons: array_like
+        longitude values
+    pixel_size: float
+        pixel size of the grid in degrees
+
+    Returns
+    -------
+    tuple of np.ndarray
+        latitudes and longitudes of the cell centers
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    cell_lats = np.round((np.floor(lats / pixel_size) + 0.5) * pixel_size, 8)
+    cell_lons = np.round((np.floor(lons / pixel_size) + 0.5) * pixel_size, 8)
+    return cell_lats, cell_lons
+
+
+def unique_pixels(lats, lons, pixel_size):
+    """
+    Deduplicate coordinates that fall in the same grid cell
+
+    Parameters
+    ----------
+    lats: array_like
+        latitude values
+    lons: array_like
+        longitude values
+    pixel_size: float
+        pixel size of the grid in degrees
+
+    Returns
+    -------
+    cell_lats: np.ndarray
+        latitudes of the unique cell centers, in order of first appearance
+    cell_lons: np.ndarray
+        longitudes of the unique cell centers, in order of first appearance
+    inverse: np.ndarray
+        index into the unique cells for each input coordinate
+    """
+    cell_lats, cell_lons = snap_to_grid(lats, lons, pixel_size)
+    if cell_lats.size == 0:
+        return cell_lats, cell_lons, np.zeros(0, dtype=int)
+    _, first, inverse = np.unique(np.stack([cell_lats, cell_lons], axis=1), axis=0,
+                                  return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    # np.unique sorts the cells, restore the order of first appearance
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return cell_lats[first[order]], cell_lons[first[order]], rank[inverse]
+
+# EOF
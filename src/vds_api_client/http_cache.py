@@ -0,0 +1,197 @@
+import io
+import re
+import time
+import json
+import base64
+import threading
+from hashlib import blake2b
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from vds_api_client.cache import LRUCache, DiskCache, TieredCache, MISSING
+
+# (path regex, seconds) of the GET endpoints which are cached, the first match is used
+DEFAULT_TTL_RULES = [
+    (r'/api/v2/products/?$', 3600),
+    (r'/api/v2/products/[^/]+/point-value$', 86400),
+    (r'/api/v2/rois/?$', 300),
+    (r'/api/v2/rois/\d+$', 3600),
+    (r'/api/v2/users/me$', 3600),
+    (r'/api/v2/status/?$', 60),
+    (r'/api/v2/api-requests/?$', 60),
+]
+_STORED_HEADERS = ['Content-Type', 'Content-Disposition', 'ETag', 'Last-Modified', 'Cache-Control']
+
+
+def cache_control(headers):
+    """
+    Parse the Cache-Control header of a response
+
+    Returns
+    -------
+    dict
+        directive -> value (True for directives without value)
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') if value else True
+    return directives
+
+
+def request_key(method, uri, auth=None, headers=None):
+    """
+    Key of a request including the identity it is made with
+
+    The authenticated user, token and impersonation headers are part of the key,
+    so responses are never shared between identities.
+
+    Parameters
+    ----------
+    method: str
+    uri: str
+    auth: tuple, optional
+        (username, password), only the username is used
+    headers: dict, optional
+        Request headers, e.g. Authorization, X-VDS-UserId and X-Fields
+
+    Returns
+    -------
+    str
+    """
+    user = auth[0] if auth else None
+    content = json.dumps([method.upper(), uri, user, sorted((headers or {}).items())], default=str)
+    return blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def _entry_size(entry):
+    return len(entry['content']) + 256
+
+
+class HttpCache(object):
+    """
+    Opt-in cache of GET responses for `Requester`, see `Requester.http_cache`
+
+    Only endpoints matching one of the TTL rules are cached. The Cache-Control
+    header of a response takes precedence over the rules: `no-store` responses
+    are not cached and `max-age` replaces the rule TTL. Expired responses with
+    an ETag or Last-Modified header are revalidated with a conditional request.
+
+    Parameters
+    ----------
+    path: str, optional
+        sqlite file to also keep responses on disk, in memory only if not given
+    maxbytes: int
+        Maximum size of the responses kept in memory
+    rules: list of tuple, optional
+        (path regex, seconds) pairs, DEFAULT_TTL_RULES if not given
+    """
+    def __init__(self, path=None, maxbytes=64 * 2 ** 20, rules=None):
+        self.memory = LRUCache(maxsize=100_000, maxbytes=maxbytes, sizeof=_entry_size)
+        self.cache = self.memory if path is None else TieredCache(self.memory, DiskCache(path))
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in (DEFAULT_TTL_RULES if rules is None else rules)]
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f'HttpCache(hits={self.hits}, misses={self.misses}, revalidated={self.revalidated})'
+
+    def __repr__(self):
+        return str(self)
+
+    def ttl(self, uri):
+        """
+        Seconds a response of this uri may be cached, None if it should not be cached
+        """
+        path = urlsplit(uri).path
+        for pattern, ttl in self.rules:
+            if pattern.search(path):
+                return ttl
+        return None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, uri, auth, headers, send):
+        """
+        Return a cached response or send the request and cache its response
+
+        Parameters
+        ----------
+        uri: str
+        auth: tuple or None
+        headers: dict
+            Headers of the request
+        send: callable
+            send(headers) -> requests.Response, performs the request
+
+        Returns
+        -------
+        requests.Response
+            cached responses have `from_cache = True`
+        """
+        ttl = self.ttl(uri)
+        if ttl is None:
+            return send(headers)
+        key = request_key('GET', uri, auth, headers)
+        entry = self.cache.get(key)
+        validators = {}
+        if entry is not MISSING:
+            if entry['expires'] > time.time():
+                self._count('hits')
+                return self._response(entry, uri)
+            if entry['headers'].get('ETag'):
+                validators['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                validators['If-Modified-Since'] = entry['headers']['Last-Modified']
+        r = send(dict(headers, **validators))
+        if r.status_code == 304 and entry is not MISSING:
+            self._count('revalidated')
+            entry['expires'] = time.time() + self._ttl(r.headers, ttl)
+            self.cache.set(key, entry)
+            return self._response(entry, uri)
+        self._count('misses')
+        if r.status_code == 200 and 'no-store' not in cache_control(r.headers):
+            self.cache.set(key, {'content': base64.b64encode(r.content).decode('ascii'),
+                                 'headers': {name: r.headers[name] for name in _STORED_HEADERS if name in r.headers},
+                                 'expires': time.time() + self._ttl(r.headers, ttl)})
+        elif entry is not MISSING:
+            self.cache.delete(key)
+        return r
+
+    @staticmethod
+    def _ttl(headers, ttl):
+        directives = cache_control(headers)
+        if 'no-cache' in directives:
+            return 0
+        try:
+            return int(directives['max-age'])
+        except (KeyError, ValueError):
+            return ttl
+
+    @staticmethod
+    def _response(entry, uri):
+        r = requests.Response()
+        r.status_code = 200
+        r.url = uri
+        r._content = base64.b64decode(entry['content'])
+        r._content_consumed = True  # iter_content serves the cached content
+        r.raw = io.BytesIO(r._content)
+        r.headers = CaseInsensitiveDict(entry['headers'])
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.from_cache = True
+        return r
+
+    def clear(self):
+        """
+        Remove all cached responses, e.g. after changing data on the server
+        """
+        self.cache.clear()
+
+# EOF
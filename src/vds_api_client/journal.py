@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+from statistics import median
+from urllib.parse import urlsplit
+
+
+def endpoint_of(uri):
+    """
+    Last path element of an api uri, e.g. `gridded-data` or `point-time-series`
+    """
+    return urlsplit(uri).path.rstrip('/').split('/')[-1]
+
+
+class JobJournal(object):
+    """
+    Append-only journal of submitted, processed and downloaded jobs
+
+    Every event is one json line in `path`, which makes the journal safe to
+    read while another process is appending to it. The journal is used to
+    estimate the duration of new jobs from the historical throughput.
+
+    Parameters
+    ----------
+    path: str or None
+        Location of the journal file, e.g. vds_api_journal.jsonl. No events are written if None
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.path is not None
+
+    def record(self, event, **kwargs):
+        """
+        Append an event to the journal
+
+        Parameters
+        ----------
+        event: str
+            One of {'submitted', 'ready', 'downloaded'}
+        kwargs:
+            Json serializable fields stored with the event
+        """
+        if self.path is None:
+            return
+        line = json.dumps(dict(event=event, time=time.time(), **kwargs))
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def events(self, event=None):
+        """
+        Iterate over the events in the journal
+
+        Parameters
+        ----------
+        event: str, optional
+            Only yield events of this type
+
+        Yields
+        ------
+        dict
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # Partially written line
+                    continue
+                if event is None or record.get('event') == event:
+                    yield record
+
+    def processing_times(self):
+        """
+        Seconds between submission and ready-for-download for each finished job
+
+        Returns
+        -------
+        dict
+            endpoint -> list of processing times in seconds
+        """
+        submitted = {}
+        times = {}
+        for record in self.events():
+            if record['event'] == 'submitted':
+                submitted[record['uuid']] = record
+            elif record['event'] == 'ready' and record['uuid'] in submitted:
+                sub = submitted.pop(record['uuid'])
+                times.setdefault(endpoint_of(sub['uri']), []).append(record['time'] - sub['time'])
+        return times
+
+    def throughput(self):
+        """
+        Historical throughput of the jobs in the journal
+
+        Returns
+        -------
+        dict
+            `processing_s`: endpoint -> median processing time in seconds
+            `download_bps`: download speed in bytes per second or None
+        """
+        processing = {endpoint: median(values) for endpoint, values in self.processing_times().items()}
+        nbytes = 0
+        seconds = 0.0
+        for record in self.events('downloaded'):
+            nbytes += record.get('bytes', 0)
+            seconds += record.get('seconds', 0.0)
+        return dict(processing_s=processing,
+                    download_bps=nbytes / seconds if seconds > 0 and nbytes > 0 else None)
+
+# EOF
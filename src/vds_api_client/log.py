@@ -0,0 +1,280 @@
+import os
+import queue
+import atexit
+import logging
+import contextlib
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = 'vds_api'
+DEFAULT_LOG_FILE = 'vds_api.log'
+FORMAT = '%(asctime)s - %(name)s - %(levelname)8s - %(funcName)s @ thr %(thread)05d  - %(message)s'
+DATEFMT = '%Y-%m-%d %H:%M:%S'
+# Pass as `extra` to log a record which is also shown in summary-only mode
+SUMMARY = {'summary': True}
+
+_PIPELINE = None
+
+
+class SummaryFilter(logging.Filter):
+    """
+    Only pass warnings, errors and records logged with `extra={'summary': True}`
+    """
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or getattr(record, 'summary', False)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Put records on the queue as they are, the message is formatted by the writer thread
+    """
+    def prepare(self, record):
+        return record
+
+
+class LogPipeline(object):
+    """
+    Log records of all threads and worker processes through queues to one writer thread
+
+    Records of the threads of this process are put on an in-memory queue
+    without formatting them. Worker processes put their (formatted) records
+    on a multiprocessing queue, see `process_queue`. The writer thread
+    formats the records and writes them to the terminal and the log file.
+
+    Parameters
+    ----------
+    log_file: str or None
+        Path of the log file, no file is written if None or empty
+    file_level: int
+        Level of the messages written to the log file
+    stream_level: int
+        Level of the messages written to the terminal
+    summary_only: bool
+        Only log warnings, errors and summaries, e.g. for runs with many files
+    """
+    def __init__(self, log_file=DEFAULT_LOG_FILE, file_level=logging.DEBUG, stream_level=logging.INFO,
+                 summary_only=False):
+        formatter = logging.Formatter(FORMAT, datefmt=DATEFMT)
+        self.log_file = log_file or None
+        self.summary_only = summary_only
+        self.stream_handler = logging.StreamHandler()
+        self.stream_handler.setLevel(stream_level)
+        self.file_handler = None
+        if self.log_file:
+            self.file_handler = logging.FileHandler(self.log_file, delay=True)
+            self.file_handler.setLevel(file_level)
+        self.handlers = [h for h in (self.file_handler, self.stream_handler) if h is not None]
+        for handler in self.handlers:
+            handler.setFormatter(formatter)
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = _LazyQueueHandler(self.queue)
+        if summary_only:  # Drop records before they are queued, the writers also filter those of workers
+            for handler in [self.queue_handler] + self.handlers:
+                handler.addFilter(SummaryFilter())
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+        self._manager = None
+        self._process_queue = None
+        self._process_listener = None
+
+    @property
+    def level(self):
+        """
+        Lowest level which is written anywhere, the level of the logger
+        """
+        return min(handler.level for handler in self.handlers)
+
+    @property
+    def worker_level(self):
+        """
+        Level of the records which worker processes send, see `worker_logger`
+
+        WARNING in summary-only mode, so workers do not send records which would be dropped
+        """
+        return max(self.level, logging.WARNING) if self.summary_only else self.level
+
+    @property
+    def stream_level(self):
+        return self.stream_handler.level
+
+    @stream_level.setter
+    def stream_level(self, level):
+        self.stream_handler.setLevel(level)
+        logging.getLogger(LOGGER_NAME).setLevel(self.level)
+
+    @property
+    def file_level(self):
+        return None if self.file_handler is None else self.file_handler.level
+
+    @file_level.setter
+    def file_level(self, level):
+        if self.file_handler is not None:
+            self.file_handler.setLevel(level)
+            logging.getLogger(LOGGER_NAME).setLevel(self.level)
+
+    def process_queue(self):
+        """
+        Queue for the records of worker processes, see `worker_logger`
+
+        The queue and a second writer thread are started on first use.
+
+        Returns
+        -------
+        multiprocessing.managers.BaseProxy
+            picklable queue proxy, to pass as argument to worker functions
+        """
+        if self._process_queue is None:
+            self._manager = multiprocessing.Manager()
+            self._process_queue = self._manager.Queue()
+            self._process_listener = QueueListener(self._process_queue, *self.handlers, respect_handler_level=True)
+            self._process_listener.start()
+        return self._process_queue
+
+    def stop(self):
+        """
+        Write the remaining records and close the log file
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self.listener.stop()
+        if self._process_listener is not None:
+            self._process_listener.stop()
+            self._manager.shutdown()
+            self._process_listener = self._process_queue = self._manager = None
+        if self.file_handler is not None:
+            self.file_handler.close()
+
+
+def pipeline():
+    """
+    Configured LogPipeline of this process, None if `configure_logging` was not called
+    """
+    return _PIPELINE
+
+
+def configure_logging(log_file=None, file_level=logging.DEBUG, stream_level=logging.INFO, summary_only=False):
+    """
+    (Re)configure the logger of the client
+
+    Parameters
+    ----------
+    log_file: str or None
+        Path of the log file, `$VDS_API_LOG_FILE` or vds_api.log in the working directory if None.
+        Use '' to not write a log file
+    file_level: int
+        Level of the messages written to the log file
+    stream_level: int
+        Level of the messages written to the terminal
+    summary_only: bool
+        Only log warnings, errors and summaries
+
+    Returns
+    -------
+    logging.Logger
+    """
+    if log_file is None:
+        log_file = os.environ.get('VDS_API_LOG_FILE', DEFAULT_LOG_FILE)
+    if _PIPELINE is not None:
+        _PIPELINE.stop()
+    else:
+        atexit.register(_stop)
+    return _install(LogPipeline(log_file, file_level=file_level, stream_level=stream_level,
+                                summary_only=summary_only))
+
+
+@contextlib.contextmanager
+def temporary_logging(log_file=None, file_level=logging.DEBUG, stream_level=logging.INFO, summary_only=False):
+    """
+    Configure the logger of the client within the context only, e.g. for benchmarks
+
+    The previous configuration, if any, is restored on exit, also when
+    `configure_logging` was called within the context.
+
+    Parameters
+    ----------
+    log_file: str or None
+        Path of the log file, see `configure_logging`
+    file_level: int
+        Level of the messages written to the log file
+    stream_level: int
+        Level of the messages written to the terminal
+    summary_only: bool
+        Only log warnings, errors and summaries
+
+    Yields
+    ------
+    logging.Logger
+    """
+    if log_file is None:
+        log_file = os.environ.get('VDS_API_LOG_FILE', DEFAULT_LOG_FILE)
+    logger = logging.getLogger(LOGGER_NAME)
+    previous, level, propagate = _PIPELINE, logger.level, logger.propagate
+    pipeline = LogPipeline(log_file, file_level=file_level, stream_level=stream_level, summary_only=summary_only)
+    try:
+        yield _install(pipeline)
+    finally:
+        if _PIPELINE is not None and _PIPELINE is not previous:  # Also one configured within the context
+            _PIPELINE.stop()
+        pipeline.stop()
+        _install(previous)
+        logger.setLevel(level)
+        logger.propagate = propagate
+
+
+def _install(pipeline):
+    """
+    Send the records of the client logger to a pipeline instead of the current one, none if None
+    """
+    global _PIPELINE
+    logger = logging.getLogger(LOGGER_NAME)
+    if _PIPELINE is not None:
+        logger.removeHandler(_PIPELINE.queue_handler)
+    _PIPELINE = pipeline
+    if pipeline is not None:
+        logger.addHandler(pipeline.queue_handler)
+        logger.setLevel(pipeline.level)
+        logger.propagate = False
+    return logger
+
+
+def _stop():
+    if _PIPELINE is not None:
+        _PIPELINE.stop()
+
+
+def worker_logger(log_queue=None, level=logging.INFO):
+    """
+    Logger for functions which may run in worker processes
+
+    Parameters
+    ----------
+    log_queue: multiprocessing queue, optional
+        See `LogPipeline.process_queue`, only used in processes without a configured pipeline
+    level: int
+        Level of the records which are sent
+
+    Returns
+    -------
+    logging.Logger
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if _PIPELINE is not None and _PIPELINE.pid == os.getpid():
+        return logger
+    if log_queue is None:
+        return configure_logging(stream_level=level)
+    for handler in list(logger.handlers):
+        if type(handler) is not QueueHandler:  # Inherited from a forked parent process
+            logger.removeHandler(handler)
+    handler = next(iter(logger.handlers), None)
+    if handler is None:
+        handler = QueueHandler(log_queue)
+        logger.addHandler(handler)
+        logger.propagate = False
+    handler.queue = log_queue
+    logger.setLevel(level)
+    return logger
+
+# EOF
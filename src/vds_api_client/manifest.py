@@ -0,0 +1,215 @@
+import os
+import inspect
+import datetime as dt
+
+from vds_api_client.vds_api_base import parse_config_file
+from vds_api_client.api_v2 import VdsApiV2
+
+try:
+    import tomllib as toml
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as toml
+    except ImportError:
+        toml = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+JOB_METHODS = {'grid': 'gen_gridded_data_request',
+               'ts': 'gen_time_series_requests'}
+
+
+class Job(object):
+    """
+    Single grid or time-series job of a manifest
+
+    Parameters
+    ----------
+    kind: str
+        One of {'grid', 'ts'}
+    params: dict
+        Keyword arguments for `VdsApiV2.gen_gridded_data_request` (grid)
+        or `VdsApiV2.gen_time_series_requests` (ts)
+    outfold: str, optional
+        Folder to download the files of this job to
+    name: str, optional
+        Name shown in the logs
+    """
+    def __init__(self, kind, params, outfold=None, name=None):
+        if kind not in JOB_METHODS:
+            raise ValueError(f'Unknown job type `{kind}`, choose from {list(JOB_METHODS)}')
+        allowed = set(inspect.signature(getattr(VdsApiV2, JOB_METHODS[kind])).parameters)
+        allowed -= {'self', 'gen_uri', 'config_file'}
+        unknown = set(params).difference(allowed)
+        if unknown:
+            raise ValueError(f'Unknown parameter(s) {sorted(unknown)} for {kind} job, choose from {sorted(allowed)}')
+        self.kind = kind
+        self.params = {key: value.strftime('%Y-%m-%d') if isinstance(value, dt.date) else value
+                       for key, value in params.items()}
+        self.outfold = outfold
+        self.name = name if name is not None else kind
+
+    def __str__(self):
+        return f'{self.name} ({self.kind}): {self.params}'
+
+    def __repr__(self):
+        return str(self)
+
+    def generate(self, vds):
+        """
+        Generate the uris of this job on a VdsApiV2 instance
+
+        Parameters
+        ----------
+        vds: VdsApiV2
+        """
+        getattr(vds, JOB_METHODS[self.kind])(gen_uri=True, **self.params)
+
+
+class Manifest(object):
+    """
+    Collection of grid and time-series jobs, parsed once from a manifest file
+
+    A manifest is a TOML or YAML file with a list of `jobs`. All other top level
+    keys are defaults for every job. Each job has a `type` {'grid', 'ts'}, an
+    optional `name` and `outfold` and the parameters of the corresponding
+    `gen_*_request(s)` method. e.g.
+
+    .. code-block:: toml
+
+        outfold = "data"
+        products = ["SM-XN_V001_100"]
+
+        [[jobs]]
+        type = "grid"
+        start_date = 2020-01-01
+        end_date = 2020-01-31
+        lat_min = 50
+        lat_max = 54
+        lon_min = 3
+        lon_max = 8
+
+        [[jobs]]
+        type = "ts"
+        start_time = 2015-01-01
+        end_time = 2020-01-01
+        rois = [3249]
+
+    Flat `key = value` configuration files describe a single job.
+
+    Parameters
+    ----------
+    jobs: list of Job
+    """
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __iter__(self):
+        return self.jobs.__iter__()
+
+    def __str__(self):
+        return '\n'.join(f'{i}\t{job}' for i, job in enumerate(self.jobs))
+
+    def __repr__(self):
+        return str(self)
+
+    @classmethod
+    def from_dict(cls, manifest):
+        """
+        Create a manifest from a (parsed) dictionary
+
+        Parameters
+        ----------
+        manifest: dict
+        """
+        defaults = {key: value for key, value in manifest.items() if key != 'jobs'}
+        jobs = []
+        for i, job_dict in enumerate(manifest.get('jobs', [])):
+            params = dict(defaults, **job_dict)
+            kind = params.pop('type', None)
+            outfold = params.pop('outfold', None)
+            name = params.pop('name', f'job-{i}')
+            jobs.append(Job(kind, params, outfold=outfold, name=name))
+        return cls(jobs)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Read a manifest from a .toml, .yaml/.yml or flat configuration file
+
+        Parameters
+        ----------
+        path: str
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.toml':
+            if toml is None:
+                raise ImportError('Reading TOML manifests requires Python >= 3.11 or the `tomli` package')
+            with open(path, 'rb') as f:
+                return cls.from_dict(toml.load(f))
+        elif ext in ['.yaml', '.yml']:
+            if yaml is None:
+                raise ImportError('Reading YAML manifests requires the `pyyaml` package')
+            with open(path, 'r') as f:
+                return cls.from_dict(yaml.safe_load(f))
+        params = parse_config_file(path).to_dict()
+        kind = 'grid' if 'start_date' in params else 'ts'
+        outfold = params.pop('outfold', None)
+        allowed = set(inspect.signature(getattr(VdsApiV2, JOB_METHODS[kind])).parameters)
+        params = {key: value for key, value in params.items() if key in allowed}
+        return cls([Job(kind, params, outfold=outfold, name=os.path.basename(path))])
+
+
+def run_manifest(manifest, vds=None, n_proc=4, n_jobs=1):
+    """
+    Run all jobs of a manifest within one client
+
+    The user info and catalog are loaded once and all requests share the
+    same connection pool. All jobs are submitted first, after which the
+    files of each job are downloaded to its own outfold.
+
+    Parameters
+    ----------
+    manifest: Manifest or str
+        Manifest or path to a manifest file
+    vds: VdsApiV2, optional
+        Client to use, a new one is created from the environment when not given
+    n_proc: int
+        Number of simultaneous downloads
+    n_jobs: int
+        Number of simultaneous submissions
+
+    Returns
+    -------
+    VdsApiV2
+        the client used to run the jobs
+    """
+    if not isinstance(manifest, Manifest):
+        manifest = Manifest.from_file(manifest)
+    if vds is None:
+        vds = VdsApiV2(debug=False)
+    base_outfold = vds.outfold
+    job_uuids = []
+    for job in manifest:
+        vds.logger.info(f'Submitting {job}')
+        vds.async_requests = []
+        job.generate(vds)
+        n_uuids = len(vds.uuids)
+        vds.submit_async_requests(n_jobs=n_jobs, queue_files=False)
+        job_uuids.append(vds.uuids[n_uuids:])
+    for job, uuids in zip(manifest, job_uuids):
+        vds.logger.info(f'Downloading {len(uuids)} uuids of {job.name}')
+        outfold = job.outfold or base_outfold
+        if outfold:
+            vds.outfold = outfold
+        vds._remove_after_dowload = []  # Only log and clean up the uuids of this job
+        vds.download_async_files(uuids=uuids, n_proc=n_proc)
+    return vds
+
+# EOF
@@ -0,0 +1,370 @@
+import os
+import re
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from bisect import bisect_left
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Upper bounds (seconds) of the histogram buckets, the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 120.)
+STAGES = ('connect', 'ttfb', 'transfer', 'parse')
+
+_uuid = re.compile(r'^[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}$', re.IGNORECASE)
+_local = threading.local()
+
+
+def endpoint_template(uri):
+    """
+    Endpoint of a uri with the variable path segments replaced, e.g. /api/v2/products/{product}/point-value
+
+    Parameters
+    ----------
+    uri: str
+
+    Returns
+    -------
+    str
+    """
+    segments = urlsplit(uri).path.rstrip('/').split('/')
+    template = []
+    for i, segment in enumerate(segments):
+        if i > 0 and segments[i - 1] == 'products' and segment:
+            segment = '{product}'
+        elif _uuid.match(segment):
+            segment = '{uuid}'
+        elif segment.isdigit():
+            segment = '{id}'
+        elif '.' in segment:
+            segment = '{file}'
+        template.append(segment)
+    return '/'.join(template) or '/'
+
+
+def connect_time():
+    """
+    Seconds spent opening connections in this thread since `reset_connect_time`
+    """
+    return getattr(_local, 'connect', 0.)
+
+
+def reset_connect_time():
+    _local.connect = 0.
+
+
+class _TimedConnectMixin(object):
+    def connect(self):
+        t0 = perf_counter()
+        try:
+            super().connect()
+        finally:
+            _local.connect = connect_time() + perf_counter() - t0
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter measuring the time spent on opening connections (TCP and TLS), see `connect_time`
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def timed_session():
+    """
+    requests.Session with the TimingAdapter mounted
+
+    The session is shared by all clients and threads of a process, whatever
+    credentials they use, so it does not keep cookies: cookies set for one
+    user would otherwise be sent with the requests of another.
+
+    Returns
+    -------
+    requests.Session
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    session.mount('https://', TimingAdapter())
+    session.mount('http://', TimingAdapter())
+    return session
+
+
+class Histogram(object):
+    """
+    Cumulative histogram of observed values
+
+    Parameters
+    ----------
+    buckets: tuple of float
+        Sorted upper bounds of the buckets, a +Inf bucket is added
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        (upper bound, number of values <= upper bound) of each bucket
+        """
+        total = 0
+        for le, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield le, total
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket containing the q-th quantile, NaN without observations
+        """
+        if self.count == 0:
+            return float('nan')
+        for le, total in self.cumulative():
+            if total >= q * self.count:
+                return le
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('nan')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _le(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class RequestMetrics(object):
+    """
+    Counters and timing histograms of the requests made by the client, per endpoint
+
+    For every request the connect time (opening a connection, 0 when a pooled
+    connection is reused), time to first byte (from sending the request until
+    the response headers arrived, includes the connect time and the time the
+    server needs), transfer time (reading the body), bytes and status are
+    recorded. Parse time is recorded for json responses. A request identical
+    to the previous failed request of the same thread counts as retry.
+
+    Parameters
+    ----------
+    buckets: tuple of float
+        Upper bounds (seconds) of the histogram buckets
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.requests = {}
+        self.bytes = {}
+        self.retries = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __str__(self):
+        return f'RequestMetrics(requests={sum(self.requests.values())}, bytes={sum(self.bytes.values())})'
+
+    def __repr__(self):
+        return str(self)
+
+    def _histogram(self, stage, method, endpoint):
+        key = (stage, method, endpoint)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets)
+        return self.histograms[key]
+
+    def _is_retry(self, method, uri, status):
+        retry = getattr(self._local, 'failed', None) == (method, uri)
+        self._local.failed = (method, uri) if status == 'error' or int(status) >= 400 else None
+        return int(retry)
+
+    def observe(self, method, uri, status, connect=0., ttfb=0., transfer=0., nbytes=0, retries=None):
+        """
+        Record a request
+
+        Parameters
+        ----------
+        method: str
+        uri: str
+        status: int or str
+            HTTP status code, 'error' if no response was received
+        connect: float
+        ttfb: float
+        transfer: float
+            Seconds spent in each stage
+        nbytes: int
+            Size of the response body
+        retries: int, optional
+            Number of retries this request represents, derived from the previous request of this thread if not given
+        """
+        method = method.upper()
+        endpoint = endpoint_template(uri)
+        if retries is None:
+            retries = self._is_retry(method, uri, status)
+        with self._lock:
+            key = (method, endpoint, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes[(method, endpoint)] = self.bytes.get((method, endpoint), 0) + nbytes
+            if retries:
+                self.retries[(method, endpoint)] = self.retries.get((method, endpoint), 0) + retries
+            for stage, seconds in zip(STAGES, (connect, ttfb, transfer)):
+                self._histogram(stage, method, endpoint).observe(seconds)
+
+    def observe_parse(self, method, uri, seconds):
+        """
+        Record the time spent parsing a response
+        """
+        with self._lock:
+            self._histogram('parse', method.upper(), endpoint_template(uri)).observe(seconds)
+
+    def timed(self, method, uri, request):
+        """
+        Perform a request, read its body and record it
+
+        Parameters
+        ----------
+        method: str
+        uri: str
+        request: callable
+            request() -> requests.Response, sends the request with stream=True
+
+        Returns
+        -------
+        requests.Response
+        """
+        reset_connect_time()
+        t0 = perf_counter()
+        try:
+            r = request()
+        except requests.RequestException:
+            self.observe(method, uri, 'error', connect=connect_time(), ttfb=perf_counter() - t0)
+            raise
+        t1 = perf_counter()
+        nbytes = len(r.content)
+        self.observe(method, uri, r.status_code, connect=connect_time(), ttfb=t1 - t0,
+                     transfer=perf_counter() - t1, nbytes=nbytes)
+        return r
+
+    def summary(self):
+        """
+        Overview of the requests per endpoint
+
+        Returns
+        -------
+        pd.DataFrame
+            requests, errors, retries, bytes and the mean and 95th percentile (bucket upper bound)
+            of each stage, indexed by method and endpoint
+        """
+        with self._lock:
+            endpoints = sorted(self.bytes)
+            rows = []
+            for method, endpoint in endpoints:
+                counts = {status: n for (m, e, status), n in self.requests.items() if (m, e) == (method, endpoint)}
+                row = dict(method=method, endpoint=endpoint, requests=sum(counts.values()),
+                           errors=sum(n for status, n in counts.items() if status == 'error' or int(status) >= 400),
+                           retries=self.retries.get((method, endpoint), 0), bytes=self.bytes[(method, endpoint)])
+                for stage in STAGES:
+                    histogram = self.histograms.get((stage, method, endpoint), Histogram(self.buckets))
+                    row[f'{stage}_mean'] = histogram.mean
+                    row[f'{stage}_p95'] = histogram.quantile(0.95)
+                rows.append(row)
+        columns = ['method', 'endpoint', 'requests', 'errors', 'retries', 'bytes'] + \
+                  [f'{stage}_{stat}' for stage in STAGES for stat in ('mean', 'p95')]
+        return pd.DataFrame(rows, columns=columns).set_index(['method', 'endpoint'])
+
+    def to_openmetrics(self, prefix='vds_api'):
+        """
+        The metrics in the OpenMetrics text format
+
+        Parameters
+        ----------
+        prefix: str
+            Prefix of the metric names
+
+        Returns
+        -------
+        str
+        """
+        lines = []
+        with self._lock:
+            lines += [f'# TYPE {prefix}_requests counter',
+                      f'# HELP {prefix}_requests Requests sent to the API.']
+            for (method, endpoint, status), n in sorted(self.requests.items()):
+                lines.append(f'{prefix}_requests_total{{{_labels(method=method, endpoint=endpoint, status=status)}}} {n}')
+            lines += [f'# TYPE {prefix}_response_bytes counter',
+                      f'# HELP {prefix}_response_bytes Bytes of the response bodies.']
+            for (method, endpoint), n in sorted(self.bytes.items()):
+                lines.append(f'{prefix}_response_bytes_total{{{_labels(method=method, endpoint=endpoint)}}} {n}')
+            lines += [f'# TYPE {prefix}_retries counter',
+                      f'# HELP {prefix}_retries Requests repeating a failed request.']
+            for (method, endpoint), n in sorted(self.retries.items()):
+                lines.append(f'{prefix}_retries_total{{{_labels(method=method, endpoint=endpoint)}}} {n}')
+            for stage in STAGES:
+                name = f'{prefix}_request_{stage}_seconds'
+                lines += [f'# TYPE {name} histogram', f'# UNIT {name} seconds',
+                          f'# HELP {name} Time spent in the {stage} stage of requests.']
+                for (s, method, endpoint), histogram in sorted(self.histograms.items()):
+                    if s != stage:
+                        continue
+                    labels = _labels(method=method, endpoint=endpoint)
+                    for le, total in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{_le(le)}"}} {total}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_openmetrics(self, path, prefix='vds_api'):
+        """
+        Write the metrics in the OpenMetrics text format, e.g. for the node exporter textfile collector
+
+        Parameters
+        ----------
+        path: str
+        prefix: str
+        """
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.to_openmetrics(prefix))
+        os.replace(tmp, path)
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes.clear()
+            self.retries.clear()
+            self.histograms.clear()
+
+# EOF
@@ -0,0 +1,211 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from vds_api_client.datacube import index_grids, grid_coords, read_grid
+from vds_api_client.profiling import timed_stage
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+MOSAIC_FORMATS = ['netcdf4', 'zarr']
+
+
+class GridAlignmentError(ValueError):
+    """
+    Tiles can not be placed on a single regular grid
+    """
+    pass
+
+
+class Tile(object):
+    """
+    Files of one area and their place on the mosaic grid
+
+    Parameters
+    ----------
+    paths: pd.Series
+        Files of this tile indexed by date
+    lats: np.ndarray
+        Pixel center latitudes, north to south
+    lons: np.ndarray
+        Pixel center longitudes, west to east
+    """
+    def __init__(self, paths, lats, lons):
+        self.paths = paths
+        self.lats = lats
+        self.lons = lons
+        self.row = 0
+        self.col = 0
+
+    @property
+    def shape(self):
+        return len(self.lats), len(self.lons)
+
+
+def _pixel_size(coords, tol):
+    if len(coords) < 2:
+        return None
+    steps = np.abs(np.diff(coords))
+    if np.ptp(steps) > tol * steps[0]:
+        raise GridAlignmentError('Pixel centers are not regularly spaced')
+    return steps.mean()
+
+
+def align_tiles(tiles, tol=1e-3):
+    """
+    Place tiles on a common grid, checking that they share pixel size and alignment
+
+    Parameters
+    ----------
+    tiles: list of Tile
+    tol: float
+        Allowed misalignment as a fraction of the pixel size
+
+    Returns
+    -------
+    lats: np.ndarray
+        Pixel center latitudes of the mosaic, north to south
+    lons: np.ndarray
+        Pixel center longitudes of the mosaic, west to east
+    """
+    sizes = [size for tile in tiles for size in (_pixel_size(tile.lats, tol), _pixel_size(tile.lons, tol))
+             if size is not None]
+    if not sizes:
+        raise GridAlignmentError('The pixel size can not be derived from single pixel tiles')
+    size = np.median(sizes)
+    if any(abs(s - size) > tol * size for s in sizes):
+        raise GridAlignmentError(f'Tiles have different pixel sizes: {sorted(set(np.round(sizes, 10)))}')
+    lat_max = max(tile.lats[0] for tile in tiles)
+    lon_min = min(tile.lons[0] for tile in tiles)
+    nrows = ncols = 0
+    for tile in tiles:
+        row = (lat_max - tile.lats[0]) / size
+        col = (tile.lons[0] - lon_min) / size
+        if abs(row - round(row)) > tol or abs(col - round(col)) > tol:
+            raise GridAlignmentError(f'Tile {tile.paths.iloc[0]} is shifted by a fraction of a pixel')
+        tile.row, tile.col = int(round(row)), int(round(col))
+        nrows = max(nrows, tile.row + tile.shape[0])
+        ncols = max(ncols, tile.col + tile.shape[1])
+    return lat_max - np.arange(nrows) * size, lon_min + np.arange(ncols) * size
+
+
+class _NetcdfTarget(object):
+    def __init__(self, path, name, dates, lats, lons, chunks):
+        if netCDF4 is None:
+            raise ImportError('Writing netCDF requires the `netCDF4` package (pip install vds-api-client[datacube])')
+        self._ds = netCDF4.Dataset(path, 'w')
+        self._ds.createDimension('time', len(dates))
+        self._ds.createDimension('lat', len(lats))
+        self._ds.createDimension('lon', len(lons))
+        time = self._ds.createVariable('time', 'f8', ('time',))
+        time.units = 'days since 1970-01-01'
+        time.calendar = 'proleptic_gregorian'
+        time[:] = (dates - pd.Timestamp('1970-01-01')) / pd.Timedelta(days=1)
+        self._ds.createVariable('lat', 'f8', ('lat',))[:] = lats
+        self._ds.createVariable('lon', 'f8', ('lon',))[:] = lons
+        self.var = self._ds.createVariable(name, 'f4', ('time', 'lat', 'lon'), zlib=True,
+                                           chunksizes=chunks, fill_value=np.float32(np.nan))
+        self.var.set_auto_mask(False)
+
+    def close(self):
+        self._ds.close()
+
+
+class _ZarrTarget(object):
+    def __init__(self, path, name, dates, lats, lons, chunks):
+        if zarr is None:
+            raise ImportError('Writing Zarr requires the `zarr` package')
+        group = zarr.open_group(path, mode='w')
+        time = group.create_array('time', data=np.asarray(dates.values, dtype='datetime64[ns]').astype('int64'),
+                                  dimension_names=('time',))
+        time.attrs.update(units='nanoseconds since 1970-01-01', calendar='proleptic_gregorian')
+        group.create_array('lat', data=lats, dimension_names=('lat',))
+        group.create_array('lon', data=lons, dimension_names=('lon',))
+        self.var = group.create_array(name, shape=(len(dates), len(lats), len(lons)), chunks=chunks,
+                                      dtype='float32', fill_value=np.nan, dimension_names=('time', 'lat', 'lon'))
+
+    def close(self):
+        pass
+
+
+@timed_stage('mosaic')
+def mosaic_grids(outfold, product, path=None, file_format='netcdf4', chunks=(1, 512, 512), tol=1e-3,
+                 files=None, logger=None):
+    """
+    Merge the date splits and spatial tiles of a product into one netCDF or Zarr store
+
+    Files are read one at a time and written to their place in the
+    time x lat x lon output, so memory use is bounded by a single file.
+    Tiles must share the pixel size and be aligned on the same grid,
+    overlapping pixels take the values of the later file unless these are no-data.
+
+    Parameters
+    ----------
+    outfold: str
+        Folder with downloaded files
+    product: str
+        Product api_name
+    path: str, optional
+        Output file (netcdf4) or folder (zarr), `<outfold>/<product>_mosaic.[nc/zarr]` if not given
+    file_format: str
+        One of {'netcdf4', 'zarr'}
+    chunks: tuple of int
+        Chunk size of the output along time, lat and lon
+    tol: float
+        Allowed misalignment of tiles as a fraction of the pixel size
+    files: list of str, optional
+        Only mosaic these files in `outfold`, e.g. those of one download run,
+        all files of the product in `outfold` if not given
+    logger: logging.Logger, optional
+
+    Returns
+    -------
+    str
+        path of the mosaic
+    """
+    if file_format not in MOSAIC_FORMATS:
+        raise ValueError(f'Choose one of {MOSAIC_FORMATS} for argument file_format')
+    index = index_grids(outfold, product, files=files)
+    if index.empty:
+        raise FileNotFoundError(f'No gridded files of {product} found in {outfold}')
+    if path is None:
+        path = os.path.join(outfold or '.', f'{product}_mosaic.{"nc" if file_format == "netcdf4" else "zarr"}')
+    tiles = []
+    for _, group in index.groupby(['lon_min', 'lat_max', 'lon_max', 'lat_min'], sort=False):
+        paths = group.drop_duplicates('date', keep='last').set_index('date')['path']
+        tiles.append(Tile(paths, *grid_coords(paths.iloc[0])))
+    lats, lons = align_tiles(tiles, tol=tol)
+    dates = pd.DatetimeIndex(sorted(index['date'].unique()))
+    chunks = tuple(min(c, n) for c, n in zip(chunks, (len(dates), len(lats), len(lons))))
+    if logger is not None:
+        logger.info(f'Mosaicking {len(index)} files of {product} in {len(tiles)} tile(s) and {len(dates)} dates '
+                    f'into {path}')
+    target = (_NetcdfTarget if file_format == 'netcdf4' else _ZarrTarget)(
+        path, index['product'].iloc[0], dates, lats, lons, chunks)
+    try:
+        for tile in tiles:
+            rows = slice(tile.row, tile.row + tile.shape[0])
+            cols = slice(tile.col, tile.col + tile.shape[1])
+            for date, fn in tile.paths.items():
+                values = read_grid(fn)
+                if values.shape != tile.shape:
+                    raise GridAlignmentError(f'{os.path.basename(fn)} has shape {values.shape} instead of {tile.shape}')
+                t = dates.get_loc(date)
+                if len(tiles) > 1:
+                    existing = np.asarray(target.var[t, rows, cols], dtype='float32')
+                    values = np.where(np.isnan(values), existing, values)
+                target.var[t, rows, cols] = values
+    finally:
+        target.close()
+    return path
+
+# EOF
@@ -0,0 +1,139 @@
+import json
+import functools
+from io import BytesIO
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+
+def loads(content):
+    """
+    Load json from the bytes of a response, using orjson when available
+
+    Parameters
+    ----------
+    content: bytes or str
+
+    Returns
+    -------
+    dict or list
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:  # e.g. NaN values, which orjson does not accept
+            pass
+    return json.loads(content)
+
+
+def _leading_comments(content):
+    """
+    Number of leading comment lines, or None if comments also appear after the header
+    """
+    nlines = 0
+    pos = 0
+    while pos < len(content) and content[pos] == ord('#'):
+        pos = content.find(b'\n', pos) + 1
+        if pos == 0:
+            return None
+        nlines += 1
+    if content.find(b'\n#', pos) != -1:
+        return None
+    return nlines
+
+
+def _header(content, skip_rows):
+    """
+    Column names in the header line after `skip_rows` comment lines
+    """
+    lines = content.split(b'\n', skip_rows + 1)
+    return lines[skip_rows].decode().strip().split(',') if len(lines) > skip_rows else []
+
+
+@functools.lru_cache(maxsize=None)
+def _default_unit():
+    """
+    Resolution of the dates parsed by pandas, e.g. 'ns' (pandas 2) or 'us' (pandas 3)
+    """
+    return getattr(pd.to_datetime(['2020-01-01']), 'unit', 'ns')
+
+
+def _to_datetime_index(df, date_format):
+    try:
+        df.index = pd.to_datetime(df.index, format=date_format or 'ISO8601')
+    except ValueError:  # pandas < 2.0 does not know 'ISO8601'
+        df.index = pd.to_datetime(df.index, format=date_format)
+    return df
+
+
+def read_time_series_csv(content, dtypes=None, date_format=None, engine='auto'):
+    """
+    Parse a csv time-series response into a DataFrame indexed by date
+
+    The response bytes are parsed in place with pyarrow when available,
+    otherwise with the pandas C engine. Lines starting with `#` are ignored.
+    Both engines give the same dtypes: value columns are float64 (also when
+    empty) unless given in `dtypes`, dates have the default unit of pandas.
+
+    Parameters
+    ----------
+    content: bytes
+        Body of the response
+    dtypes: dict, optional
+        column -> dtype of the value columns, inferred if not given
+    date_format: str, optional
+        strftime format of the dates in the first column, ISO 8601 if not given
+    engine: str
+        One of {'auto', 'pyarrow', 'pandas'}
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if engine not in ['auto', 'pyarrow', 'pandas']:
+        raise ValueError('Choose one of ["auto", "pyarrow", "pandas"] for argument engine')
+    skip_rows = _leading_comments(content) if engine != 'pandas' else None
+    if engine == 'pyarrow' and (pa is None or skip_rows is None):
+        raise RuntimeError('pyarrow is not installed or the csv contains comments after the header')
+    df = None
+    if pa is not None and skip_rows is not None and engine != 'pandas':
+        columns = _header(content, skip_rows)[1:]
+        convert_options = pa_csv.ConvertOptions(timestamp_parsers=[date_format] if date_format else None,
+                                                column_types={column: pa.float64() for column in columns
+                                                              if column not in (dtypes or {})})
+        try:
+            table = pa_csv.read_csv(pa.py_buffer(content),
+                                    read_options=pa_csv.ReadOptions(skip_rows=skip_rows),
+                                    convert_options=convert_options)
+        except pa.ArrowInvalid:  # Non-numeric value columns
+            if engine == 'pyarrow':
+                raise
+        else:
+            df = table.to_pandas()
+            df = df.set_index(df.columns[0])
+    if df is None:
+        try:
+            df = pd.read_csv(BytesIO(content), index_col=0, comment='#', parse_dates=True,
+                             date_format=date_format or 'ISO8601')
+        except TypeError:  # pandas < 2.0 has no date_format
+            df = pd.read_csv(BytesIO(content), index_col=0, comment='#')
+    if dtypes:
+        df = df.astype(dtypes)
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df = _to_datetime_index(df, date_format)
+    unit = _default_unit()
+    if getattr(df.index, 'unit', unit) != unit:  # e.g. seconds for dates parsed by pyarrow
+        df.index = df.index.as_unit(unit)
+    return df
+
+# EOF
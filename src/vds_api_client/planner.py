@@ -0,0 +1,161 @@
+import os
+import re
+from math import ceil
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+from vds_api_client.grid import pixel_size
+from vds_api_client.journal import endpoint_of
+
+# Rough sizes used to estimate the download volume
+BYTES_PER_PIXEL = 4  # float32 rasters
+BYTES_PER_FILE = 2048  # headers and metadata of a single file
+BYTES_PER_ROW = 48  # a single date line of a csv time-series
+BYTES_PER_COLUMN = 12  # each additional column of a csv time-series
+
+_uuid_suffix = re.compile(r'_[0-9a-f]{5}\.\w+$')
+
+
+def _query(uri):
+    return {key: values[0] for key, values in parse_qs(urlsplit(uri).query).items()}
+
+
+def _product(uri):
+    return urlsplit(uri).path.split('/products/')[1].split('/')[0]
+
+
+def _dates(start, end):
+    start = datetime.strptime(start[:10], '%Y-%m-%d')
+    end = datetime.strptime(end[:10], '%Y-%m-%d')
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def existing_outputs(outfold):
+    """
+    Names of the files in outfold without the uuid suffix appended by the api
+
+    Parameters
+    ----------
+    outfold: str
+
+    Returns
+    -------
+    set of str
+    """
+    outfold = outfold or '.'
+    if not os.path.isdir(outfold):
+        return set()
+    return {_uuid_suffix.sub('', fn) for fn in os.listdir(outfold)}
+
+
+def estimate_uri(uri):
+    """
+    Estimate the output of a single api request
+
+    Parameters
+    ----------
+    uri: str
+        gridded-data or [point/roi]-time-series uri
+
+    Returns
+    -------
+    files: int
+        number of files this request produces
+    nbytes: int
+        estimated number of bytes of these files
+    prefixes: list of str
+        expected filenames without uuid suffix, empty when the name can't be predicted
+    """
+    endpoint = endpoint_of(uri)
+    query = _query(uri)
+    product = _product(uri)
+    if endpoint == 'gridded-data':
+        dates = _dates(query['start_date'], query['end_date'])
+        lat_min, lat_max = float(query['lat_min']), float(query['lat_max'])
+        lon_min, lon_max = float(query['lon_min']), float(query['lon_max'])
+        try:
+            size = pixel_size(product)
+            npix = ceil((lat_max - lat_min) / size) * ceil((lon_max - lon_min) / size)
+        except ValueError:
+            npix = 0
+        nbytes = len(dates) * (npix * BYTES_PER_PIXEL + BYTES_PER_FILE)
+        prefixes = [f'{product}_{date:%Y-%m-%dT%H%M%S}_{lon_min:.6f}_{lat_max:.6f}_{lon_max:.6f}_{lat_min:.6f}'
+                    for date in dates]
+        if query.get('zipped') == 'true':
+            return 1, nbytes, []
+        return len(dates), nbytes, prefixes
+    else:
+        dates = _dates(query['start_time'], query['end_time'])
+        ncols = 1 + sum(query.get(key, 'false') == 'true' for key in ['climatology', 'provide_coverage'])
+        ncols += (query.get('avg_window_days', '0') != '0') + ('exp_filter_t' in query)
+        nbytes = BYTES_PER_FILE + len(dates) * (BYTES_PER_ROW + ncols * BYTES_PER_COLUMN)
+        if endpoint == 'point-time-series':
+            prefixes = [f'ts_{product}_{dates[0]:%Y-%m-%dT%H%M%S}_{dates[-1]:%Y-%m-%dT%H%M%S}_'
+                        f'{float(query["lon"]):.6f}_{float(query["lat"]):.6f}']
+        else:
+            prefixes = []
+        return 1, nbytes, prefixes
+
+
+class RequestPlan(object):
+    """
+    Dry-run summary of a set of api requests
+
+    Parameters
+    ----------
+    uris: iterable of str
+        Requests to plan
+    outfold: str
+        Folder the files would be downloaded to
+    throughput: dict, optional
+        Historical throughput, see `vds_api_client.journal.JobJournal.throughput`
+    n_jobs: int
+        Number of jobs processed simultaneously by the backend
+    """
+    def __init__(self, uris, outfold='', throughput=None, n_jobs=1):
+        existing = existing_outputs(outfold)
+        self.n_jobs = n_jobs
+        self.jobs = {}
+        self.files = 0
+        self.nbytes = 0
+        self.existing_files = 0
+        self.existing_bytes = 0
+        for uri in uris:
+            endpoint = endpoint_of(uri)
+            files, nbytes, prefixes = estimate_uri(uri)
+            self.jobs[endpoint] = self.jobs.get(endpoint, 0) + 1
+            self.files += files
+            self.nbytes += nbytes
+            n_existing = sum(prefix in existing for prefix in prefixes)
+            self.existing_files += n_existing
+            self.existing_bytes += nbytes * n_existing // max(files, 1)
+        self.duration = self._estimate_duration(throughput or {})
+
+    def _estimate_duration(self, throughput):
+        processing = throughput.get('processing_s', {})
+        download_bps = throughput.get('download_bps')
+        if not self.jobs or any(endpoint not in processing for endpoint in self.jobs) or not download_bps:
+            return None
+        seconds = sum(ceil(njobs / self.n_jobs) * processing[endpoint] for endpoint, njobs in self.jobs.items())
+        return seconds + (self.nbytes - self.existing_bytes) / download_bps
+
+    @property
+    def n_requests(self):
+        return sum(self.jobs.values())
+
+    def __str__(self):
+        duration = ('unknown (no history in job journal)' if self.duration is None
+                    else str(timedelta(seconds=round(self.duration))))
+        lines = ['==== VanderSat API request plan (dry-run) ====']
+        lines += [f'Jobs {endpoint + ":":<22s}{njobs:>8}' for endpoint, njobs in self.jobs.items()]
+        lines += [f'Jobs total:                {self.n_requests:>8}',
+                  f'Expected files:            {self.files:>8}',
+                  f'Estimated size:            {self.nbytes / 1e6:>8.1f} MB',
+                  f'Already downloaded:        {self.existing_files:>8} files',
+                  f'Expected duration:         {duration}']
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return str(self)
+
+# EOF
@@ -0,0 +1,235 @@
+import os
+import io
+import time
+import pstats
+import logging
+import cProfile
+import functools
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+_ACTIVE = None
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed code as a stage of the active Profiler, does nothing without one
+
+    Stages can be nested, the time of the inner stages is subtracted from the
+    self time of the outer stage.
+
+    Parameters
+    ----------
+    name: str
+    """
+    profiler = _ACTIVE
+    if profiler is None:
+        yield
+        return
+    stack = _local.__dict__.setdefault('stack', [])
+    frame = [name, 0.]  # name, time spent in nested stages
+    stack.append(frame)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        profiler.add_stage(name, elapsed, elapsed - frame[1])
+
+
+def timed_stage(name):
+    """
+    Decorator timing every call of a function as stage, see `stage`
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_output_dir(path):
+    """
+    Write the report of the active Profiler to this folder, e.g. the output folder of a run
+    """
+    if _ACTIVE is not None and path:
+        _ACTIVE.output_dir = path
+
+
+class Profiler(object):
+    """
+    Profile the CPU time, peak memory and stages of a run, as context manager
+
+    The CPU profile is made with cProfile, or with the pyinstrument sampling
+    profiler if installed and `cpu='auto'`. Only the thread which starts the
+    profiler is CPU profiled, time spent waiting on other threads or worker
+    processes shows up in the waiting functions. Stages are timed in all
+    threads, see `stage`. The report is written when the profiler stops.
+
+    Parameters
+    ----------
+    output_dir: str, optional
+        Folder of the report, the output folder of the run (see `set_output_dir`)
+        or the working directory if not given
+    cpu: str or None
+        One of {'auto', 'cprofile', 'pyinstrument'}, None to not profile the CPU time
+    memory: bool
+        Trace memory allocations with tracemalloc, slows down the run
+    top: int
+        Number of functions and allocation sites in the report
+    name: str
+        Prefix of the report files
+    """
+    def __init__(self, output_dir=None, cpu='auto', memory=True, top=30, name='vds_api_profile'):
+        if cpu not in ('auto', 'cprofile', 'pyinstrument', None):
+            raise ValueError("Choose one of {'auto', 'cprofile', 'pyinstrument', None} for argument cpu")
+        if cpu == 'pyinstrument' and pyinstrument is None:
+            raise ImportError('Sampling profiles require the `pyinstrument` package')
+        if cpu == 'auto':
+            cpu = 'cprofile' if pyinstrument is None else 'pyinstrument'
+        self.output_dir = output_dir
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self.name = name
+        self.stages = {}
+        self.paths = []
+        self.wall_time = None
+        self.peak_memory = None
+        self._profiler = None
+        self._snapshot = None
+        self._started = None
+        self._t0 = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        global _ACTIVE
+        if _ACTIVE is not None:
+            raise RuntimeError('Another Profiler is already running')
+        _ACTIVE = self
+        if self.memory:
+            tracemalloc.start()
+        if self.cpu == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.cpu == 'pyinstrument':
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+        self._started = datetime.now()
+        self._t0 = time.perf_counter()
+
+    def stop(self):
+        """
+        Stop profiling and write the report
+
+        Returns
+        -------
+        list of str
+            paths of the written files
+        """
+        global _ACTIVE
+        self.wall_time = time.perf_counter() - self._t0
+        if self.cpu == 'cprofile':
+            self._profiler.disable()
+        elif self.cpu == 'pyinstrument':
+            self._profiler.stop()
+        if self.memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        _ACTIVE = None
+        self.paths = self.write()
+        logging.getLogger('vds_api').info(f'Profile written to {self.paths[0]}')
+        return self.paths
+
+    def add_stage(self, name, seconds, self_seconds=None):
+        """
+        Add the time of a stage
+
+        Parameters
+        ----------
+        name: str
+        seconds: float
+            Wall time of the stage
+        self_seconds: float, optional
+            Wall time minus the time of nested stages
+        """
+        with self._lock:
+            calls, total, own = self.stages.get(name, (0, 0., 0.))
+            self.stages[name] = (calls + 1, total + seconds, own + (seconds if self_seconds is None else self_seconds))
+
+    def report(self):
+        """
+        Text report of the wall time, stages, peak memory, allocation sites and CPU profile
+
+        Returns
+        -------
+        str
+        """
+        lines = [f'VanderSat API client profile of {self._started:%Y-%m-%d %H:%M:%S}',
+                 f'Wall time: {self.wall_time:.3f} s', '', 'Stages', '------',
+                 f'{"stage":<24}{"calls":>8}{"total [s]":>12}{"self [s]":>12}{"share":>8}']
+        for name, (calls, total, own) in sorted(self.stages.items(), key=lambda item: -item[1][2]):
+            share = own / self.wall_time if self.wall_time else 0
+            lines.append(f'{name:<24}{calls:>8}{total:>12.3f}{own:>12.3f}{share:>8.1%}')
+        if self.memory:
+            lines += ['', 'Memory', '------', f'Peak traced memory: {self.peak_memory / 2 ** 20:.1f} MiB', '']
+            stats = self._snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            for stat in stats.statistics('lineno')[:self.top]:
+                lines.append(f'{stat.size / 2 ** 10:>10.1f} KiB {stat.count:>8} blocks  {stat.traceback[0]}')
+        if self.cpu == 'cprofile':
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(self.top)
+            lines += ['', 'CPU (cProfile, cumulative)', '--------------------------', out.getvalue()]
+        elif self.cpu == 'pyinstrument':
+            lines += ['', 'CPU (pyinstrument)', '------------------', self._profiler.output_text()]
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Write the report and the raw CPU profile to the output folder
+
+        Returns
+        -------
+        list of str
+            text report followed by the cProfile stats (.prof) or pyinstrument html file
+        """
+        output_dir = self.output_dir or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, f'{self.name}_{self._started:%Y-%m-%dT%H%M%S}')
+        paths = [base + '.txt']
+        with open(paths[0], 'w') as f:
+            f.write(self.report())
+        if self.cpu == 'cprofile':
+            paths.append(base + '.prof')
+            self._profiler.dump_stats(paths[-1])
+        elif self.cpu == 'pyinstrument':
+            paths.append(base + '.html')
+            with open(paths[-1], 'w') as f:
+                f.write(self._profiler.output_html())
+        return paths
+
+# EOF
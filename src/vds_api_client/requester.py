@@ -1,10 +1,15 @@
 
 import vds_api_client as vac
-import json
+import copy
 import requests
 import warnings
+from time import perf_counter
 from typing import Optional
+from urllib.parse import urlsplit
 from builtins import object
+from vds_api_client.parsing import loads
+from vds_api_client.http_cache import request_key
+from vds_api_client.metrics import timed_session
 
 
 class Requester(object):
@@ -41,12 +46,82 @@ class Requester(object):
         """"""
         return vac.HEADERS
 
+    @property
+    def session(self):
+        """Shared requests.Session, reusing connections across all requests"""
+        if vac.TRANSPORT is not None:
+            return vac.TRANSPORT.session
+        if vac.SESSION is None:
+            vac.SESSION = timed_session()
+        return vac.SESSION
+
+    @property
+    def http_cache(self):
+        """Shared HttpCache of GET responses, None (default) to disable caching"""
+        return vac.HTTP_CACHE
+
+    @http_cache.setter
+    def http_cache(self, cache):
+        vac.HTTP_CACHE = cache
+
+    @property
+    def metrics(self):
+        """Shared RequestMetrics recording the timing of every request, None (default) to disable"""
+        return vac.METRICS
+
+    @metrics.setter
+    def metrics(self, metrics):
+        vac.METRICS = metrics
+
+    @property
+    def tracer(self):
+        """Shared Tracer recording the stages of submitted jobs, None (default) to disable"""
+        return vac.TRACER
+
+    @tracer.setter
+    def tracer(self, tracer):
+        vac.TRACER = tracer
+
+    @property
+    def transport(self):
+        """Shared Recorder or Replayer all requests are sent through, None (default) to use the network"""
+        return vac.TRANSPORT
+
+    @transport.setter
+    def transport(self, transport):
+        vac.TRANSPORT = transport
+
+    @property
+    def single_flight(self):
+        """Shared SingleFlight coalescing concurrent identical GET requests, None to disable"""
+        return vac.SINGLE_FLIGHT
+
+    @single_flight.setter
+    def single_flight(self, single_flight):
+        vac.SINGLE_FLIGHT = single_flight
+
+    @staticmethod
+    def add_environment(name, base_url):
+        """
+        Register an environment, e.g. a local test server
+
+        Parameters
+        ----------
+        name: str
+        base_url: str
+            Scheme and host (and port) of the environment, e.g. http://127.0.0.1:8080
+        """
+        vac.ENVIRONMENTS[name] = base_url.rstrip('/')
+
+    @property
+    def base_url(self):
+        """Scheme and host of the set environment, e.g. https://maps.vandersat.com"""
+        return vac.ENVIRONMENTS[vac.ENVIRONMENT]
+
     @property
     def host(self):
         """Get the host with the set environment"""
-        host_lut = {"maps": "maps.vandersat.com",
-                    "staging": "staging.maps.planetary-variables.prod.planet-labs.com"}
-        return host_lut[vac.ENVIRONMENT]
+        return urlsplit(self.base_url).netloc
 
     @host.setter
     def host(self, host):
@@ -56,14 +131,14 @@ class Requester(object):
         Parameters
         ----------
         host: str
-            One of {'maps', 'staging'}
+            One of the environments, {'maps', 'staging'} or one added with `add_environment`
         """
         warnings.warn("The `host` property setter will be deprecated soon, use the `environment` "
                       "property to set the environment {'maps', 'staging'}")
-        if host in ['maps', 'staging']:
+        if host in vac.ENVIRONMENTS:
             vac.ENVIRONMENT = host
         else:
-            self.logger.critical("Environment unknown, choose from {'maps', 'staging'}")
+            self.logger.critical(f'Environment unknown, choose from {set(vac.ENVIRONMENTS)}')
             raise ValueError(f'Unexpected server name received: {host}')
         self._load_user_info()
         self.logger.debug(f'Using server address: {self.host}')
@@ -74,10 +149,10 @@ class Requester(object):
 
     @environment.setter
     def environment(self, environment):
-        if environment in ['maps', 'staging']:
+        if environment in vac.ENVIRONMENTS:
             vac.ENVIRONMENT = environment
         else:
-            self.logger.critical("Environment unknown, choose from {'maps', 'staging'}")
+            self.logger.critical(f'Environment unknown, choose from {set(vac.ENVIRONMENTS)}')
             raise ValueError(f'Unexpected environment name received: {environment}')
         self._load_user_info()
         self.logger.debug(f'Using host: {self.host}')
@@ -108,9 +183,35 @@ class Requester(object):
         vac.HEADERS.pop('X-VDS-UserId', None)
         self._load_user_info()
 
+    @staticmethod
+    def _invalidate_cache():
+        if vac.HTTP_CACHE is not None:
+            vac.HTTP_CACHE.clear()
+
+    def _request(self, method, uri, **kwargs):
+        request = getattr(self.session, method)
+        metrics = vac.METRICS
+        if metrics is None:
+            return request(uri, **kwargs)
+        kwargs['stream'] = True
+        return metrics.timed(method, uri, lambda: request(uri, **kwargs))
+
+    @staticmethod
+    def _loads(method, r):
+        metrics = vac.METRICS
+        if metrics is None:
+            return loads(r.content)
+        t0 = perf_counter()
+        content = loads(r.content)
+        metrics.observe_parse(method, r.url, perf_counter() - t0)
+        return content
+
     def get(self, uri, **kwargs):
         """
         Submit a get request using requests with authentication set.
+        Responses of cached endpoints are served from `.http_cache` when set.
+        Concurrent identical requests (uri, user and headers) of read-only endpoints
+        share one response, see `.single_flight`.
 
         Parameters
         ----------
@@ -126,12 +227,29 @@ class Requester(object):
         """
         headers = vac.HEADERS.copy()
         headers.update(kwargs.pop('headers', {}))
-        r = requests.get(uri, verify=True, stream=True,
-                         auth=self.auth,
-                         headers=headers,
-                         **kwargs)
-        r.raise_for_status()
-        return r
+
+        def send(request_headers):
+            r = self._request('get', uri, verify=True, stream=True,
+                              auth=self.auth,
+                              headers=request_headers,
+                              **kwargs)
+            r.raise_for_status()
+            return r
+
+        def fetch():
+            if vac.HTTP_CACHE is None:
+                return send(headers)
+            return vac.HTTP_CACHE.get(uri, self.auth, headers, send)
+
+        def fetch_shared():
+            r = fetch()
+            r.content  # Read the body, so the response can be shared between threads
+            return r
+
+        single_flight = vac.SINGLE_FLIGHT
+        if single_flight is None or set(kwargs) - {'timeout'} or not single_flight.coalesces(uri):
+            return fetch()
+        return single_flight.do(request_key('GET', uri, self.auth, headers), fetch_shared, share=copy.copy)
 
     def get_content(self, uri, **kwargs):
         """
@@ -150,7 +268,7 @@ class Requester(object):
 
         """
         r = self.get(uri, **kwargs)
-        return json.loads(r.content)
+        return self._loads('get', r)
 
     def post(self, uri, payload, **kwargs):
         """
@@ -172,11 +290,12 @@ class Requester(object):
         """
         headers = vac.HEADERS.copy()
         headers.update(kwargs.pop('headers', {}))
-        r = requests.post(uri, json=payload, verify=True,
+        r = self._request('post', uri, json=payload, verify=True,
                           auth=self.auth,
                           headers=headers,
                           **kwargs)
         r.raise_for_status()
+        self._invalidate_cache()
         return r
 
     def post_content(self, uri, payload, **kwargs):
@@ -198,7 +317,7 @@ class Requester(object):
 
         """
         r = self.post(uri, payload, **kwargs)
-        return json.loads(r.content)
+        return self._loads('post', r)
 
     def put(self, uri, payload, **kwargs):
         """
@@ -220,11 +339,12 @@ class Requester(object):
         """
         headers = vac.HEADERS.copy()
         headers.update(kwargs.pop('headers', {}))
-        r = requests.put(uri, json=payload, verify=True,
-                         auth=self.auth,
-                         headers=headers,
-                         **kwargs)
+        r = self._request('put', uri, json=payload, verify=True,
+                          auth=self.auth,
+                          headers=headers,
+                          **kwargs)
         r.raise_for_status()
+        self._invalidate_cache()
         return r
 
     def put_content(self, uri, payload, **kwargs):
@@ -246,7 +366,7 @@ class Requester(object):
 
         """
         r = self.put(uri, payload, **kwargs)
-        return json.loads(r.content)
+        return self._loads('put', r)
 
     def delete(self, uri, **kwargs):
         """
@@ -266,11 +386,12 @@ class Requester(object):
         """
         headers = vac.HEADERS.copy()
         headers.update(kwargs.pop('headers', {}))
-        r = requests.delete(uri, verify=True,
-                            auth=self.auth,
-                            headers=headers,
-                            **kwargs)
+        r = self._request('delete', uri, verify=True,
+                          auth=self.auth,
+                          headers=headers,
+                          **kwargs)
         r.raise_for_status()
+        self._invalidate_cache()
         return r
 
     def delete_content(self, uri, **kwargs):
@@ -290,6 +411,6 @@ class Requester(object):
 
         """
         r = self.delete(uri, **kwargs)
-        return json.loads(r.content)
+        return self._loads('delete', r)
 
 # EOF
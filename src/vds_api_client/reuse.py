@@ -0,0 +1,92 @@
+import time
+import logging
+from urllib.parse import urlsplit, parse_qsl
+
+# Results of finished requests can be downloaded up to 7 days after processing
+MAX_AGE_DAYS = 7
+FAILED_STATUSES = {'failed', 'error', 'expired', 'cancelled'}
+# Fields of the api-requests response which may hold the uri of a request, the first match is used
+URI_FIELDS = ['uri', 'url', 'request_uri', 'request']
+
+
+def request_key(uri):
+    """
+    Host independent key of a request uri, insensitive to the order of the query parameters
+
+    Parameters
+    ----------
+    uri: str
+
+    Returns
+    -------
+    tuple
+    """
+    parts = urlsplit(uri)
+    return (parts.path.rstrip('/'),) + tuple(sorted(parse_qsl(parts.query)))
+
+
+def _prev_request_uri(request):
+    for key in URI_FIELDS:
+        value = request.get(key)
+        if isinstance(value, str) and '/products/' in value:
+            return value
+    return None
+
+
+def previous_results(prev_requests=None, journal=None, host=None, max_age_days=MAX_AGE_DAYS):
+    """
+    Map previously submitted requests to their uuids
+
+    Parameters
+    ----------
+    prev_requests: list of dict, optional
+        Requests as returned by `VdsApiV2.get_prev_requests`
+    journal: vds_api_client.journal.JobJournal, optional
+        Local job journal
+    host: str, optional
+        Only use journal entries submitted to this host
+    max_age_days: float
+        Ignore journal entries older than this, their results are no longer available
+
+    Returns
+    -------
+    dict
+        request_key -> list of uuids, most recent first
+    """
+    results = {}
+    for request in prev_requests or []:
+        uri = _prev_request_uri(request)
+        uuid = request.get('uuid', request.get('id'))
+        if uri is not None and uuid is not None:
+            results.setdefault(request_key(uri), []).append(str(uuid))
+    if prev_requests and not results:
+        logging.getLogger('vds_api').warning(
+            f'None of the {len(prev_requests)} previous requests has a uri in one of the fields {URI_FIELDS} '
+            f'(fields: {sorted(prev_requests[0])}), only the local job journal is used to reuse results')
+    if journal:
+        min_time = time.time() - max_age_days * 86400
+        for record in journal.events('submitted'):
+            if record['time'] < min_time or (host is not None and urlsplit(record['uri']).netloc != host):
+                continue
+            uuids = results.setdefault(request_key(record['uri']), [])
+            if record['uuid'] not in uuids:
+                uuids.insert(0, record['uuid'])
+    return results
+
+
+def is_reusable(status):
+    """
+    Whether a request status still has (or will have) downloadable results
+
+    Parameters
+    ----------
+    status: dict
+        Response of the `api-requests/{uuid}/status` endpoint
+    """
+    if str(status.get('processing_status', '')).lower() in FAILED_STATUSES:
+        return False
+    if status.get('percentage', 0) < 100:
+        return True
+    return status.get('data') is not None
+
+# EOF
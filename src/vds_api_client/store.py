@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from hashlib import blake2b
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def _day(date):
+    return datetime.strptime(str(date)[:10], '%Y-%m-%d')
+
+
+def series_key(product, location, **options):
+    """
+    Key of a stored time-series
+
+    Parameters
+    ----------
+    product: str
+    location: str
+        e.g. `roi_<id>` or `<lat>_<lon>`
+    options: str or int or bool
+        Request options which change the content of the series
+
+    Returns
+    -------
+    str
+    """
+    content = json.dumps([product, location, options], sort_keys=True, default=str)
+    return blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def merge_spans(spans):
+    """
+    Merge overlapping and adjacent (start, end) day spans
+
+    Parameters
+    ----------
+    spans: iterable of tuple
+        (start, end) dates, both inclusive
+
+    Returns
+    -------
+    list of tuple
+        sorted (start, end) datetimes
+    """
+    merged = []
+    for start, end in sorted((_day(start), _day(end)) for start, end in spans):
+        if merged and start <= merged[-1][1] + timedelta(1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_spans(spans, start, end):
+    """
+    Parts of [start, end] which are not covered by spans
+
+    Returns
+    -------
+    list of tuple
+        (start, end) datetimes, both inclusive
+    """
+    start, end = _day(start), _day(end)
+    gaps = []
+    for span_start, span_end in merge_spans(spans):
+        if span_end < start or span_start > end:
+            continue
+        if span_start > start:
+            gaps.append((start, span_start - timedelta(1)))
+        start = max(start, span_end + timedelta(1))
+    if start <= end:
+        gaps.append((start, end))
+    return gaps
+
+
+class TimeSeriesStore(object):
+    """
+    Local append-only store of time-series and the date spans they cover
+
+    Each fetched span of a series is written as a Parquet segment and recorded
+    in a sqlite index. Queries only need to fetch the missing spans, see
+    `missing`. Dates within `settle_days` of the moment they were fetched may
+    still change on the server, they are stored but not marked as covered so
+    they are fetched again next time. Newer segments take precedence when dates
+    overlap. `compact` merges the segments of each series into one file.
+
+    Parameters
+    ----------
+    path: str
+        Folder of the store, created if it does not exist
+    settle_days: int
+        Number of most recent days which are fetched again on every query
+    """
+    def __init__(self, path='vds_api_store', settle_days=1):
+        if pyarrow is None:
+            raise ImportError('The time-series store requires the `pyarrow` package (pip install vds-api-client[fast])')
+        self.path = path
+        self.settle_days = settle_days
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (key TEXT PRIMARY KEY, product TEXT, location TEXT, options TEXT);
+            CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, file TEXT);
+            CREATE TABLE IF NOT EXISTS spans (key TEXT, start TEXT, end TEXT);
+        """)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def register(self, product, location, **options):
+        """
+        Key of a series, added to the index if it is new
+
+        Returns
+        -------
+        str
+        """
+        key = series_key(product, location, **options)
+        with self._lock:
+            self._db.execute('INSERT OR IGNORE INTO series VALUES (?, ?, ?, ?)',
+                             (key, product, location, json.dumps(options, sort_keys=True, default=str)))
+            self._db.commit()
+        return key
+
+    def series(self):
+        """
+        All series in the store
+
+        Returns
+        -------
+        pd.DataFrame
+            product, location, options and covered spans indexed by key
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT key, product, location, options FROM series').fetchall()
+        df = pd.DataFrame(rows, columns=['key', 'product', 'location', 'options']).set_index('key')
+        df['spans'] = [[(f'{s:%Y-%m-%d}', f'{e:%Y-%m-%d}') for s, e in self.spans(key)] for key in df.index]
+        return df
+
+    def spans(self, key):
+        """
+        Merged (start, end) spans of a series which are complete in the store
+        """
+        with self._lock:
+            return merge_spans(self._db.execute('SELECT start, end FROM spans WHERE key = ?', (key,)).fetchall())
+
+    def missing(self, key, start, end):
+        """
+        (start, end) spans between start and end which should be fetched
+        """
+        return missing_spans(self.spans(key), start, end)
+
+    def append(self, key, df, start, end, fetched=None):
+        """
+        Add the fetched time-series of a span
+
+        Parameters
+        ----------
+        key: str
+            See `register`
+        df: pd.DataFrame
+            Time-series indexed by date
+        start: str or datetime
+        end: str or datetime
+            First and last day which were requested
+        fetched: float, optional
+            Unix time at which the span was fetched, now if not given
+        """
+        start, end = _day(start), _day(end)
+        settled = _day(datetime.fromtimestamp(time.time() if fetched is None else fetched)) - timedelta(self.settle_days)
+        folder = os.path.join(self.path, key)
+        os.makedirs(folder, exist_ok=True)
+        fn = os.path.join(folder, f'{start:%Y%m%d}_{end:%Y%m%d}_{uuid.uuid4().hex[:8]}.parquet')
+        df.to_parquet(fn)
+        with self._lock:
+            self._db.execute('INSERT INTO segments (key, file) VALUES (?, ?)', (key, os.path.basename(fn)))
+            if min(end, settled) >= start:
+                self._db.execute('INSERT INTO spans VALUES (?, ?, ?)',
+                                 (key, f'{start:%Y-%m-%d}', f'{min(end, settled):%Y-%m-%d}'))
+            self._db.commit()
+
+    def _segments(self, key):
+        with self._lock:
+            rows = self._db.execute('SELECT id, file FROM segments WHERE key = ? ORDER BY id', (key,)).fetchall()
+        return [(i, os.path.join(self.path, key, fn)) for i, fn in rows]
+
+    def _read_segments(self, segments):
+        if not segments:
+            return None
+        df = pd.concat([pd.read_parquet(fn) for _, fn in segments])
+        return df[~df.index.duplicated(keep='last')].sort_index()
+
+    def read(self, key, start=None, end=None):
+        """
+        Stored time-series of a series between start and end (inclusive)
+
+        Returns
+        -------
+        pd.DataFrame or None
+            None if nothing is stored for this key
+        """
+        df = self._read_segments(self._segments(key))
+        if df is None:
+            return None
+        dates = df.index.tz_localize(None) if getattr(df.index, 'tz', None) is not None else df.index
+        mask = True
+        if start is not None:
+            mask = mask & (dates >= _day(start))
+        if end is not None:
+            mask = mask & (dates < _day(end) + timedelta(1))
+        return df[mask] if mask is not True else df
+
+    def compact(self, key=None):
+        """
+        Merge the segments and spans of one or all series
+
+        Parameters
+        ----------
+        key: str, optional
+            Series to compact, all if not given
+        """
+        keys = [key] if key is not None else self.series().index
+        for key in keys:
+            with self._lock:
+                segments = self._segments(key)
+                spans = self.spans(key)
+                if len(segments) > 1:
+                    df = self._read_segments(segments)
+                    fn = os.path.join(self.path, key, f'compact_{uuid.uuid4().hex[:8]}.parquet')
+                    df.to_parquet(fn)
+                    self._db.execute('DELETE FROM segments WHERE key = ?', (key,))
+                    self._db.execute('INSERT INTO segments (key, file) VALUES (?, ?)', (key, os.path.basename(fn)))
+                self._db.execute('DELETE FROM spans WHERE key = ?', (key,))
+                self._db.executemany('INSERT INTO spans VALUES (?, ?, ?)',
+                                     [(key, f'{s:%Y-%m-%d}', f'{e:%Y-%m-%d}') for s, e in spans])
+                self._db.commit()
+                if len(segments) > 1:
+                    for _, old in segments:
+                        os.remove(old)
+
+    def rebuild(self, key=None):
+        """
+        Remove the stored data of one or all series, they are fetched again on the next query
+
+        Parameters
+        ----------
+        key: str, optional
+            Series to rebuild, all if not given
+        """
+        keys = [key] if key is not None else self.series().index
+        with self._lock:
+            for key in keys:
+                self._db.execute('DELETE FROM segments WHERE key = ?', (key,))
+                self._db.execute('DELETE FROM spans WHERE key = ?', (key,))
+                shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            self._db.commit()
+
+# EOF
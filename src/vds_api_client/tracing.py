@@ -0,0 +1,244 @@
+import json
+import time
+import secrets
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:
+    otel_trace = None
+
+
+class Span(object):
+    """
+    Timed stage of a job, see `Tracer`
+
+    Attributes
+    ----------
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str or None
+    start: float
+    end: float or None
+        Unix times in seconds
+    attributes: dict
+    error: str or None
+        Description of the error which ended the span
+    """
+    def __init__(self, name, trace_id, span_id, parent_id=None, start=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def __repr__(self):
+        return f'Span({self.name}, {self.span_id}, duration={self.duration})'
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def to_dict(self):
+        """
+        Span in the field names of the OpenTelemetry (OTLP json) span format
+        """
+        return {'traceId': self.trace_id, 'spanId': self.span_id, 'parentSpanId': self.parent_id or '',
+                'name': self.name, 'startTimeUnixNano': int(self.start * 1e9),
+                'endTimeUnixNano': None if self.end is None else int(self.end * 1e9),
+                'attributes': self.attributes,
+                'status': {'code': 'ERROR', 'message': self.error} if self.error else {'code': 'OK'}}
+
+
+class JsonFileExporter(object):
+    """
+    Append finished spans as json lines to a file
+
+    Parameters
+    ----------
+    path: str
+    """
+    def __init__(self, path='vds_api_trace.jsonl'):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class OpenTelemetryExporter(object):
+    """
+    Mirror spans to an OpenTelemetry tracer, keeping their parent-child relations and times
+
+    Parameters
+    ----------
+    tracer: opentelemetry.trace.Tracer, optional
+        Tracer of the globally configured tracer provider if not given
+    """
+    def __init__(self, tracer=None):
+        if otel_trace is None:
+            raise ImportError('OpenTelemetryExporter requires the `opentelemetry-api` package '
+                              '(pip install vds-api-client[tracing])')
+        self.tracer = tracer if tracer is not None else otel_trace.get_tracer('vds_api_client')
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        with self._lock:
+            parent = self._spans.get(span.parent_id)
+        context = otel_trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = self.tracer.start_span(span.name, context=context, start_time=int(span.start * 1e9),
+                                           attributes=_otel_attributes(span.attributes))
+        with self._lock:
+            self._spans[span.span_id] = otel_span
+
+    def on_end(self, span):
+        with self._lock:
+            otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attributes(_otel_attributes(span.attributes))
+        if span.error:
+            otel_span.set_status(Status(StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end * 1e9))
+
+
+def _otel_attributes(attributes):
+    return {name: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for name, value in attributes.items() if value is not None}
+
+
+class Tracer(object):
+    """
+    Create spans of the submit, poll and download stages of jobs and pass them to exporters
+
+    Every job (one submitted request) is a trace with a `job` span and child
+    spans `generate`, `submit`, `poll` and one `download` span per file.
+    Exporters receive spans when they start (`on_start`) and end (`on_end`).
+
+    Parameters
+    ----------
+    exporters: JsonFileExporter or OpenTelemetryExporter
+        Objects with `on_start(span)` and `on_end(span)` methods
+    keep: bool
+        Keep the finished spans in `.spans`, e.g. for `summary`
+    """
+    def __init__(self, *exporters, keep=True):
+        self.exporters = list(exporters)
+        self.keep = keep
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Tracer(exporters={self.exporters}, spans={len(self.spans)})'
+
+    def start_span(self, name, parent=None, start=None, **attributes):
+        """
+        Start a span, a new trace if no parent is given
+
+        Parameters
+        ----------
+        name: str
+        parent: Span, optional
+        start: float, optional
+            Unix time at which the span started, now if not given
+        attributes:
+            Attributes of the span
+
+        Returns
+        -------
+        Span
+        """
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        span = Span(name, trace_id, secrets.token_hex(8), parent_id=None if parent is None else parent.span_id,
+                    start=start, attributes=attributes)
+        for exporter in self.exporters:
+            exporter.on_start(span)
+        return span
+
+    def end_span(self, span, end=None, error=None):
+        """
+        End a span, later calls for the same span are ignored
+
+        Parameters
+        ----------
+        span: Span
+        end: float, optional
+            Unix time at which the span ended, now if not given
+        error: str or Exception, optional
+            Marks the span as failed
+        """
+        with self._lock:
+            if span.end is not None:
+                return
+            span.end = time.time() if end is None else end
+            if self.keep:
+                self.spans.append(span)
+        if error is not None:
+            span.error = str(error) or type(error).__name__
+        for exporter in self.exporters:
+            exporter.on_end(span)
+
+    def record_span(self, name, parent, start, end, error=None, **attributes):
+        """
+        Add a span of a stage which was timed elsewhere, e.g. in a worker process
+
+        Returns
+        -------
+        Span
+        """
+        span = self.start_span(name, parent=parent, start=start, **attributes)
+        self.end_span(span, end=end, error=error)
+        return span
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """
+        Context manager timing the enclosed code as span, failing it on exceptions
+
+        Yields
+        ------
+        Span
+        """
+        span = self.start_span(name, parent=parent, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    def summary(self):
+        """
+        Time spent per stage of the finished spans
+
+        Returns
+        -------
+        pd.DataFrame
+            count, total, mean and max seconds and errors per span name, sorted by total
+        """
+        with self._lock:
+            records = [(span.name, span.duration, span.error is not None) for span in self.spans]
+        df = pd.DataFrame(records, columns=['name', 'seconds', 'error'])
+        summary = df.groupby('name').agg(count=('seconds', 'size'), total=('seconds', 'sum'),
+                                         mean=('seconds', 'mean'), max=('seconds', 'max'),
+                                         errors=('error', 'sum'))
+        return summary.sort_values('total', ascending=False)
+
+# EOF
@@ -0,0 +1,343 @@
+import io
+import os
+import json
+import time
+import hashlib
+import zipfile
+import threading
+from time import perf_counter
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import vds_api_client as vac
+from vds_api_client.metrics import TimingAdapter, timed_session
+
+FORMAT_VERSION = 1
+# Headers which are not written to an archive
+REDACTED = ('authorization', 'cookie', 'set-cookie', 'proxy-authorization')
+
+
+class ReplayMiss(requests.exceptions.ConnectionError):
+    """
+    Request which is not in the replayed archive
+    """
+
+
+def request_path(url):
+    """
+    Path and query of a url, so recordings replay against any environment
+
+    Parameters
+    ----------
+    url: str
+
+    Returns
+    -------
+    str
+    """
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+def _digest(body):
+    return hashlib.sha1(body).hexdigest() if body else None
+
+
+def _headers(headers):
+    return {name: value for name, value in headers.items() if name.lower() not in REDACTED}
+
+
+class _Transport(object):
+    """
+    Base of the transports, mounted on the sessions of the client while active
+    """
+    def __init__(self):
+        self._session = None
+        self._previous = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def session(self):
+        """requests.Session sending all requests through this transport"""
+        if self._session is None:
+            self._session = timed_session()
+            adapter = self.adapter()
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return self._session
+
+    def adapter(self):
+        raise NotImplementedError
+
+    def start(self):
+        """
+        Send all requests of the client through this transport, see `Requester.transport`
+        """
+        self._previous = vac.TRANSPORT
+        vac.TRANSPORT = self
+
+    def stop(self):
+        vac.TRANSPORT = self._previous
+        self._previous = None
+
+
+class _RecordingAdapter(TimingAdapter):
+    def __init__(self, recorder):
+        super().__init__()
+        self.recorder = recorder
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        t0 = perf_counter()
+        r = super().send(request, **kwargs)
+        ttfb = perf_counter() - t0
+        body = r.content  # Read the body to record it, also for streamed downloads
+        self.recorder.add(request, r, body, start, ttfb, perf_counter() - t0 - ttfb)
+        return r
+
+
+class Recorder(_Transport):
+    """
+    Record the API exchanges of the client to an archive, for `Replayer`
+
+    Records the method, url, headers and body of each request and the status, headers,
+    body and timing (time to first byte and transfer time) of its response. Credentials
+    (Authorization and cookie headers) are not recorded. The archive is a zip file with
+    the exchanges as json and every distinct body stored once, compressed. Responses are
+    read completely before they are returned, so downloads are kept in memory.
+
+    Use as context manager, or `start` and `stop`:
+
+    .. code-block:: python
+
+        with Recorder('incident.zip'):
+            vds = VdsApiV2()
+            vds.gen_gridded_data_request(...)
+            vds.submit_async_requests()
+            vds.download_async_files()
+
+    Parameters
+    ----------
+    path: str
+        Archive to write when the recorder stops
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.exchanges = []
+        self.bodies = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Recorder({self.path}, {len(self.exchanges)} exchanges)'
+
+    def adapter(self):
+        return _RecordingAdapter(self)
+
+    def add(self, request, response, body, start, ttfb, transfer):
+        """
+        Record an exchange
+
+        Parameters
+        ----------
+        request: requests.PreparedRequest
+        response: requests.Response
+        body: bytes
+            Body of the response
+        start: float
+            Time the request was sent
+        ttfb: float
+            Seconds until the headers were received
+        transfer: float
+            Seconds reading the body
+        """
+        request_body = request.body.encode() if isinstance(request.body, str) else request.body
+        exchange = {'start': start, 'method': request.method, 'url': request.url,
+                    'request_headers': _headers(request.headers), 'request_body': _digest(request_body),
+                    'status': response.status_code, 'reason': response.reason,
+                    'headers': _headers(response.headers), 'body': _digest(body),
+                    'ttfb': ttfb, 'transfer': transfer}
+        with self._lock:
+            for content in (request_body, body):
+                if content:
+                    self.bodies.setdefault(_digest(content), content)
+            self.exchanges.append(exchange)
+
+    def stop(self):
+        """
+        Stop recording and write the archive
+        """
+        super().stop()
+        self.save()
+
+    def save(self, path=None):
+        """
+        Write the recorded exchanges to an archive
+
+        Parameters
+        ----------
+        path: str, optional
+            Archive, `.path` if not given
+
+        Returns
+        -------
+        str
+            path of the archive
+        """
+        path = path or self.path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            exchanges = sorted(self.exchanges, key=lambda exchange: exchange['start'])
+            bodies = dict(self.bodies)
+        index = {'version': FORMAT_VERSION, 'client': vac.__version__,
+                 'recorded_at': f'{datetime.now():%Y-%m-%dT%H:%M:%S}', 'exchanges': exchanges}
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('exchanges.json', json.dumps(index, separators=(',', ':')))
+            for digest, body in bodies.items():
+                archive.writestr(f'bodies/{digest}', body)
+        vac.LOGGER.info(f'Recorded {len(exchanges)} requests to {path}')
+        return path
+
+
+class _ReplayAdapter(BaseAdapter):
+    def __init__(self, replayer):
+        super().__init__()
+        self.replayer = replayer
+
+    def send(self, request, **kwargs):
+        exchange, body = self.replayer.match(request)
+        if self.replayer.preserve_timing:
+            time.sleep((exchange['ttfb'] + exchange['transfer']) / self.replayer.speed)
+        r = requests.Response()
+        r.status_code = exchange['status']
+        r.reason = exchange['reason']
+        r.headers = CaseInsensitiveDict(exchange['headers'])
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r._content = body
+        r._content_consumed = True
+        r.raw = io.BytesIO(body)
+        return r
+
+    def close(self):
+        pass
+
+
+class Replayer(_Transport):
+    """
+    Serve recorded API exchanges back to the client, see `Recorder`
+
+    Requests are matched on method, path and query (not the host, so any environment
+    can be replayed) and request body. Repeated identical requests, e.g. status polls,
+    get the recorded responses in the recorded order, the last one once they run out.
+    Requests which were not recorded raise `ReplayMiss`.
+
+    Parameters
+    ----------
+    path: str
+        Archive written by `Recorder`
+    preserve_timing: bool
+        Delay each response by its recorded time to first byte and transfer time
+    speed: float
+        Speed up (> 1) or slow down (< 1) the preserved timing
+    """
+    def __init__(self, path, preserve_timing=False, speed=1.):
+        super().__init__()
+        if speed <= 0:
+            raise ValueError('Speed must be positive')
+        self.path = path
+        self.preserve_timing = preserve_timing
+        self.speed = speed
+        with zipfile.ZipFile(path) as archive:
+            index = json.loads(archive.read('exchanges.json'))
+            if index.get('version') != FORMAT_VERSION:
+                raise ValueError(f'Unsupported archive version {index.get("version")} of {path}')
+            self.bodies = {name.split('/', 1)[1]: archive.read(name)
+                           for name in archive.namelist() if name.startswith('bodies/')}
+        self.exchanges = index['exchanges']
+        self.client = index.get('client')
+        self._queues = {}
+        for exchange in self.exchanges:
+            key = (exchange['method'], request_path(exchange['url']), exchange['request_body'])
+            self._queues.setdefault(key, []).append(exchange)
+        self._served = {}
+        self.misses = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Replayer({self.path}, {len(self.exchanges)} exchanges)'
+
+    def adapter(self):
+        return _ReplayAdapter(self)
+
+    def rewind(self):
+        """
+        Replay from the first recorded response again
+        """
+        with self._lock:
+            self._served = {}
+            self.misses = []
+
+    def match(self, request):
+        """
+        Recorded exchange and response body of a request
+
+        Parameters
+        ----------
+        request: requests.PreparedRequest
+
+        Returns
+        -------
+        tuple of (dict, bytes)
+        """
+        request_body = request.body.encode() if isinstance(request.body, str) else request.body
+        key = (request.method, request_path(request.url), _digest(request_body))
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                self.misses.append(key)
+                raise ReplayMiss(f'{request.method} {request.url} was not recorded in {self.path}',
+                                 request=request)
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+        exchange = queue[min(i, len(queue) - 1)]
+        return exchange, self.bodies.get(exchange['body'], b'')
+
+
+def transport_for(path, record=False, **kwargs):
+    """
+    Recorder of a new archive with `record`, else the Replayer of an existing archive or None
+
+    Parameters
+    ----------
+    path: str
+    record: bool
+    kwargs:
+        parsed to Replayer
+
+    Returns
+    -------
+    Recorder, Replayer or None
+    """
+    if record:
+        return Recorder(path)
+    if os.path.exists(path):
+        return Replayer(path, **kwargs)
+    return None
+
+# EOF
@@ -138,7 +138,7 @@ class Rois(object):
 
         """
         headers = {'X-Fields': 'rois{id, display}'}
-        uri = (f'https://{REQ.host}/api/v2/rois/show-hide-all?'
+        uri = (f'{REQ.base_url}/api/v2/rois/show-hide-all?'
                f'&ids={",".join([str(roi.id) for roi in self])}')
         rois = REQ.post_content(uri, dict(show=True), headers=headers)['rois']
         for roi in rois:
@@ -154,7 +154,7 @@ class Rois(object):
 
         """
         headers = {'X-Fields': 'rois{id, display}'}
-        uri = (f'https://{REQ.host}/api/v2/rois/show-hide-all?'
+        uri = (f'{REQ.base_url}/api/v2/rois/show-hide-all?'
                f'&ids={",".join([str(roi.id) for roi in self])}')
         rois = REQ.post_content(uri, dict(show=False), headers=headers)['rois']
         for roi in rois:
@@ -328,7 +328,7 @@ class Roi(object):
 
     @property
     def uri(self):
-        return f'https://{REQ.host}/api/v2/rois/{self.id}'
+        return f'{REQ.base_url}/api/v2/rois/{self.id}'
 
     @property
     def geojson(self):
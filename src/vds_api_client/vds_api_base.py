@@ -7,34 +7,157 @@ from joblib import delayed, Parallel
 import os
 import warnings
 import logging
+import time
+from datetime import datetime
 from typing import Optional
 
 # This project
+import vds_api_client as vac
 from vds_api_client.types import Rois, Products
 from vds_api_client.requester import Requester
+from vds_api_client.metrics import timed_session, connect_time, reset_connect_time
+from vds_api_client import log
+from vds_api_client.profiling import timed_stage, set_output_dir
 
 
 # logging
 def setup_logging(filelevel=10, streamlevel=20):
-    logger = logging.getLogger('vds_api')
-    if len(logger.handlers) == 0:
-        logger.setLevel(logging.DEBUG)
-        fh = logging.FileHandler('vds_api.log')
-        ch = logging.StreamHandler()
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)8s - %(funcName)s @ thr %(thread)05d' +
-                                      '  - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-        fh.setFormatter(formatter)
-        ch.setFormatter(formatter)
-        fh.setLevel(filelevel)
-        ch.setLevel(streamlevel)
-
-        logger.addHandler(fh)
-        logger.addHandler(ch)
-    return logger
+    """
+    Logger of the client, configured on the first call, see `vds_api_client.log.configure_logging`
+    """
+    if log.pipeline() is None:
+        return log.configure_logging(file_level=filelevel, stream_level=streamlevel)
+    return logging.getLogger(log.LOGGER_NAME)
 
 # Usefull functions
 
 
+def _parse_value(par):
+    par = par.lstrip().rstrip()
+    if len(par.split(',')) > 1:
+        return [p.lstrip().rstrip() for p in par.split(',')]
+    elif par.lower() in ['true', 'false', 'yes', 'no']:
+        return par.lower() in ['true', 'yes']
+    return par
+
+
+def _read_config_file(textfile):
+    # parameter -> value as read, see `getpar_fromtext` for the format
+    if textfile is None or not os.path.exists(textfile):
+        raise RuntimeError(f'textfile {textfile} does not exist')
+    pars = {}
+    with open(textfile, "r") as f:
+        for line in f:
+            if line.lstrip().startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=')[:2]
+            pars.setdefault(key.lstrip().rstrip().lower(), _parse_value(value))
+    return pars
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _as_date(value):
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _as_bool(value):
+    if not isinstance(value, bool):
+        raise ValueError(f'{value} is not one of true, false, yes or no')
+    return value
+
+
+class ConfigFile(object):
+    """
+    Parameters of a configuration file, parsed once into typed values
+
+    Dates are `datetime.date`, bounding box coordinates floats, `lats` and `lons` lists
+    of floats, `products` a list of api names and `rois` a list of ids (int) or names.
+    Integer options are int and flags bool, other parameters are kept as read.
+    The parameters are attributes (None if not set) and items of the config.
+
+    Parameters
+    ----------
+    path: str
+        Configuration file, see `getpar_fromtext` for the format
+    """
+    TYPES = {'start_date': _as_date, 'end_date': _as_date, 'start_time': _as_date, 'end_time': _as_date,
+             'lat_min': float, 'lat_max': float, 'lon_min': float, 'lon_max': float,
+             'lats': lambda value: [float(v) for v in _as_list(value)],
+             'lons': lambda value: [float(v) for v in _as_list(value)],
+             'products': _as_list,
+             'rois': lambda value: [int(v) if v.isdigit() else v for v in _as_list(value)],
+             'nrequests': int, 'av_win': int, 't': int,
+             'zipped': _as_bool, 'masked': _as_bool, 'clim': _as_bool, 'provide_coverage': _as_bool,
+             'snap_to_grid': _as_bool}
+
+    def __init__(self, path):
+        self.path = path
+        self.raw = _read_config_file(path)
+        self.params = {}
+        for key, value in self.raw.items():
+            try:
+                self.params[key] = self.TYPES[key](value) if key in self.TYPES else value
+            except (TypeError, ValueError) as e:
+                raise ValueError(f'Invalid value for {key} in {path}: {e}')
+
+    def __getattr__(self, key):
+        if key in self.TYPES or key in self.params:
+            return self.params.get(key)
+        raise AttributeError(f'{self.path} has no parameter {key}')
+
+    def __getitem__(self, key):
+        return self.params[key.lower()]
+
+    def __contains__(self, key):
+        return key.lower() in self.params
+
+    def __iter__(self):
+        return self.params.__iter__()
+
+    def __len__(self):
+        return len(self.params)
+
+    def __str__(self):
+        return '\n'.join(f'{key} = {value}' for key, value in self.params.items())
+
+    def __repr__(self):
+        return f'ConfigFile({self.path})'
+
+    def get(self, key, default=None):
+        return self.params.get(key.lower(), default)
+
+    def to_dict(self):
+        """
+        Typed parameters as dictionary
+        """
+        return dict(self.params)
+
+
+def parse_config_file(textfile):
+    """
+    parse_config_file(textfile):
+
+    Read all parameters from a text file which holds parameter and value pairs on each line
+    at once, see `getpar_fromtext` for the format. Parameter names are lower case and when
+    a parameter is set multiple times, the first value is used.
+
+    Parameters
+    ----------
+    textfile: str
+        path to textfile
+
+    Returns
+    -------
+    ConfigFile:
+        typed parameters, `.raw` has the values as read
+
+    """
+    return ConfigFile(textfile)
+
+
 def getpar_fromtext(textfile, parameter):
     """
     getpar_fromtext(textfile, parameter):
@@ -59,51 +182,81 @@ def getpar_fromtext(textfile, parameter):
         value of parameter
 
     """
-    if textfile is not None and os.path.exists(textfile):
-        parameter = parameter.lower()
-        found = False
-        line = ''
-        with open(textfile, "r") as f:
-            for line in f:
-                if line.lstrip().startswith('#'):
-                    continue
-                if line.split('=')[0].lstrip().rstrip().lower() == parameter:
-                    found = True
-                    break
-        if not found:
-            return None
-        par = line.split('=')[1].lstrip().rstrip()
-        if len(par.split(',')) > 1:
-            par = [p.lstrip().rstrip() for p in par.split(',')]
-        elif par.lower() in ['true', 'false', 'yes', 'no']:
-            return par.lower() in ['true', 'yes']
-    else:
-        raise RuntimeError(f'textfile {textfile} does not exist')
-    return par
+    return _read_config_file(textfile).get(parameter.lower())
+
+
+_SESSION = None
+
+
+def _session():
+    """requests.Session of this (worker) process, so downloads reuse connections"""
+    global _SESSION
+    if vac.TRANSPORT is not None:
+        return vac.TRANSPORT.session
+    if _SESSION is None:
+        _SESSION = timed_session()
+    return _SESSION
 
 
-def api_get(uri, expected_fn='', out_path='', overwrite=False, str_lvl=20, auth=None, headers=None):
-    logger = setup_logging(streamlevel=str_lvl)
+def api_get(uri, expected_fn='', out_path='', overwrite=False, log_level=20, auth=None, headers=None, timed=False,
+            log_queue=None, str_lvl=None):
+    # With timed=True the timing of the request is returned as well, for RequestMetrics.observe.
+    # Worker processes send their log records to the log_queue of the parent, see log.worker_logger
+    if str_lvl is not None:
+        warnings.warn('The `str_lvl` argument of api_get is deprecated, use `log_level`', DeprecationWarning)
+        log_level = str_lvl
+    timing = {} if timed else None
+    logger = log.worker_logger(log_queue, log_level)
+    result = _api_get(uri, expected_fn, out_path, overwrite, logger, auth, headers, timing)
+    return (result, timing or None) if timed else result
+
+
+def _api_get(uri, expected_fn, out_path, overwrite, logger, auth, headers, timing):
     if not overwrite and os.path.exists(expected_fn):
-        logger.debug(f'File {expected_fn} exists, skipping download')
+        logger.debug('File %s exists, skipping download', expected_fn)
         return -1, expected_fn
-    logger.debug(f'Starting request for file {os.path.basename(expected_fn)}')
-    r = requests.get(uri, verify=True, stream=True,
-                     auth=auth,
-                     headers=headers)
-    if r.status_code == 200:
-        ofname = os.path.join(out_path, r.headers['Content-Disposition'].split('=')[1])
-        if os.path.basename(ofname) == 'transparent.png':
-            logger.debug(f'No data available for file {expected_fn}, skipping download')
-            return -2, expected_fn
-        logger.info(f'Writing file: {ofname}')
-        with open(ofname, 'wb') as f:
-            for chunk in r.iter_content(1024):
-                f.write(chunk)
-        return ofname.encode('ascii')
-    else:
-        logger.warning(f'Request status = {r.status_code} - Error in retrieving data from url: {uri}')
-    return r, uri
+    logger.debug('Starting request for file %s', os.path.basename(expected_fn))
+    reset_connect_time()
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        r = _session().get(uri, verify=True, stream=True,
+                           auth=auth,
+                           headers=headers)
+    except requests.exceptions.RequestException as e:
+        logger.warning('Request failed (%s) for url: %s', e, uri)
+        if timing is not None:
+            timing.update(method='GET', uri=uri, status='error', connect=connect_time(),
+                          ttfb=time.perf_counter() - t0, transfer=0., nbytes=0, start=start)
+        return None, uri
+    t1 = time.perf_counter()
+    nbytes = 0
+    status = r.status_code
+    try:
+        if r.status_code == 200:
+            ofname = os.path.join(out_path, r.headers['Content-Disposition'].split('=')[1])
+            if os.path.basename(ofname) == 'transparent.png':
+                logger.debug('No data available for file %s, skipping download', expected_fn)
+                return -2, expected_fn
+            logger.info('Writing file: %s', ofname)
+            try:
+                with open(ofname, 'wb') as f:
+                    for chunk in r.iter_content(1024):
+                        nbytes += len(chunk)
+                        f.write(chunk)
+            except requests.exceptions.RequestException as e:  # Connection broken off, e.g. a truncated body
+                logger.warning('Download of %s broke off after %d bytes (%s)', ofname, nbytes, e)
+                os.remove(ofname)
+                status = 'error'
+                return None, uri
+            return ofname.encode('ascii')
+        else:
+            logger.warning('Request status = %s - Error in retrieving data from url: %s', r.status_code, uri)
+        return r, uri
+    finally:
+        if timing is not None:
+            timing.update(method='GET', uri=uri, status=status, connect=connect_time(),
+                          ttfb=t1 - t0, transfer=time.perf_counter() - t1, nbytes=nbytes, start=start)
 
 
 def mkdirs(path, filepath=None):
@@ -133,14 +286,15 @@ def mkdirs(path, filepath=None):
 
 
 def configure(config, defaults, config_file, logger):
+    file_config = {}
+    if config_file is not None and any(value is None for value in config.values()):
+        try:
+            file_config = parse_config_file(config_file).raw  # uris are generated from the values as read
+        except RuntimeError:
+            logger.warning('Configuration file was not found')
     for key, value in config.items():
         if value is None:
-            if config_file is not None:
-                try:
-                    config[key] = getpar_fromtext(config_file, key)
-                except RuntimeError:
-                    logger.warn('Configuration file was not found')
-                    pass
+            config[key] = file_config.get(key.lower())
             if config[key] is None:
                 if key in defaults:
                     logger.debug(f'Setting default for {key}: {defaults[key]}')
@@ -188,6 +342,7 @@ class VdsApiBase(Requester):
         self._ndskipped = []
         self._notreached = 0
         self._failed = []
+        self.output_hooks = []
         if (username and password) or oauth_token:
             self.set_auth((username, password), oauth_token=oauth_token)
         else:
@@ -231,8 +386,7 @@ class VdsApiBase(Requester):
             mkdirs(out_path)
         self.logger.debug(f'Outfold set to {out_path}')
         self._out_path = out_path
-        self.logger = setup_logging(self.logger.handlers[0].level,
-                                    self.logger.handlers[1].level)
+        set_output_dir(out_path)
 
     def set_outfold(self, path):
         """
@@ -254,12 +408,11 @@ class VdsApiBase(Requester):
 
     @property
     def streamlevel(self):
-        return next(filter(lambda x: type(x) is logging.StreamHandler, self.logger.handlers)).level
+        return log.pipeline().stream_level
 
     @streamlevel.setter
     def streamlevel(self, level):
-        stream_handler = next(filter(lambda x: type(x) is logging.StreamHandler, self.logger.handlers))
-        stream_handler.setLevel(level)
+        log.pipeline().stream_level = level
 
     @property
     def overwrite(self):
@@ -287,7 +440,7 @@ class VdsApiBase(Requester):
                 self.logger.info(f'CONFIG PARAMETER: {key} = {value}')
 
     def get_user_info(self):
-        usr_dict = self.get_content(f'https://{self.host}/api/v2/users/me')
+        usr_dict = self.get_content(f'{self.base_url}/api/v2/users/me')
         return usr_dict
 
     def get_products(self):
@@ -299,7 +452,7 @@ class VdsApiBase(Requester):
         products: Products
             Collection of Product objects
         """
-        product_dict = self.get_content(f'https://{self.host}/api/v2/products/')
+        product_dict = self.get_content(f'{self.base_url}/api/v2/products/')
         products = Products(product_dict['products'])
         return products
 
@@ -334,7 +487,7 @@ class VdsApiBase(Requester):
 
     def get_rois(self):
         headers = {"X-Fields": 'rois{id, name, description, created_at, area, labels, display}'}
-        roi_list = self.get_content(f'https://{self.host}/api/v2/rois', headers=headers)['rois']
+        roi_list = self.get_content(f'{self.base_url}/api/v2/rois', headers=headers)['rois']
         return Rois(None if not roi_list else roi_list)
 
     def check_valid_rois(self, rois):
@@ -384,7 +537,7 @@ class VdsApiBase(Requester):
             else:
                 rois = rois.ids_to_list()
         for roi in rois:
-            uri = f"https://{self.host}/api/v2/rois/{roi}"
+            uri = f"{self.base_url}/api/v2/rois/{roi}"
             self.delete(uri)
         self.rois = self.get_rois()
         self.logger.info('Deletion successful')
@@ -428,16 +581,44 @@ class VdsApiBase(Requester):
             op = out_path
             self.logger.warning('Out path defined both in class and api_get, using api_get output folder')
         processed = []
+        timed = self.metrics is not None or self.tracer is not None
         for uri in self._api_calls:
             processed.append(api_get(uri, self._extract_fn(uri, op), out_path=op, overwrite=self.overwrite,
-                             str_lvl=self.logger.handlers[1].level, auth=self.auth, headers=self.headers))
+                             log_level=self.logger.level, auth=self.auth, headers=self.headers, timed=timed))
+        if timed:
+            processed = self._observed(processed)
         self.review_results(processed, retry=False)
         self._api_calls = []
 
+    def _observed(self, processed):
+        """
+        Record the timing returned by timed downloads in `.metrics` and `.tracer` and yield their results
+        """
+        for result, timing in processed:
+            if timing and self.metrics is not None:
+                self.metrics.observe(timing['method'], timing['uri'], timing['status'], connect=timing['connect'],
+                                     ttfb=timing['ttfb'], transfer=timing['transfer'], nbytes=timing['nbytes'],
+                                     retries=int(timing['uri'] in self._retry))
+            if timing and self.tracer is not None:
+                self.tracer.record_span('download', self._job_span_of(timing['uri']), timing['start'],
+                                        timing['start'] + timing['ttfb'] + timing['transfer'],
+                                        error=f'HTTP {timing["status"]}' if timing['status'] != 200 else None,
+                                        uri=timing['uri'], status=timing['status'], bytes=timing['nbytes'],
+                                        file=result.decode() if isinstance(result, bytes) else None)
+            yield result
+
+    def _job_span_of(self, uri):
+        """
+        Span of the job a download belongs to, see `VdsApiV2`
+        """
+        return None
+
     def review_results(self, processed, retry=True):
         for p in processed:
             if type(p) is not tuple:
                 self._outputs.append(p)
+                for hook in self.output_hooks:
+                    hook(p.decode())
             elif p[0] == -1:
                 self._skipped.append(p[1])
             elif p[0] == -2:
@@ -454,39 +635,57 @@ class VdsApiBase(Requester):
             self.logger.info(f'Starting retries 1 by 1 ({len(self._retry)} to go)')
             for uri in self._retry:
                 i += 1
-                self.logger.debug(f'{i} / {len(self._retry)} - retry for url =\n{uri}')
+                self.logger.debug('%d / %d - retry for url =\n%s', i, len(self._retry), uri)
                 self.api_get(uri)
         if not self._failed:
             self.logger.info('All downloads successfull')
 
+    @timed_stage('download')
     def bulk_download(self, n_proc):
         n = len(self._api_calls)
         if n < n_proc:
             n_proc = max(n, 1)
             self.logger.debug(f'Fewer calls than processes used, reducing n_procs to {n_proc}')
-        processed = Parallel(n_jobs=n_proc)(delayed(api_get)(call,
-                                                             expected_fn=self._extract_fn(call),
-                                                             out_path=self._out_path,
-                                                             overwrite=self.overwrite,
-                                                             str_lvl=self.logger.handlers[1].level,
-                                                             auth=self.auth,
-                                                             headers=self.headers) for call in self._api_calls)
+        # Handle outputs as they arrive when hooks are waiting for them
+        options = {'return_as': 'generator_unordered'} if self.output_hooks else {}
+        # Recorded and replayed downloads go through the transport of this process, so use threads
+        threads = self.transport is not None
+        if threads:
+            options['backend'] = 'threading'
+        try:
+            parallel = Parallel(n_jobs=n_proc, **options)
+        except (TypeError, ValueError):  # joblib < 1.4
+            parallel = Parallel(n_jobs=n_proc, backend='threading' if threads else None)
+        timed = self.metrics is not None or self.tracer is not None
+        # Worker processes send their log records to the writer thread of this process
+        log_queue = log.pipeline().process_queue() if n_proc > 1 and not threads else None
+        processed = parallel(delayed(api_get)(call,
+                                              expected_fn=self._extract_fn(call),
+                                              out_path=self._out_path,
+                                              overwrite=self.overwrite,
+                                              log_level=log.pipeline().worker_level,
+                                              auth=self.auth,
+                                              headers=self.headers,
+                                              timed=timed,
+                                              log_queue=log_queue) for call in self._api_calls)
+        if timed:
+            processed = self._observed(processed)
         self.logger.info('Checking for error messages')
         self.review_results(processed)
         self.retry()
         self._api_calls = []
 
     def summary(self):
-        self.logger.info(f'==== VanderSat Application Programming Interface Summary ====')
-        self.logger.info(f'Succesfully downloaded:    {len(self._outputs):>4} files')
-        self.logger.info(f'Skipped (exists):          {len(self._skipped):>4} files')
-        self.logger.info(f'Skipped (no-data):         {len(self._ndskipped):>4} files')
-        self.logger.info(f'Retried:                   {len(self._retry):>4} calls')
-        self.logger.info(f'Not reached by intterrupt: {self._notreached:>4} calls')
-        self.logger.info(f'Failed:                    {len(self._failed):>4} calls')
-        self.logger.info('                       ================')
+        self.logger.info(f'==== VanderSat Application Programming Interface Summary ====', extra=log.SUMMARY)
+        self.logger.info(f'Succesfully downloaded:    {len(self._outputs):>4} files', extra=log.SUMMARY)
+        self.logger.info(f'Skipped (exists):          {len(self._skipped):>4} files', extra=log.SUMMARY)
+        self.logger.info(f'Skipped (no-data):         {len(self._ndskipped):>4} files', extra=log.SUMMARY)
+        self.logger.info(f'Retried:                   {len(self._retry):>4} calls', extra=log.SUMMARY)
+        self.logger.info(f'Not reached by intterrupt: {self._notreached:>4} calls', extra=log.SUMMARY)
+        self.logger.info(f'Failed:                    {len(self._failed):>4} calls', extra=log.SUMMARY)
+        self.logger.info('                       ================', extra=log.SUMMARY)
         self.logger.info('Total                      {:>4} calls'.format(
             len(self._outputs) + len(self._skipped) + len(self._ndskipped)
-            + len(self._retry) + self._notreached + len(self._failed)))
+            + len(self._retry) + self._notreached + len(self._failed)), extra=log.SUMMARY)
 
 # EOF
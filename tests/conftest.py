@@ -4,15 +4,33 @@ from glob import glob
 import pytest
 from click.testing import CliRunner
 import vds_api_client
+from vds_api_client.transport import transport_for
+
+RECORDINGS = os.path.join(os.path.dirname(__file__), 'recordings')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--record', action='store_true', default=False,
+                     help='Record the API traffic of tests using live credentials to tests/recordings')
 
 
 @pytest.fixture
-def credentials():
+def credentials(request):
     """
     Get the credentials stored in the environent variables `$VDS_USER` and `$VDS_PASS`
+
+    With `pytest --record` the API traffic of the test is recorded to
+    tests/recordings/<module>/<test>.zip. Tests with a recording replay it
+    and run without live credentials.
     """
     creds = {'user': os.environ.get('VDS_USER'), 'pw': os.environ.get('VDS_PASS')}
-    return creds
+    path = os.path.join(RECORDINGS, request.module.__name__.split('.')[-1], f'{request.node.name}.zip')
+    transport = transport_for(path, record=request.config.getoption('--record'))
+    if transport is None:
+        yield creds
+        return
+    with transport:
+        yield creds if request.config.getoption('--record') else {'user': 'replay', 'pw': 'replay'}
 
 
 @pytest.fixture
@@ -51,6 +69,22 @@ def clean_uuid_files():
         os.remove(filename)
 
 
+@pytest.fixture
+def offline(tmpdir, monkeypatch):
+    """
+    Fresh client state for tests against a local FakeApiServer, working in tmpdir
+
+    The headers, http cache, shared session, transport and environment are
+    restored after the test.
+    """
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(vds_api_client, 'HEADERS', {})
+    monkeypatch.setattr(vds_api_client, 'HTTP_CACHE', None)
+    monkeypatch.setattr(vds_api_client, 'SESSION', None)
+    monkeypatch.setattr(vds_api_client, 'TRANSPORT', None)
+    monkeypatch.setattr(vds_api_client, 'ENVIRONMENT', vds_api_client.ENVIRONMENT)
+
+
 @pytest.fixture(autouse=True)
 def set_environment():
     vds_api_client.ENVIRONMENT = 'maps'
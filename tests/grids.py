@@ -0,0 +1,23 @@
+"""
+Gridded files as downloaded from the API, shared by the datacube and mosaic tests
+"""
+import os
+import numpy as np
+
+PRODUCT = 'TEST-PRODUCT_V001_25000'
+
+
+def write_tif(folder, date, values, lon_min=-6., lat_max=67., size=0.25, product=PRODUCT, nodata=-999.):
+    import rasterio
+    from rasterio.transform import from_origin
+    lat_min = lat_max - values.shape[0] * size
+    lon_max = lon_min + values.shape[1] * size
+    fn = os.path.join(folder, f'{product}_{date}T000000_{lon_min:.6f}_{lat_max:.6f}_{lon_max:.6f}_{lat_min:.6f}'
+                              f'_0a1b2.tif')
+    with rasterio.open(fn, 'w', driver='GTiff', height=values.shape[0], width=values.shape[1], count=1,
+                       dtype='float32', crs='EPSG:4326', transform=from_origin(lon_min, lat_max, size, size),
+                       nodata=nodata) as dst:
+        dst.write(np.where(np.isnan(values), nodata, values).astype('float32'), 1)
+    return fn
+
+# EOF
@@ -0,0 +1,47 @@
+import os
+from vds_api_client.cache import LRUCache, DiskCache, TieredCache, MISSING
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is MISSING
+    assert cache.get('b', None) is None
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_disk_cache(tmpdir):
+    path = os.path.join(tmpdir, 'cache.sqlite')
+    cache = DiskCache(path)
+    key = ('TEST-PRODUCT_V001_25000', 66.875, -5.875, '2020-01-01T000000')
+    cache.set(key, 0.25)
+    cache.set('none', None)
+    cache.close()
+    cache = DiskCache(path)
+    assert cache.get(key) == 0.25
+    assert 'none' in cache and cache.get('none') is None
+    assert cache.get('other') is MISSING
+    assert len(cache) == 2
+    cache.close()
+
+
+def test_tiered_cache(tmpdir):
+    memory = LRUCache()
+    disk = DiskCache(os.path.join(tmpdir, 'cache.sqlite'))
+    disk.set('a', 1)
+    cache = TieredCache(memory, disk)
+    assert 'a' not in memory
+    assert cache.get('a') == 1
+    assert memory.get('a') == 1
+    cache.set('b', 2)
+    assert disk.get('b') == 2 and memory.get('b') == 2
+    assert cache.get('c') is MISSING
+    disk.close()
+
+# EOF
@@ -0,0 +1,143 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import vds_api_client as vac
+from vds_api_client.coalesce import SingleFlight
+from vds_api_client.requester import Requester
+
+HOST = 'https://maps.vandersat.com'
+
+
+class SlowSession(object):
+    """
+    Session answering GET requests after a delay, counting the requests per uri
+    """
+    def __init__(self, delay=0.2, status_code=200):
+        self.delay = delay
+        self.status_code = status_code
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, uri, headers=None, **kwargs):
+        with self._lock:
+            self.calls.append(uri)
+        time.sleep(self.delay)
+        r = requests.Response()
+        r.url = uri
+        r.status_code = self.status_code
+        r._content = f'{{"uri": "{uri}"}}'.encode()
+        return r
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = SlowSession()
+    monkeypatch.setattr(vac, 'SESSION', session)
+    monkeypatch.setattr(vac, 'HEADERS', {})
+    monkeypatch.setattr(vac, 'AUTH', ('user', 'pw'))
+    monkeypatch.setattr(vac, 'HTTP_CACHE', None)
+    monkeypatch.setattr(vac, 'SINGLE_FLIGHT', SingleFlight())
+    return session
+
+
+def test_single_flight():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [len(calls)]
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(group.do, 'key', fn)
+        started.wait(5)
+        followers = [pool.submit(group.do, 'key', fn, share=list) for _ in range(3)]
+        while group.shared < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert results == [[1]] * 4
+    assert results[0] is not results[1]
+    assert (group.calls, group.shared) == (1, 3)
+    assert group.do('key', fn) == [2]
+
+
+def test_single_flight_error():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise RuntimeError('failed')
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(group.do, 'key', fn)]
+        while not group._futures:
+            time.sleep(0.01)
+        futures.append(pool.submit(group.do, 'key', fn))
+        while group.shared < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert not group._futures
+
+
+def test_requester_coalesce(session):
+    req = Requester()
+    uris = [HOST + '/api/v2/rois/1'] * 8 + [HOST + '/api/v2/rois/2'] * 4
+    with ThreadPoolExecutor(12) as pool:
+        contents = list(pool.map(req.get_content, uris))
+    assert contents == [{'uri': uri} for uri in uris]
+    assert sorted(session.calls) == [HOST + '/api/v2/rois/1', HOST + '/api/v2/rois/2']
+    req.get(HOST + '/api/v2/rois/1')
+    assert len(session.calls) == 3
+
+
+def test_requester_identities(session):
+    req = Requester()
+    uri = HOST + '/api/v2/products/'
+    with ThreadPoolExecutor(2) as pool:
+        pool.submit(req.get, uri)
+        pool.submit(req.get, uri, headers={'X-VDS-UserId': 'other@planet.com'})
+    assert len(session.calls) == 2
+
+
+def test_requester_submissions(session):
+    req = Requester()
+    uri = (HOST + '/api/v2/products/SM-XN_V001_100/gridded-data?lat_min=1&lat_max=2&lon_min=1&lon_max=2'
+           '&start_date=2020-01-01&end_date=2020-01-02')
+    status = HOST + '/api/v2/api-requests/0f4c7a6e-3c1a-4e7b-9a4d-2b1f0e6d5c3a/status'
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(req.get, [uri, uri, status, status]))
+    assert len(session.calls) == 4
+    assert vac.SINGLE_FLIGHT.calls == 0
+
+
+def test_requester_disabled(session):
+    req = Requester()
+    req.single_flight = None
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(req.get, [HOST + '/api/v2/rois/1'] * 4))
+    assert len(session.calls) == 4
+
+
+def test_requester_error(session):
+    session.status_code = 503
+    req = Requester()
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(req.get, HOST + '/api/v2/rois/1') for _ in range(4)]
+        for future in futures:
+            with pytest.raises(requests.HTTPError):
+                future.result()
+    assert len(session.calls) == 1
+
+# EOF
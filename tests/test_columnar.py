@@ -0,0 +1,64 @@
+import os
+import glob
+import pytest
+import numpy as np
+import pandas as pd
+from vds_api_client.columnar import ts_locations, ParquetTimeSeriesWriter, read_time_series_dataset
+
+pytest.importorskip('pyarrow')
+
+BASE = 'https://maps.vandersat.com/api/v2/products/TEST-PRODUCT_V001_25000/'
+QUERY = 'start_time=2020-01-01&end_time=2020-01-03&format=csv'
+CSV = (b'# Some header\n'
+       b'date,SM-XN_V001_100,SM-XN_V001_100_avg\n'
+       b'2020-01-01,0.25,0.3\n'
+       b'2020-01-02,0.26,0.3\n'
+       b'2020-01-03,0.27,0.31\n')
+
+
+def test_ts_locations():
+    product, locations = ts_locations(BASE + 'roi-time-series?' + QUERY + '&roi_id=3249')
+    assert product == 'TEST-PRODUCT_V001_25000'
+    assert locations[0][0] == 'roi_3249' and np.isnan(locations[0][1])
+    uri = BASE + 'point-time-series?' + QUERY + '&lat=66.875&lon=-5.875'
+    assert ts_locations(uri)[1] == [('66.875000_-5.875000', 66.875, -5.875)]
+    locations = ts_locations(uri, points=[(66.8, -5.9), (66.81, -5.91)])[1]
+    assert [loc[0] for loc in locations] == ['66.800000_-5.900000', '66.810000_-5.910000']
+    with pytest.raises(ValueError):
+        ts_locations(BASE + 'gridded-data?start_date=2020-01-01')
+
+
+def test_parquet_writer(tmpdir):
+    fn = os.path.join(tmpdir, 'ts.csv')
+    with open(fn, 'wb') as f:
+        f.write(CSV)
+    path = os.path.join(tmpdir, 'dataset')
+    with ParquetTimeSeriesWriter(path, row_group_size=4) as writer:
+        writer.write_file(fn, 'SM-XN_V001_100', [('roi_1', np.nan, np.nan), ('52.000000_4.000000', 52., 4.)])
+        writer.write_file(fn, 'SM-LN_V001_100', [('roi_1', np.nan, np.nan)])
+    assert writer.rows == 9
+    assert sorted(os.listdir(path)) == ['product=SM-LN_V001_100', 'product=SM-XN_V001_100']
+    assert len(glob.glob(os.path.join(path, 'product=SM-XN_V001_100', '*.parquet'))) == 1
+
+    df = read_time_series_dataset(path)
+    assert df.index.names == ['product', 'location_id', 'date']
+    assert len(df) == 9
+    assert df.loc[('SM-XN_V001_100', '52.000000_4.000000', pd.Timestamp('2020-01-02')), 'SM-XN_V001_100'] == 0.26
+    df = read_time_series_dataset(path, products=['SM-XN_V001_100'], location_ids=['roi_1'],
+                                  columns=['SM-XN_V001_100_avg'])
+    assert len(df) == 3
+    assert list(df.columns) == ['lat', 'lon', 'SM-XN_V001_100_avg']
+
+
+def test_parquet_writer_schema_change(tmpdir):
+    df = pd.DataFrame({'value': [1., 2.]}, index=pd.date_range('2020-01-01', periods=2, name='date'))
+    path = os.path.join(tmpdir, 'dataset')
+    with ParquetTimeSeriesWriter(path) as writer:
+        writer.write(df, 'P_V001_100', 'roi_1')
+        writer.write(df.assign(coverage=[100., 50.]), 'P_V001_100', 'roi_2')
+    assert len(glob.glob(os.path.join(path, 'product=P_V001_100', '*.parquet'))) == 2
+    df_read = read_time_series_dataset(path)
+    assert len(df_read) == 4
+    assert df_read['coverage'].isna().sum() == 2
+
+# EOF
@@ -0,0 +1,64 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+from vds_api_client.datacube import index_grids, open_datacube
+from tests.grids import write_tif, PRODUCT
+
+xr = pytest.importorskip('xarray')
+pytest.importorskip('dask')
+pytest.importorskip('rasterio')
+
+
+@pytest.fixture
+def grid_folder(tmpdir):
+    for i, date in enumerate(['2020-01-01', '2020-01-02', '2020-01-03']):
+        values = np.arange(16, dtype='float32').reshape(4, 4) + 100 * i
+        values[0, 0] = np.nan
+        write_tif(tmpdir, date, values)
+    write_tif(tmpdir, '2020-01-01', np.zeros((4, 4)), product='OTHER_V001_25000')
+    with open(os.path.join(tmpdir, 'ts_TEST.csv'), 'w') as f:
+        f.write('date,value\n')
+    return str(tmpdir)
+
+
+def test_index_grids(grid_folder):
+    index = index_grids(grid_folder)
+    assert len(index) == 4
+    index = index_grids(grid_folder, PRODUCT)
+    assert list(index['date']) == list(pd.date_range('2020-01-01', periods=3))
+    assert index.loc[0, ['lon_min', 'lat_max', 'lon_max', 'lat_min']].tolist() == [-6., 67., -5., 66.]
+
+
+def test_open_datacube(grid_folder):
+    cube = open_datacube(grid_folder, PRODUCT)
+    assert cube.dims == ('time', 'lat', 'lon')
+    assert cube.shape == (3, 4, 4)
+    assert cube.chunks == ((1, 1, 1), (4,), (4,))
+    np.testing.assert_allclose(cube['lat'], [66.875, 66.625, 66.375, 66.125])
+    np.testing.assert_allclose(cube['lon'], [-5.875, -5.625, -5.375, -5.125])
+    values = cube.sel(time='2020-01-03').values
+    assert np.isnan(values[0, 0]) and values[3, 3] == 215
+    assert float(cube.sel(lat=66.125, lon=-5.125).mean()) == 115
+    with pytest.raises(FileNotFoundError):
+        open_datacube(grid_folder, 'MISSING_V001_100')
+
+
+def test_open_datacube_netcdf(tmpdir):
+    lats = np.array([66.125, 66.375])  # south to north
+    ds = xr.Dataset({'band': (('lat', 'lon'), np.array([[1., 2.], [3., 4.]]))},
+                    coords={'lat': lats, 'lon': [-5.875, -5.625]})
+    ds.to_netcdf(os.path.join(tmpdir, f'{PRODUCT}_2020-01-01T000000_-6.000000_66.500000_-5.500000_66.000000_0a1b2.nc'))
+    cube = open_datacube(str(tmpdir), PRODUCT)
+    np.testing.assert_allclose(cube['lat'], lats[::-1])
+    np.testing.assert_allclose(cube.values[0], [[3., 4.], [1., 2.]])
+
+
+def test_open_datacube_tiles(grid_folder):
+    write_tif(grid_folder, '2020-01-01', np.ones((4, 4)), lon_min=-5.)
+    with pytest.raises(ValueError):
+        open_datacube(grid_folder, PRODUCT)
+    cube = open_datacube(grid_folder, PRODUCT, bbox=(-5., 67., -4., 66.))
+    assert cube.shape == (1, 4, 4)
+
+# EOF
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vds_api_client.derive import moving_average, climatology, exp_filter, add_derived_columns
+
+
+@pytest.fixture
+def series():
+    index = pd.date_range('2020-01-01', periods=10, name='date')
+    values = np.arange(10.)
+    values[4] = np.nan
+    return pd.Series(values, index=index, name='SM')
+
+
+def _exp_filter_recursive(series, t):
+    """
+    Reference implementation of Albergel et al. (2008)
+    """
+    swi, gain, last, out = None, 1., None, []
+    for date, value in series.items():
+        if not np.isnan(value):
+            if swi is None:
+                swi = value
+            else:
+                gain = gain / (gain + np.exp(-(date - last).days / t))
+                swi = swi + gain * (value - swi)
+            last = date
+        out.append(np.nan if swi is None else swi)
+    return pd.Series(out, index=series.index)
+
+
+def test_moving_average(series):
+    center = moving_average(series, 2, 'center')
+    assert center['2020-01-01'] == 1.
+    assert center['2020-01-03'] == 1.5
+    assert center['2020-01-06'] == pytest.approx((3 + 5 + 6 + 7) / 4)
+    backward = moving_average(series, 2, 'backward')
+    assert backward['2020-01-01'] == 0.
+    assert backward['2020-01-06'] == pytest.approx((3 + 5) / 2)
+    assert moving_average(series, 0).equals(series)
+    with pytest.raises(ValueError):
+        moving_average(series, 2, 'forward')
+
+
+def test_climatology():
+    index = pd.to_datetime(['2019-01-01', '2019-01-02', '2020-01-01', '2020-02-29', '2021-01-01'])
+    clim = climatology(pd.Series([1., 2., 3., 4., 5.], index=index))
+    assert clim.tolist() == [3., 2., 3., 4., 3.]
+
+
+@pytest.mark.parametrize('t', [1, 5, 20])
+def test_exp_filter(series, t):
+    series = series.drop(series.index[6])
+    pd.testing.assert_series_equal(exp_filter(series, t), _exp_filter_recursive(series, t),
+                                   check_names=False, check_freq=False)
+
+
+def test_add_derived_columns(series):
+    df = add_derived_columns(series.to_frame(), av_win=2, av_win_dir='backward', clim=True, t=10)
+    assert list(df.columns) == ['SM', 'SM_avg_2d_backward', 'SM_clim', 'SM_exp_filter_t10']
+    pd.testing.assert_series_equal(df['SM_clim'], df['SM_avg_2d_backward'], check_names=False)
+
+# EOF
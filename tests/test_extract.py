@@ -0,0 +1,65 @@
+import json
+import pytest
+import numpy as np
+import pandas as pd
+from vds_api_client.extract import RoiMask, roi_masks, pixel_indices, point_series, zonal_stats
+
+xr = pytest.importorskip('xarray')
+da = pytest.importorskip('dask.array')
+
+LATS = np.array([66.875, 66.625, 66.375, 66.125])
+LONS = np.array([-5.875, -5.625, -5.375, -5.125])
+SQUARE = {'type': 'Polygon', 'coordinates': [[[-6, 66.5], [-5.5, 66.5], [-5.5, 67], [-6, 67], [-6, 66.5]]]}
+
+
+@pytest.fixture
+def cube():
+    values = np.arange(48, dtype='float32').reshape(3, 4, 4)
+    values[1, 0, 0] = np.nan
+    return xr.DataArray(da.from_array(values, chunks=(1, 4, 4)), dims=('time', 'lat', 'lon'),
+                        coords={'time': pd.date_range('2020-01-01', periods=3), 'lat': LATS, 'lon': LONS})
+
+
+def test_roi_mask():
+    mask = RoiMask(SQUARE, LATS, LONS)
+    assert (mask.rows, mask.cols) == (slice(0, 2), slice(0, 2))
+    assert mask.npixels == 4
+    with_hole = {'type': 'Feature', 'geometry': {
+        'type': 'Polygon', 'coordinates': [[[-6, 66], [-5, 66], [-5, 67], [-6, 67], [-6, 66]],
+                                           [[-5.7, 66.2], [-5.3, 66.2], [-5.3, 66.8], [-5.7, 66.8], [-5.7, 66.2]]]}}
+    mask = RoiMask(json.dumps(with_hole), LATS, LONS)
+    assert mask.npixels == 12
+    assert not mask.mask[1:3, 1:3].any()
+    multi = {'type': 'MultiPolygon', 'coordinates': [SQUARE['coordinates'],
+                                                     [[[-5.2, 66], [-5, 66], [-5, 66.4], [-5.2, 66]]]]}
+    assert RoiMask(multi, LATS, LONS).npixels == 5
+    assert RoiMask({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}, LATS, LONS).npixels == 0
+    with pytest.raises(ValueError):
+        RoiMask({'type': 'Point', 'coordinates': [0, 0]}, LATS, LONS)
+
+
+def test_pixel_indices():
+    assert pixel_indices(LATS, [66.9, 66.13, 65.9, np.nan]).tolist() == [0, 3, -1, -1]
+    assert pixel_indices(LONS, [-5.99, -5.01, -4.99]).tolist() == [0, 3, -1]
+
+
+def test_point_series(cube):
+    df = point_series(cube, [66.9, 66.1, 50.], [-5.9, -5.1, 4.])
+    assert df.shape == (3, 3)
+    assert df[0].isna().tolist() == [False, True, False]
+    assert df[1].tolist() == [15., 31., 47.]
+    assert df[2].isna().all()
+
+
+def test_zonal_stats(cube):
+    masks = roi_masks({1: SQUARE, 2: {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}},
+                      LATS, LONS)
+    df = zonal_stats(cube, masks)
+    assert df.index.names == ['roi_id', 'date']
+    assert df.loc[(1, pd.Timestamp('2020-01-01')), 'mean'] == (0 + 1 + 4 + 5) / 4
+    assert df.loc[(1, pd.Timestamp('2020-01-02')), 'mean'] == (17 + 20 + 21) / 3
+    assert df.loc[(1, pd.Timestamp('2020-01-02')), 'coverage'] == 75.
+    assert df.loc[2, 'mean'].isna().all() and (df.loc[2, 'coverage'] == 0).all()
+    pd.testing.assert_frame_equal(zonal_stats(cube, masks, time_chunk=2), df)
+
+# EOF
@@ -0,0 +1,183 @@
+import os
+import re
+
+import pytest
+import numpy as np
+import pandas as pd
+import requests
+import vds_api_client as vac
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.requester import Requester
+from vds_api_client.cache import LRUCache
+from vds_api_client.fake_server import FakeApiServer
+from benchmarks.bench_e2e import run_e2e
+
+
+@pytest.fixture
+def fake_api(offline):
+    with FakeApiServer(processing_time=0.2, file_size=1000) as server:
+        vac.ENVIRONMENT = server.name
+        yield server
+
+
+def test_environment(fake_api):
+    assert vac.ENVIRONMENTS['fake'] == fake_api.base_url
+    req = Requester()
+    assert req.base_url == fake_api.base_url
+    assert req.host == fake_api.base_url.split('://')[1]
+    Requester.add_environment('local', 'http://localhost:1/')
+    assert vac.ENVIRONMENTS.pop('local') == 'http://localhost:1'
+    with pytest.raises(ValueError):
+        req.environment = 'unknown'
+
+
+def test_unauthorized(fake_api):
+    r = requests.get(fake_api.base_url + '/api/v2/users/me')
+    assert r.status_code == 401
+    r = requests.get(fake_api.base_url + '/api/v2/unknown', auth=('user', 'pass'))
+    assert r.status_code == 404
+
+
+def test_end_to_end(fake_api, tmpdir):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    assert [p.api_name for p in vds.products] == sorted(fake_api.products)
+    assert vds.rois.ids_to_list() == [1000, 1001, 1002]
+    vds._wait_time = 0.05
+    vds.outfold = str(tmpdir.join('output'))
+    vds.gen_gridded_data_request(products=['SM-XN_V001_100'], start_date='2020-01-01', end_date='2020-01-21',
+                                 lat_min=52, lat_max=53, lon_min=4, lon_max=5, nrequests=2)
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-31',
+                                 rois=[1000], lats=[52.1], lons=[4.2])
+    vds.submit_async_requests()
+    vds.download_async_files()
+
+    files = sorted(os.listdir(vds.outfold))
+    assert len(files) == 23
+    assert sum(fn.endswith('.tif') for fn in files) == 21
+    assert os.path.getsize(os.path.join(vds.outfold, files[0])) == 1000
+    with open(os.path.join(vds.outfold, 'SM-XN_V001_100_2020-01-01_2020-01-31_roi_1000.csv')) as f:
+        assert len(f.read().splitlines()) == 32
+    summary = fake_api.summary()
+    assert summary[('GET', '/api/v2/products/{product}/gridded-data', 200)] == 2
+    assert summary[('GET', '/api/v2/api-requests/{uuid}/data/{file}/download', 200)] == 23
+    assert summary[('GET', '/api/v2/api-requests/{uuid}/status', 200)] >= 4
+    assert fake_api.bytes_sent > 20 * 1000
+
+
+def test_fan_out_pixels(fake_api, tmpdir):
+    lats, lons = [52.1234567, 52.1234999, 51.9], [-4.9876543, -4.9876001, -4.5]
+    vds = VdsApiV2('user', 'pass', debug=False)
+    vds._wait_time = 0.05
+    vds.outfold = str(tmpdir.join('output'))
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-10',
+                                 lats=lats, lons=lons, snap_to_grid=True)
+    vds.submit_async_requests()
+    vds.download_async_files()
+    assert fake_api.summary()[('GET', '/api/v2/products/{product}/point-time-series', 200)] == 2
+    pattern = re.compile(r'ts_SM-XN_V001_100_2020-01-01T000000_2020-01-10T000000_'
+                         r'(-?\d+\.\d{6})_(-?\d+\.\d{6})_[0-9a-f]{5}\.csv$')
+    matches = [pattern.match(fn) for fn in os.listdir(vds.outfold)]
+    assert all(matches) and len(matches) == 3
+    assert sorted((match[2], match[1]) for match in matches) == sorted(
+        (f'{lat:.6f}', f'{lon:.6f}') for lat, lon in zip(lats, lons))
+
+def test_journal(fake_api, tmpdir):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    assert not vds.journal
+    vds._wait_time = 0.05
+    vds.outfold = str(tmpdir.join('output'))
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-31',
+                                 lats=[52.1], lons=[4.2])
+    vds.submit_async_requests()
+    assert not os.path.exists('vds_api_journal.jsonl')
+    vds = VdsApiV2('user', 'pass', debug=False, journal=str(tmpdir.join('journal.jsonl')))
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-31',
+                                 lats=[52.1], lons=[4.2])
+    vds.submit_async_requests()
+    assert len(list(vds.journal.events('submitted'))) == 1
+
+
+def test_find_reusable_results(fake_api):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-31',
+                                 lats=[52.1, 52.2, 52.3], lons=[4.2, 4.3, 4.4])
+    uris = list(vds.async_requests)
+    vds.submit_async_requests(queue_files=False)
+    reusable = VdsApiV2('user', 'pass', debug=False).find_reusable_results(uris + [uris[0] + '&x=1'])
+    assert set(reusable) == set(uris) and set(reusable.values()) == set(vds.uuids)
+
+
+def test_roi_time_series_sync(fake_api):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    df = vds.get_roi_df('SM-XN_V001_100', 'roi_1', '2020-01-01', '2021-12-31', provide_coverage=True, chunk_days=365)
+    assert len(df) == 731 and df.index.is_unique
+    assert list(df.columns) == ['value', 'average', 'climatology', 'coverage']
+    summary = fake_api.summary()
+    assert summary[('GET', '/api/v2/products/{product}/roi-time-series-sync', 200)] == 3
+
+
+def test_get_values_small_cache(fake_api):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    lats, lons = np.tile(52 + np.arange(100) / 100, 2), np.tile(-4.5 + np.arange(100) / 100, 2)
+    dates = ['2020-01-01'] * 100 + ['2020-01-02'] * 100
+    values = vds.get_values('SM-XN_V001_100', dates, lats, lons)
+    assert values.shape == (200,) and not np.isnan(values).any() and len(set(values)) == 200
+    vds.value_cache = LRUCache(maxsize=50)
+    np.testing.assert_array_equal(vds.get_values('SM-XN_V001_100', dates, lats, lons), values)
+    assert len(vds.value_cache) == 50
+
+
+def test_iter_roi_dfs_close(fake_api):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    dfs = vds.iter_roi_dfs(fake_api.products, [1000, 1001, 1002], '2020-01-01', '2020-01-31', n_jobs=1)
+    product, roi_id, df = next(dfs)
+    assert len(df) == 31
+    dfs.close()
+    summary = fake_api.summary()
+    assert summary[('GET', '/api/v2/products/{product}/roi-time-series-sync', 200)] <= 2
+
+def test_roi_df_chunks_equal(fake_api):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    whole = vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-12-31', chunk_days=400)
+    chunked = vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-12-31', chunk_days=50)
+    adaptive = vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-12-31')
+    assert len(whole) == 366 and whole['average'].notna().all()
+    pd.testing.assert_frame_equal(chunked, whole)
+    pd.testing.assert_frame_equal(adaptive, whole)
+    with pytest.raises(ValueError):
+        vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-12-31', chunk_days=0)
+
+
+def test_roi_df_store_incremental(fake_api, tmpdir):
+    pytest.importorskip('pyarrow')
+    from vds_api_client.store import TimeSeriesStore
+    vds = VdsApiV2('user', 'pass', debug=False)
+    vds.ts_store = TimeSeriesStore(str(tmpdir.join('incremental')))
+    vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-06-30')
+    vds.get_roi_df('SM-XN_V001_100', 1000, '2020-06-20', '2020-07-10')  # a short gap, like a daily update
+    incremental = vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-07-10')
+    vds.ts_store = TimeSeriesStore(str(tmpdir.join('full')))
+    full = vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-07-10')
+    assert len(incremental) == 192
+    pd.testing.assert_frame_equal(incremental, full)
+    vds.ts_store = None
+    np.testing.assert_allclose(full['average'].to_numpy(),
+                               vds.get_roi_df('SM-XN_V001_100', 1000, '2020-01-01', '2020-07-10')['average'])
+
+
+def test_errors(fake_api):
+    fake_api.error_rate = 0.5
+    auth = ('user', 'pass')
+    statuses = [requests.get(fake_api.base_url + '/api/v2/products/SM-XN_V001_100/gridded-data?lat_min=1'
+                             '&lat_max=2&lon_min=1&lon_max=2&start_date=2020-01-01&end_date=2020-01-02',
+                             auth=auth).status_code for _ in range(40)]
+    assert 5 < statuses.count(503) < 35
+    assert set(statuses) == {200, 503}
+    assert requests.get(fake_api.base_url + '/api/v2/users/me', auth=auth).status_code == 200
+
+
+def test_run_e2e():
+    results = run_e2e(n_jobs=2, file_size=100, n_proc=1)
+    assert results['files'] == 20 and results['bytes'] == 2000
+    assert results['submit_jobs_per_second'] > 0 and results['download_mb_per_second'] > 0
+    assert vac.ENVIRONMENT == 'maps' and 'fake' not in vac.ENVIRONMENTS
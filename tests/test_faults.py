@@ -0,0 +1,142 @@
+import os
+import json
+import time
+
+import pytest
+import requests
+import vds_api_client as vac
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.fake_server import FakeApiServer
+from vds_api_client.faults import Fault, FaultScenario, resilience_report
+from benchmarks.bench_e2e import run_e2e
+
+AUTH = ('user', 'pass')
+SUBMIT = ('/api/v2/products/SM-XN_V001_100/gridded-data?lat_min=1&lat_max=2&lon_min=1&lon_max=2'
+          '&start_date=2020-01-01&end_date=2020-01-02')
+
+
+def test_fault_validation():
+    with pytest.raises(ValueError):
+        Fault('explode')
+    with pytest.raises(ValueError):
+        Fault('error', endpoint='users')
+    with pytest.raises(ValueError):
+        Fault('stuck', endpoint='download')
+    assert Fault('stuck').endpoint == 'submit'
+
+
+def test_from_file(tmpdir):
+    scenario = {'seed': 3, 'faults': [{'kind': 'error', 'endpoint': 'status', 'status': 429, 'retry_after': 1},
+                                      {'kind': 'truncate', 'endpoint': 'download', 'rate': 0.1}]}
+    path = str(tmpdir.join('scenario.json'))
+    with open(path, 'w') as f:
+        json.dump(scenario, f)
+    fs = FaultScenario.from_file(path)
+    assert fs.seed == 3
+    assert [(f.kind, f.endpoint, f.status) for f in fs.faults] == [('error', 'status', 429),
+                                                                   ('truncate', 'download', 503)]
+
+
+def test_from_file_toml():
+    fs = FaultScenario.from_file(os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'scenarios',
+                                              'flaky.toml'))
+    assert fs.seed == 42
+    assert [f.kind for f in fs.faults] == ['error', 'error', 'truncate', 'slow', 'stuck']
+
+
+def test_pick():
+    fs = FaultScenario([{'kind': 'error', 'endpoint': 'download', 'rate': 0.5},
+                        {'kind': 'delay', 'seconds': 0.1, 'count': 2}], seed=7)
+    fs.start()
+    picks = [fs.pick('download') for _ in range(50)]
+    kinds = [f.kind if f else None for f in picks]
+    assert 10 < kinds.count('error') < 40 and kinds.count('delay') == 2
+    assert fs.pick('status') is None
+    fs.start()  # same seed and order, same faults
+    assert [f.kind if f else None for f in (fs.pick('download') for _ in range(50))] == kinds
+
+    burst = FaultScenario([Fault('error', start=10.)])
+    burst.start()
+    assert burst.pick('submit') is None
+
+
+def test_resilience_report():
+    records = [(0., 'GET', '/a', 503, 20, 'error'), (1., 'GET', '/a', 200, 100, None),
+               (1., 'GET', '/b', 200, 50, 'truncate'), (3., 'GET', '/b', 200, 100, None),
+               (2., 'GET', '/c', 200, 100, 'slow'), (3.5, 'GET', '/d', 429, 20, 'error')]
+    report = resilience_report(records, elapsed=4.)
+    assert report['requests'] == 6 and report['unique_requests'] == 4
+    assert report['retries'] == 2 and report['retry_amplification'] == 1.5
+    polls = [(0.1 * i, 'GET', '/status', 200, 10, None) for i in range(5)]
+    assert resilience_report(polls)['retry_amplification'] == 1.
+    assert report['faults'] == {'error': 2, 'truncate': 1, 'slow': 1}
+    assert report['good_bytes'] == 300 and report['goodput'] == 75.
+    assert report['efficiency'] == 300 / 390
+    assert report['recovered'] == 2 and report['unrecovered'] == 1
+    assert report['time_to_recovery_mean'] == 1.5 and report['time_to_recovery_max'] == 2.
+
+
+def test_no_faults():
+    report = run_e2e(n_jobs=2, file_size=100, n_proc=1, processing_time=0.3, faults=FaultScenario([]))
+    assert report['files'] == 20 and report['faults'] == {}
+    assert report['requests'] > report['unique_requests']  # status polls
+    assert report['retries'] == 0 and report['retry_amplification'] == 1.
+
+
+def test_error_retry_after(offline):
+    fs = FaultScenario([Fault('error', endpoint='submit', status=429, retry_after=2, count=1)])
+    with FakeApiServer(faults=fs) as server:
+        r = requests.get(server.base_url + SUBMIT, auth=AUTH)
+        assert r.status_code == 429 and r.headers['Retry-After'] == '2'
+        assert requests.get(server.base_url + SUBMIT, auth=AUTH).status_code == 200
+        assert server.resilience()['faults'] == {'error': 1}
+
+
+def test_truncate_and_slow(offline):
+    fs = FaultScenario([Fault('truncate', endpoint='download', fraction=0.25, count=1),
+                        Fault('slow', endpoint='download', bytes_per_second=10_000, count=1)])
+    with FakeApiServer(file_size=2000, faults=fs) as server:
+        uuid = requests.get(server.base_url + SUBMIT, auth=AUTH).json()['uuid']
+        data = requests.get(server.base_url + f'/api/v2/api-requests/{uuid}/status', auth=AUTH).json()['data']
+        url = server.base_url + data[0] + '/download'
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            requests.get(url, auth=AUTH)
+        t0 = time.perf_counter()
+        r = requests.get(url, auth=AUTH)
+        assert len(r.content) == 2000 and time.perf_counter() - t0 > 0.15
+        while len(server.records) < 4:  # recorded after the last byte is sent
+            time.sleep(0.01)
+        report = server.resilience()
+        assert report['faults'] == {'truncate': 1, 'slow': 1}
+        assert report['recovered'] == 1
+
+
+def test_stuck(offline):
+    fs = FaultScenario([Fault('stuck', percentage=42, seconds=0.5)])
+    with FakeApiServer(faults=fs) as server:
+        uuid = requests.get(server.base_url + SUBMIT, auth=AUTH).json()['uuid']
+        status = requests.get(server.base_url + f'/api/v2/api-requests/{uuid}/status', auth=AUTH).json()
+        assert status['percentage'] == 42 and status['data'] is None
+        assert requests.get(server.base_url + f'/api/v2/api-requests/{uuid}/data/f.tif/download',
+                            auth=AUTH).status_code == 404
+
+
+def test_client_recovers(offline, tmpdir):
+    fs = FaultScenario([Fault('error', endpoint='download', rate=0.2, count=4),
+                        Fault('truncate', endpoint='download', rate=0.2, count=4),
+                        Fault('stuck', seconds=0.3, rate=0.5)], seed=1)
+    with FakeApiServer(file_size=2000, faults=fs) as server:
+        vac.ENVIRONMENT = server.name
+        vds = VdsApiV2('user', 'pass', debug=False)
+        vds._wait_time = 0.05
+        vds.outfold = str(tmpdir.join('output'))
+        vds.gen_gridded_data_request(products=['SM-XN_V001_100'], start_date='2020-01-01', end_date='2020-01-30',
+                                     lat_min=52, lat_max=53, lon_min=4, lon_max=5, nrequests=3)
+        vds.submit_async_requests()
+        vds.download_async_files(n_proc=2)
+        report = server.resilience()
+    # Failed downloads are retried once, a retry can get a fault too
+    assert len(os.listdir(vds.outfold)) == 30 - report['unrecovered'] == 30 - len(vds._failed)
+    assert all(os.path.getsize(os.path.join(vds.outfold, fn)) == 2000 for fn in os.listdir(vds.outfold))
+    assert report['faults']['error'] > 0 and report['faults']['truncate'] > 0
+    assert report['retry_amplification'] > 1 and report['recovered'] > 0
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from vds_api_client.grid import pixel_size, snap_to_grid, unique_pixels
+
+
+def test_pixel_size():
+    assert pixel_size('TEST-PRODUCT_V001_25000') == 0.25
+    assert pixel_size('SM-XN_V001_100') == 0.001
+    with pytest.raises(ValueError):
+        pixel_size('NO-RESOLUTION')
+
+
+def test_snap_to_grid():
+    lats, lons = snap_to_grid([66.8, 66.125], [-5.9, -5.0001], 0.25)
+    np.testing.assert_allclose(lats, [66.875, 66.125])
+    np.testing.assert_allclose(lons, [-5.875, -5.125])
+
+
+def test_unique_pixels():
+    cell_lats, cell_lons, inverse = unique_pixels([66.9, 66.1, 66.8, 66.2],
+                                                  [-5.9, -5.1, -5.8, -5.2], 0.25)
+    np.testing.assert_allclose(cell_lats, [66.875, 66.125])
+    np.testing.assert_allclose(cell_lons, [-5.875, -5.125])
+    assert inverse.tolist() == [0, 1, 0, 1]
+
+# EOF
@@ -0,0 +1,132 @@
+import os
+import pytest
+import requests
+import vds_api_client as vac
+from vds_api_client.requester import Requester
+from vds_api_client.http_cache import HttpCache, cache_control, request_key
+
+HOST = 'https://maps.vandersat.com'
+
+
+class FakeSession(object):
+    """
+    Session answering GET requests with canned responses, recording the sent headers
+    """
+    def __init__(self, headers=None, status_code=200):
+        self.calls = []
+        self.response_headers = headers or {}
+        self.status_code = status_code
+
+    def get(self, uri, headers=None, **kwargs):
+        self.calls.append((uri, dict(headers or {})))
+        r = requests.Response()
+        r.url = uri
+        if headers and headers.get('If-None-Match') == '"v1"':
+            r.status_code = 304
+            r._content = b''
+        else:
+            r.status_code = self.status_code
+            r._content = f'{{"n": {len(self.calls)}}}'.encode()
+        r.headers.update(self.response_headers)
+        return r
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(vac, 'SESSION', session)
+    monkeypatch.setattr(vac, 'HEADERS', {})
+    monkeypatch.setattr(vac, 'AUTH', ('user', 'pw'))
+    monkeypatch.setattr(vac, 'HTTP_CACHE', HttpCache())
+    return session
+
+
+def test_cache_control():
+    assert cache_control({'Cache-Control': 'private, max-age=60'}) == {'private': True, 'max-age': '60'}
+    assert cache_control({}) == {}
+
+
+def test_request_key():
+    key = request_key('GET', HOST + '/api/v2/rois', ('user', 'pw'), {})
+    assert key == request_key('get', HOST + '/api/v2/rois', ('user', 'other'), {})
+    assert key != request_key('GET', HOST + '/api/v2/rois', ('other', 'pw'), {})
+    assert key != request_key('GET', HOST + '/api/v2/rois', ('user', 'pw'), {'X-VDS-UserId': 'a@b.c'})
+
+
+def test_ttl_rules():
+    cache = HttpCache()
+    assert cache.ttl(HOST + '/api/v2/products/') == 3600
+    assert cache.ttl(HOST + '/api/v2/products/SM-XN_V001_100/point-value?lat=1&lon=2&date=2020-01-01') == 86400
+    assert cache.ttl(HOST + '/api/v2/api-requests/abc/status') is None
+    assert HttpCache(rules=[('/rois', 10)]).ttl(HOST + '/api/v2/products/') is None
+
+
+def test_requester_cache(session):
+    req = Requester()
+    uri = HOST + '/api/v2/products/'
+    assert req.get_content(uri) == {'n': 1}
+    assert req.get_content(uri) == {'n': 1}
+    assert req.get(uri).from_cache
+    assert len(session.calls) == 1
+    req.get_content(uri, headers={'X-Fields': 'api_name'})
+    vac.HEADERS['X-VDS-UserId'] = 'other@planet.com'
+    assert req.get_content(uri) == {'n': 3}
+    req.get_content(HOST + '/api/v2/api-requests/abc/status')
+    req.get_content(HOST + '/api/v2/api-requests/abc/status')
+    assert len(session.calls) == 5
+    assert req.http_cache.hits == 2
+
+
+def test_cached_response_stream(session):
+    req = Requester()
+    uri = HOST + '/api/v2/products/'
+    content = req.get(uri).content
+    r = req.get(uri, stream=True)
+    assert r.from_cache
+    assert b''.join(r.iter_content(2)) == content
+    assert b''.join(req.get(uri).iter_content(1024)) == content
+    r.close()
+
+
+def test_cache_headers(session):
+    req = Requester()
+    uri = HOST + '/api/v2/rois'
+    session.response_headers = {'Cache-Control': 'no-store'}
+    req.get(uri)
+    req.get(uri)
+    assert len(session.calls) == 2
+    session.response_headers = {'Cache-Control': 'max-age=0', 'ETag': '"v1"'}
+    assert req.get_content(uri) == {'n': 3}
+    assert req.get_content(uri) == {'n': 3}
+    assert session.calls[-1][1]['If-None-Match'] == '"v1"'
+    assert req.http_cache.revalidated == 1
+
+
+def test_disk_cache(session, tmpdir):
+    path = os.path.join(tmpdir, 'http.sqlite')
+    vac.HTTP_CACHE = HttpCache(path=path)
+    req = Requester()
+    req.get_content(HOST + '/api/v2/users/me')
+    vac.HTTP_CACHE = HttpCache(path=path)
+    assert req.get_content(HOST + '/api/v2/users/me') == {'n': 1}
+    assert len(session.calls) == 1
+
+
+def test_memory_limit(session):
+    vac.HTTP_CACHE = HttpCache(maxbytes=300)
+    req = Requester()
+    req.get(HOST + '/api/v2/rois/1')
+    req.get(HOST + '/api/v2/rois/2')
+    assert len(vac.HTTP_CACHE.memory) == 1
+    req.get(HOST + '/api/v2/rois/2')
+    req.get(HOST + '/api/v2/rois/1')
+    assert len(session.calls) == 3
+
+
+def test_errors_not_cached(session):
+    session.status_code = 500
+    with pytest.raises(requests.HTTPError):
+        Requester().get(HOST + '/api/v2/rois')
+    assert len(vac.HTTP_CACHE.memory) == 0
+
+# EOF
@@ -0,0 +1,113 @@
+import os
+import logging
+import threading
+
+import pytest
+from joblib import Parallel, delayed
+from vds_api_client import log
+from vds_api_client.vds_api_base import api_get
+
+
+@pytest.fixture
+def log_file(tmpdir):
+    path = os.path.join(tmpdir, 'logs', 'vds_api.log')
+    os.makedirs(os.path.dirname(path))
+    with log.temporary_logging('', stream_level=logging.WARNING):
+        yield path
+
+
+def read_log(path):
+    log.pipeline().stop()
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_threads(log_file):
+    logger = log.configure_logging(log_file, stream_level=logging.WARNING)
+    threads = [threading.Thread(target=lambda i=i: [logger.debug('thread %d message %d', i, j) for j in range(100)])
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lines = read_log(log_file)
+    assert len(lines) == 400
+    assert ' DEBUG - ' in lines[0] and ' @ thr ' in lines[0]
+    assert sum('thread 3 message 99' in line for line in lines) == 1
+
+
+def test_lazy(log_file):
+    class Expensive(object):
+        calls = 0
+
+        def __str__(self):
+            Expensive.calls += 1
+            return 'expensive'
+
+    logger = log.configure_logging('', stream_level=logging.INFO)
+    assert logger.level == logging.INFO
+    logger.debug('%s', Expensive())
+    assert Expensive.calls == 0
+    assert not os.path.exists(log_file)
+
+
+def test_summary_only(log_file):
+    logger = log.configure_logging(log_file, stream_level=logging.WARNING, summary_only=True)
+    logger.info('Writing file: a.tif')
+    logger.info('Succesfully downloaded: 1 files', extra=log.SUMMARY)
+    logger.warning('Request status = 500')
+    lines = read_log(log_file)
+    assert [line.split(' - ')[-1] for line in lines] == ['Succesfully downloaded: 1 files', 'Request status = 500']
+
+
+def test_levels(log_file):
+    log.configure_logging(log_file, file_level=logging.INFO, stream_level=logging.WARNING)
+    assert logging.getLogger('vds_api').level == logging.INFO
+    log.pipeline().stream_level = logging.DEBUG
+    assert logging.getLogger('vds_api').level == logging.DEBUG
+    assert log.pipeline().file_level == logging.INFO
+    assert log.pipeline().worker_level == logging.DEBUG
+    log.configure_logging(log_file, stream_level=logging.INFO, summary_only=True)
+    assert log.pipeline().worker_level == logging.WARNING
+
+
+def test_relocate(log_file, monkeypatch):
+    monkeypatch.setenv('VDS_API_LOG_FILE', log_file)
+    log.configure_logging(stream_level=logging.WARNING).info('relocated')
+    assert read_log(log_file)[0].endswith('relocated')
+
+
+def test_temporary(log_file):
+    logger = log.configure_logging(log_file, stream_level=logging.WARNING)
+    previous = log.pipeline()
+    with log.temporary_logging('', stream_level=logging.WARNING, summary_only=True) as quiet:
+        assert quiet is logger and log.pipeline() is not previous and log.pipeline().summary_only
+        logger.info('hidden')
+    assert log.pipeline() is previous and logger.level == logging.DEBUG
+    logger.info('restored')
+    assert [line.split(' - ')[-1] for line in read_log(log_file)] == ['restored']
+
+
+def test_worker_processes(log_file, tmpdir):
+    log.configure_logging(log_file, stream_level=logging.WARNING)
+    log_queue = log.pipeline().process_queue()
+    fns = []
+    for i in range(4):
+        fns.append(os.path.join(tmpdir, f'file_{i}.tif'))
+        open(fns[-1], 'w').close()
+    results = Parallel(n_jobs=2)(delayed(api_get)('https://maps.vandersat.com/api/v2/', expected_fn=fn,
+                                                  log_level=logging.DEBUG, log_queue=log_queue) for fn in fns)
+    assert [result[0] for result in results] == [-1] * 4
+    lines = read_log(log_file)
+    assert sorted(line.split(' - ')[-1] for line in lines) == [f'File {fn} exists, skipping download' for fn in fns]
+
+
+def test_api_get_str_lvl(log_file, tmpdir):
+    fn = os.path.join(tmpdir, 'file.tif')
+    open(fn, 'w').close()
+    with pytest.deprecated_call():
+        assert api_get('https://maps.vandersat.com/api/v2/', expected_fn=fn, str_lvl=logging.DEBUG) == (-1, fn)
+
+# EOF
@@ -0,0 +1,103 @@
+import os
+import datetime as dt
+from glob import glob
+import pytest
+import vds_api_client as vac
+from vds_api_client.vds_api_base import parse_config_file
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.manifest import Manifest, run_manifest
+from vds_api_client.fake_server import FakeApiServer
+
+MANIFEST = """
+outfold = "data"
+products = ["TEST-PRODUCT_V001_25000"]
+
+[[jobs]]
+type = "grid"
+start_date = 2020-01-01
+end_date = 2020-01-03
+lat_min = 66
+lat_max = 67
+lon_min = -6
+lon_max = -5
+
+[[jobs]]
+type = "ts"
+name = "points"
+outfold = "points"
+start_time = 2020-01-01
+end_time = 2020-01-03
+lats = [66.875]
+lons = [-5.875]
+"""
+
+
+def test_parse_config_file(example_config_ts, example_config_area):
+    pars = parse_config_file(example_config_ts)
+    assert pars['lats'] == [66.875, 66.125]
+    assert pars.products == ['TEST-PRODUCT_V001_25000']
+    assert pars.rois == [25009, 'Right']
+    assert pars.start_time == dt.date(2020, 1, 1)
+    assert pars.lat_min is None and 'lat_min' not in pars
+    assert pars.raw['lats'] == ['66.875', '66.125'] and pars.raw['products'] == 'TEST-PRODUCT_V001_25000'
+    assert parse_config_file(example_config_area).lat_max == 67.
+
+
+def test_parse_config_file_invalid(tmpdir):
+    fn = os.path.join(tmpdir, 'invalid.vds')
+    with open(fn, 'w') as f:
+        f.write('lat_min = north\n')
+    with pytest.raises(ValueError, match='lat_min'):
+        parse_config_file(fn)
+    with pytest.raises(RuntimeError):
+        parse_config_file('nonexisting.file')
+
+
+def test_manifest_toml(tmpdir):
+    pytest.importorskip('tomllib')
+    fn = os.path.join(tmpdir, 'manifest.toml')
+    with open(fn, 'w') as f:
+        f.write(MANIFEST)
+    manifest = Manifest.from_file(fn)
+    assert len(manifest) == 2
+    grid, ts = manifest
+    assert grid.kind == 'grid'
+    assert grid.outfold == 'data'
+    assert grid.params['start_date'] == '2020-01-01'
+    assert grid.params['products'] == ['TEST-PRODUCT_V001_25000']
+    assert ts.name == 'points'
+    assert ts.outfold == 'points'
+
+
+def test_manifest_flat(example_config_area):
+    manifest = Manifest.from_file(example_config_area)
+    assert len(manifest) == 1
+    assert manifest.jobs[0].kind == 'grid'
+    assert manifest.jobs[0].params['lat_min'] == 66.
+    assert manifest.jobs[0].params['start_date'] == '2020-01-01'
+
+
+def test_run_manifest(offline, tmpdir):
+    grid = {'type': 'grid', 'start_date': '2020-01-01', 'end_date': '2020-01-02', 'lat_min': 52, 'lat_max': 53,
+            'lon_min': 4, 'lon_max': 5}
+    manifest = Manifest.from_dict({'products': ['SM-XN_V001_100'],
+                                   'jobs': [dict(grid, outfold='first'), dict(grid, outfold='second')]})
+    with FakeApiServer(file_size=100) as server:
+        vac.ENVIRONMENT = server.name
+        vds = VdsApiV2('user', 'pass', debug=False)
+        vds._wait_time = 0.05
+        run_manifest(manifest, vds=vds, n_proc=1)
+        first, second = server.jobs
+    assert len(os.listdir('first')) == len(os.listdir('second')) == 2
+    with open(max(glob('download_*.uuids'), key=os.path.getmtime)) as f:
+        assert f.read().split() == [second]
+    assert not glob('*.uuid')
+
+
+def test_manifest_invalid():
+    with pytest.raises(ValueError):
+        Manifest.from_dict({'jobs': [{'type': 'ts', 'lat': 66.875}]})
+    with pytest.raises(ValueError):
+        Manifest.from_dict({'jobs': [{'type': 'area'}]})
+
+# EOF
@@ -0,0 +1,148 @@
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import vds_api_client as vac
+from vds_api_client.metrics import RequestMetrics, Histogram, endpoint_template, timed_session
+from vds_api_client.requester import Requester
+from vds_api_client.vds_api_base import api_get
+from tests.test_http_cache import FakeSession
+
+HOST = 'https://maps.vandersat.com'
+UUID = '0c5f5d4e-8d8c-4b2a-9d3e-2f1a7c6b5a4d'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.startswith('/missing'):
+            body, status = b'{"message": "not found"}', 404
+        else:
+            body, status = b'{"value": 1}' * 100, 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition', 'attachment; filename=file.json')
+        self.send_header('Set-Cookie', f'session={self.headers.get("Authorization")}; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.block_on_close = False  # Pooled client connections stay open
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = RequestMetrics()
+    monkeypatch.setattr(vac, 'METRICS', metrics)
+    monkeypatch.setattr(vac, 'HEADERS', {})
+    monkeypatch.setattr(vac, 'AUTH', None)
+    monkeypatch.setattr(vac, 'HTTP_CACHE', None)
+    return metrics
+
+
+def test_endpoint_template():
+    assert endpoint_template(HOST + '/api/v2/products/SM-XN_V001_100/point-value?lat=1&lon=2') == \
+        '/api/v2/products/{product}/point-value'
+    assert endpoint_template(HOST + f'/api/v2/api-requests/{UUID}/status') == '/api/v2/api-requests/{uuid}/status'
+    assert endpoint_template(HOST + '/api/v2/rois/2464/') == '/api/v2/rois/{id}'
+    assert endpoint_template(HOST + f'/api/v2/api-requests/{UUID}/files/SM_2020.tif/download') == \
+        '/api/v2/api-requests/{uuid}/files/{file}/download'
+    assert endpoint_template(HOST + '/api/v2/products/') == '/api/v2/products'
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.))
+    for value in [0.05, 0.1, 0.5, 2.]:
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [(0.1, 2), (1., 3), (float('inf'), 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.95) == float('inf')
+    assert histogram.mean == pytest.approx(2.65 / 4)
+
+
+def test_observe():
+    metrics = RequestMetrics()
+    uri = HOST + '/api/v2/rois/1'
+    metrics.observe('get', uri, 503, ttfb=0.2)
+    metrics.observe('get', uri, 200, connect=0.01, ttfb=0.1, transfer=0.02, nbytes=100)
+    metrics.observe('get', HOST + '/api/v2/rois/2', 200, nbytes=50)
+    metrics.observe_parse('get', uri, 0.001)
+    df = metrics.summary()
+    row = df.loc[('GET', '/api/v2/rois/{id}')]
+    assert (row['requests'], row['errors'], row['retries'], row['bytes']) == (3, 1, 1, 150)
+    assert row['ttfb_p95'] == 0.25
+    text = metrics.to_openmetrics()
+    assert 'vds_api_requests_total{method="GET",endpoint="/api/v2/rois/{id}",status="503"} 1' in text
+    assert 'vds_api_request_ttfb_seconds_bucket{method="GET",endpoint="/api/v2/rois/{id}",le="+Inf"} 3' in text
+    assert 'vds_api_request_parse_seconds_count{method="GET",endpoint="/api/v2/rois/{id}"} 1' in text
+    assert text.endswith('# EOF\n')
+    metrics.clear()
+    assert metrics.summary().empty
+
+
+def test_requester(metrics, monkeypatch):
+    monkeypatch.setattr(vac, 'SESSION', FakeSession())
+    req = Requester()
+    assert req.get_content(HOST + '/api/v2/rois/1') == {'n': 1}
+    row = metrics.summary().loc[('GET', '/api/v2/rois/{id}')]
+    assert (row['requests'], row['bytes']) == (1, 8)
+    assert row['parse_mean'] >= 0
+
+
+def test_connect_time(metrics, server, monkeypatch):
+    monkeypatch.setattr(vac, 'SESSION', timed_session())
+    req = Requester()
+    for _ in range(3):
+        req.get(server + '/api/v2/status/')
+    with pytest.raises(Exception):
+        req.get(server + '/missing')
+    connect = metrics.histograms[('connect', 'GET', '/api/v2/status')]
+    assert connect.count == 3
+    assert 0 < connect.sum
+    assert connect.counts[0] >= 2  # pooled connections are reused
+    assert metrics.requests[('GET', '/missing', '404')] == 1
+
+
+def test_no_cookies(metrics, server, monkeypatch):
+    monkeypatch.setattr(vac, 'SESSION', timed_session())
+    req = Requester()
+    monkeypatch.setattr(vac, 'AUTH', ('user', 'pass'))
+    req.get(server + '/api/v2/users/me')
+    monkeypatch.setattr(vac, 'AUTH', ('other', 'pass'))
+    r = req.get(server + '/api/v2/users/me')
+    assert 'Cookie' not in r.request.headers
+    assert not req.session.cookies
+
+
+def test_api_get_timed(server, tmpdir):
+    result, timing = api_get(server + '/api/v2/file', expected_fn=os.path.join(tmpdir, 'file.json'),
+                             out_path=str(tmpdir), timed=True)
+    assert result == os.path.join(tmpdir, 'file.json').encode('ascii')
+    assert timing['status'] == 200 and timing['nbytes'] == 1200
+    result, timing = api_get(server + '/api/v2/file', expected_fn=os.path.join(tmpdir, 'file.json'),
+                             out_path=str(tmpdir), timed=True)
+    assert result[0] == -1 and timing is None
+
+
+def test_write_openmetrics(tmpdir):
+    metrics = RequestMetrics()
+    metrics.observe('GET', HOST + '/api/v2/products/', 200)
+    path = os.path.join(tmpdir, 'vds_api.prom')
+    metrics.write_openmetrics(path)
+    with open(path) as f:
+        assert f.read() == metrics.to_openmetrics()
+
+# EOF
@@ -0,0 +1,61 @@
+import os
+from glob import glob
+import pytest
+import numpy as np
+from vds_api_client.mosaic import mosaic_grids, GridAlignmentError
+from tests.grids import write_tif, PRODUCT
+
+xr = pytest.importorskip('xarray')
+pytest.importorskip('rasterio')
+
+
+@pytest.fixture
+def tiles(tmpdir):
+    # Two tiles of 2 x 2 pixels next to each other, split over two date requests
+    for date, offset in [('2020-01-01', 0), ('2020-01-02', 10)]:
+        write_tif(tmpdir, date, np.array([[1., 2.], [3., 4.]]) + offset, lon_min=-6., lat_max=67.)
+        write_tif(tmpdir, date, np.array([[5., 6.], [7., np.nan]]) + offset, lon_min=-5.5, lat_max=67.)
+    write_tif(tmpdir, '2020-01-03', np.array([[9., 9.], [9., 9.]]), lon_min=-5.5, lat_max=66.5)
+    return str(tmpdir)
+
+
+@pytest.mark.parametrize('file_format', ['netcdf4', 'zarr'])
+def test_mosaic(tiles, file_format):
+    pytest.importorskip('netCDF4' if file_format == 'netcdf4' else 'zarr')
+    path = mosaic_grids(tiles, PRODUCT, file_format=file_format, chunks=(1, 2, 2))
+    assert os.path.basename(path) == f'{PRODUCT}_mosaic.{"nc" if file_format == "netcdf4" else "zarr"}'
+    ds = xr.open_zarr(path, consolidated=False) if file_format == 'zarr' else xr.open_dataset(path)
+    cube = ds[PRODUCT]
+    assert cube.shape == (3, 4, 4)
+    np.testing.assert_allclose(cube['lat'], [66.875, 66.625, 66.375, 66.125])
+    np.testing.assert_allclose(cube['lon'], [-5.875, -5.625, -5.375, -5.125])
+    np.testing.assert_allclose(cube.values[1, :2], [[11., 12., 15., 16.], [13., 14., 17., np.nan]])
+    np.testing.assert_allclose(cube.values[2, 2:, 2:], 9.)
+    assert np.isnan(cube.values[2, :2]).all()
+    assert str(cube['time'].values[0])[:10] == '2020-01-01'
+    ds.close()
+
+
+def test_mosaic_files(tiles):
+    pytest.importorskip('netCDF4')
+    earlier = write_tif(tiles, '2019-12-31', np.zeros((2, 2)), lon_min=-4., lat_max=60.)
+    files = glob(os.path.join(tiles, f'{PRODUCT}_2020-01-0[12]T*.tif'))
+    with xr.open_dataset(mosaic_grids(tiles, PRODUCT, files=files)) as ds:
+        assert ds[PRODUCT].shape == (2, 2, 4)
+    with xr.open_dataset(mosaic_grids(tiles, PRODUCT, files=files + [earlier.encode()])) as ds:
+        assert ds[PRODUCT].shape == (3, 30, 10)
+    with pytest.raises(FileNotFoundError):
+        mosaic_grids(tiles, PRODUCT, files=[])
+
+
+def test_mosaic_misaligned(tiles):
+    pytest.importorskip('netCDF4')
+    write_tif(tiles, '2020-01-01', np.ones((2, 2)), lon_min=-5.4, lat_max=67.)
+    with pytest.raises(GridAlignmentError):
+        mosaic_grids(tiles, PRODUCT)
+    write_tif(tiles, '2020-01-04', np.ones((2, 2)), lon_min=-7., lat_max=67., size=0.1, product='OTHER_V001_10000')
+    write_tif(tiles, '2020-01-04', np.ones((2, 2)), lon_min=-6., lat_max=67., size=0.2, product='OTHER_V001_10000')
+    with pytest.raises(GridAlignmentError):
+        mosaic_grids(tiles, 'OTHER_V001_10000')
+
+# EOF
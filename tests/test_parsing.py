@@ -0,0 +1,47 @@
+import pytest
+import pandas as pd
+from vds_api_client.parsing import read_time_series_csv, loads, pa
+
+CSV = (b'# product: TEST-PRODUCT_V001_25000\n# roi_id: 25009\n'
+       b'datetime,value,average\n2020-01-01,0.25,0.2\n2020-01-02,,0.3\n2020-01-03,0.35,0.4\n')
+
+
+@pytest.mark.parametrize('engine', ['auto', 'pandas', 'pyarrow'])
+def test_read_time_series_csv(engine):
+    if engine == 'pyarrow' and pa is None:
+        pytest.skip('pyarrow not installed')
+    df = read_time_series_csv(CSV, engine=engine)
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert df.index[0] == pd.Timestamp('2020-01-01')
+    assert list(df.columns) == ['value', 'average']
+    assert df['value'].isna().sum() == 1
+    assert df['average'].dtype == float
+
+
+def test_read_time_series_csv_comments():
+    df = read_time_series_csv(CSV + b'# trailing comment\n')
+    assert len(df) == 3
+    df = read_time_series_csv(CSV, dtypes={'average': 'float32'}, date_format='%Y-%m-%d')
+    assert df['average'].dtype == 'float32'
+
+
+def test_engines_same_dtypes():
+    if pa is None:
+        pytest.skip('pyarrow not installed')
+    content = b'datetime,a,b\n2020-01-01,1.0,\n2020-01-02,2.0,\n'
+    tz_aware = b'datetime,a\n2020-01-01T00:00:00+00:00,1.0\n2020-01-02T00:00:00+00:00,2\n'
+    for csv in [content, CSV, tz_aware]:
+        expected = read_time_series_csv(csv, engine='pandas')
+        df = read_time_series_csv(csv, engine='pyarrow')
+        assert df.dtypes.to_dict() == expected.dtypes.to_dict()
+        assert df.index.dtype == expected.index.dtype
+        pd.testing.assert_frame_equal(df, expected)
+    assert read_time_series_csv(content, engine='pyarrow')['b'].dtype == 'float64'
+    assert str(read_time_series_csv(tz_aware).index.tz) == 'UTC'
+
+
+def test_loads():
+    assert loads(b'{"uuid": "abc", "percentage": 100}') == {'uuid': 'abc', 'percentage': 100}
+    assert pd.isna(loads(b'{"value": NaN}')['value'])
+
+# EOF
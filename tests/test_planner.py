@@ -0,0 +1,41 @@
+import os
+from vds_api_client.journal import JobJournal
+from vds_api_client.planner import RequestPlan, estimate_uri
+
+GRID_URI = ('https://maps.vandersat.com/api/v2/products/TEST-PRODUCT_V001_25000/gridded-data?'
+            'lat_min=66&lat_max=67&lon_min=-6&lon_max=-5&'
+            'start_date=2020-01-01&end_date=2020-01-03&format=gtiff&zipped=false')
+TS_URI = ('https://maps.vandersat.com/api/v2/products/TEST-PRODUCT_V001_25000/point-time-series?'
+          'start_time=2020-01-01&end_time=2020-01-03&lat=66.875&lon=-5.875'
+          '&format=csv&avg_window_days=0&avg_window_direction=center&include_masked_data=false&climatology=false')
+
+
+def test_estimate_uri():
+    files, nbytes, prefixes = estimate_uri(GRID_URI)
+    assert files == 3
+    assert nbytes > 3 * 16 * 4
+    assert prefixes[0] == 'TEST-PRODUCT_V001_25000_2020-01-01T000000_-6.000000_67.000000_-5.000000_66.000000'
+    files, _, prefixes = estimate_uri(TS_URI)
+    assert files == 1
+    assert prefixes == ['ts_TEST-PRODUCT_V001_25000_2020-01-01T000000_2020-01-03T000000_-5.875000_66.875000']
+
+
+def test_request_plan(tmpdir):
+    open(os.path.join(tmpdir, 'ts_TEST-PRODUCT_V001_25000_2020-01-01T000000_2020-01-03T000000'
+                              '_-5.875000_66.875000_abcde.csv'), 'w').close()
+    journal = JobJournal(os.path.join(tmpdir, 'journal.jsonl'))
+    plan = RequestPlan([GRID_URI, TS_URI], outfold=tmpdir, throughput=journal.throughput())
+    assert plan.n_requests == 2
+    assert plan.files == 4
+    assert plan.existing_files == 1
+    assert plan.duration is None
+
+    for uuid, uri in [('a', GRID_URI), ('b', TS_URI)]:
+        journal.record('submitted', uuid=uuid, uri=uri)
+        journal.record('ready', uuid=uuid, files=1)
+    journal.record('downloaded', uuids=['a', 'b'], files=4, bytes=1000, seconds=1.0)
+    plan = RequestPlan([GRID_URI, TS_URI], outfold=tmpdir, throughput=journal.throughput())
+    assert plan.duration is not None
+    assert 'Jobs total' in str(plan)
+
+# EOF
@@ -0,0 +1,70 @@
+import os
+import time
+
+import pytest
+from vds_api_client import profiling
+from vds_api_client.profiling import Profiler, stage, timed_stage, set_output_dir
+
+
+@timed_stage('work')
+def work(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_stage_without_profiler():
+    with stage('idle'):
+        pass
+    assert work(0) == 0
+    assert profiling._ACTIVE is None
+
+
+def test_profiler_cprofile(tmpdir):
+    with Profiler(output_dir=str(tmpdir), cpu='cprofile') as profiler:
+        with stage('outer'):
+            time.sleep(0.05)
+            work(0.05)
+            work(0.05)
+        data = [bytearray(2 ** 20) for _ in range(4)]
+    del data
+
+    calls, total, own = profiler.stages['outer']
+    assert calls == 1
+    assert total >= 0.15 and 0.04 <= own < total - 0.09
+    assert profiler.stages['work'][0] == 2
+    assert profiler.peak_memory >= 4 * 2 ** 20
+    txt, prof = profiler.paths
+    assert os.path.dirname(txt) == str(tmpdir)
+    assert txt.endswith('.txt') and prof.endswith('.prof') and os.path.exists(prof)
+    with open(txt) as f:
+        report = f.read()
+    assert 'Peak traced memory' in report
+    assert 'cProfile' in report and 'work' in report
+    assert profiling._ACTIVE is None
+
+
+def test_profiler_stages_only(tmpdir):
+    with Profiler(cpu=None, memory=False) as profiler:
+        set_output_dir(str(tmpdir))
+        work(0)
+    assert profiler.paths == [profiler.paths[0]]
+    assert os.path.dirname(profiler.paths[0]) == str(tmpdir)
+    with open(profiler.paths[0]) as f:
+        report = f.read()
+    assert 'work' in report and 'Memory' not in report
+
+
+def test_profiler_pyinstrument(tmpdir):
+    pytest.importorskip('pyinstrument')
+    with Profiler(output_dir=str(tmpdir)) as profiler:
+        work(0.02)
+    assert profiler.cpu == 'pyinstrument'
+    assert profiler.paths[1].endswith('.html') and os.path.exists(profiler.paths[1])
+
+
+def test_nested_profiler(tmpdir):
+    with Profiler(output_dir=str(tmpdir), cpu=None, memory=False):
+        with pytest.raises(RuntimeError):
+            Profiler(cpu=None, memory=False).start()
+    with pytest.raises(ValueError):
+        Profiler(cpu='perf')
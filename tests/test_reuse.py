@@ -0,0 +1,39 @@
+import os
+from vds_api_client.journal import JobJournal
+from vds_api_client.reuse import request_key, previous_results, is_reusable
+
+URI = ('https://maps.vandersat.com/api/v2/products/TEST-PRODUCT_V001_25000/gridded-data?'
+       'lat_min=66&lat_max=67&lon_min=-6&lon_max=-5&'
+       'start_date=2020-01-01&end_date=2020-01-03&format=gtiff&zipped=false')
+
+
+def test_request_key():
+    reordered = URI.replace('lat_min=66&lat_max=67', 'lat_max=67&lat_min=66')
+    assert request_key(URI) == request_key(reordered)
+    assert request_key(URI) == request_key(URI.replace('https://maps.vandersat.com', ''))
+    assert request_key(URI) != request_key(URI.replace('zipped=false', 'zipped=true'))
+
+
+def test_previous_results(tmpdir):
+    journal = JobJournal(os.path.join(tmpdir, 'journal.jsonl'))
+    journal.record('submitted', uuid='local', uri=URI)
+    journal.record('submitted', uuid='staging', uri=URI.replace('maps.vandersat.com', 'staging'))
+    prev_requests = [{'uuid': 'server', 'uri': URI}, {'uuid': 'no-uri'}]
+    results = previous_results(prev_requests, journal, host='maps.vandersat.com')
+    assert results == {request_key(URI): ['local', 'server']}
+    assert previous_results(prev_requests, journal, max_age_days=-1) == {request_key(URI): ['server']}
+
+
+def test_previous_results_unknown_field(caplog):
+    with caplog.at_level('WARNING', logger='vds_api'):
+        assert previous_results([{'uuid': 'server', 'query': URI}]) == {}
+    assert 'only the local job journal is used' in caplog.text
+
+
+def test_is_reusable():
+    assert is_reusable({'processing_status': 'Ready', 'percentage': 100, 'data': ['/file']})
+    assert is_reusable({'processing_status': 'Processing', 'percentage': 40})
+    assert not is_reusable({'processing_status': 'Ready', 'percentage': 100, 'data': None})
+    assert not is_reusable({'processing_status': 'Failed', 'percentage': 40})
+
+# EOF
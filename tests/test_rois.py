@@ -16,9 +16,9 @@ def test_rois_getitem(credentials, example_config_ts):
     assert vds.rois[roi_name].name == roi_name
 
 
-def test_rois_filter():
+def test_rois_filter(credentials):
 
-    vds = VdsApiBase()
+    vds = VdsApiBase(credentials['user'], credentials['pw'])
     rois = vds.rois.filter(min_id=25009, max_id=25010)
     assert set(rois.ids_to_list()) == {25009, 25010}
 
@@ -33,9 +33,9 @@ def test_rois_filter():
     assert set(rois.ids_to_list()) == {25010, 25011}
 
 
-def test_show_hide_all():
+def test_show_hide_all(credentials):
 
-    vds = VdsApiBase()
+    vds = VdsApiBase(credentials['user'], credentials['pw'])
     vds.rois.show_all()
     assert all([roi.display for roi in vds.rois])
 
@@ -48,8 +48,8 @@ def test_show_hide_all():
     assert not vds.rois[25011].display
 
 
-def test_roi_geojson():
-    vds = VdsApiBase()
+def test_roi_geojson(credentials):
+    vds = VdsApiBase(credentials['user'], credentials['pw'])
     roi = vds.rois[25009]
 
     geojson_should = {'type': 'MultiPolygon',
@@ -65,9 +65,9 @@ def test_roi_geojson():
     assert requested_geojson == geojson_should
 
 
-def test_roi_update():
+def test_roi_update(credentials):
 
-    vds = VdsApiBase()
+    vds = VdsApiBase(credentials['user'], credentials['pw'])
     roi = vds.rois[30596]  # This one is meant to be updated
 
     roi.update('OldName', description='old rect', display=False)
@@ -0,0 +1,71 @@
+import os
+import time
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from vds_api_client.store import series_key, merge_spans, missing_spans, TimeSeriesStore
+
+pytest.importorskip('pyarrow')
+
+FETCHED = time.mktime(datetime(2021, 1, 1).timetuple())
+
+
+def _df(start, end, value=1.):
+    index = pd.date_range(start, end, name='date')
+    return pd.DataFrame({'value': np.full(len(index), value)}, index=index)
+
+
+def test_series_key():
+    assert series_key('P', 'roi_1', a=1, b=True) == series_key('P', 'roi_1', b=True, a=1)
+    assert series_key('P', 'roi_1', a=1) != series_key('P', 'roi_1', a=2)
+
+
+def test_spans():
+    spans = [('2020-01-10', '2020-01-20'), ('2020-01-01', '2020-01-05'), ('2020-01-06', '2020-01-08')]
+    assert merge_spans(spans) == [(datetime(2020, 1, 1), datetime(2020, 1, 8)),
+                                  (datetime(2020, 1, 10), datetime(2020, 1, 20))]
+    assert missing_spans(spans, '2019-12-30', '2020-01-31') == [(datetime(2019, 12, 30), datetime(2019, 12, 31)),
+                                                                (datetime(2020, 1, 9), datetime(2020, 1, 9)),
+                                                                (datetime(2020, 1, 21), datetime(2020, 1, 31))]
+    assert missing_spans(spans, '2020-01-02', '2020-01-04') == []
+    assert missing_spans([], '2020-01-02', '2020-01-04') == [(datetime(2020, 1, 2), datetime(2020, 1, 4))]
+
+
+def test_store(tmpdir):
+    path = os.path.join(tmpdir, 'store')
+    store = TimeSeriesStore(path)
+    key = store.register('P', 'roi_1', provide_coverage=False)
+    assert store.read(key) is None
+    assert store.missing(key, '2020-01-01', '2020-01-31') == [(datetime(2020, 1, 1), datetime(2020, 1, 31))]
+    store.append(key, _df('2020-01-01', '2020-01-20'), '2020-01-01', '2020-01-20', fetched=FETCHED)
+    store.append(key, _df('2020-01-15', '2020-01-31', 2.), '2020-01-15', '2020-01-31', fetched=FETCHED)
+    assert store.missing(key, '2020-01-01', '2020-02-05') == [(datetime(2020, 2, 1), datetime(2020, 2, 5))]
+    df = store.read(key, '2020-01-10', '2020-01-31')
+    assert len(df) == 22
+    assert df.loc['2020-01-14', 'value'] == 1. and df.loc['2020-01-15', 'value'] == 2.
+
+    store.compact()
+    assert len(os.listdir(os.path.join(path, key))) == 1
+    assert store.spans(key) == [(datetime(2020, 1, 1), datetime(2020, 1, 31))]
+    pd.testing.assert_frame_equal(store.read(key, '2020-01-10', '2020-01-31'), df)
+    store.close()
+
+    store = TimeSeriesStore(path)
+    assert list(store.series()['location']) == ['roi_1']
+    store.rebuild(key)
+    assert store.read(key) is None
+    assert store.missing(key, '2020-01-01', '2020-01-02') == [(datetime(2020, 1, 1), datetime(2020, 1, 2))]
+    store.close()
+
+
+def test_store_settle_days(tmpdir):
+    store = TimeSeriesStore(os.path.join(tmpdir, 'store'), settle_days=2)
+    key = store.register('P', '52.000000_4.000000')
+    store.append(key, _df('2020-12-20', '2020-12-31'), '2020-12-20', '2021-01-05', fetched=FETCHED)
+    assert store.spans(key) == [(datetime(2020, 12, 20), datetime(2020, 12, 30))]
+    assert store.missing(key, '2020-12-25', '2021-01-01') == [(datetime(2020, 12, 31), datetime(2021, 1, 1))]
+    assert len(store.read(key, '2020-12-25', '2021-01-01')) == 7
+    store.close()
+
+# EOF
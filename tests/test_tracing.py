@@ -0,0 +1,68 @@
+import os
+import json
+import time
+
+import pytest
+from vds_api_client.tracing import Tracer, JsonFileExporter, OpenTelemetryExporter
+
+
+def test_spans(tmpdir):
+    path = os.path.join(tmpdir, 'trace.jsonl')
+    tracer = Tracer(JsonFileExporter(path))
+    job = tracer.start_span('job', uri='https://maps.vandersat.com/api/v2/products/P/gridded-data')
+    with tracer.span('submit', job) as submit:
+        submit.set_attribute('uuid', 'abc')
+    with pytest.raises(ValueError):
+        with tracer.span('poll', job):
+            raise ValueError('no status')
+    now = time.time()
+    tracer.record_span('download', job, now - 2, now, status=200, bytes=10)
+    tracer.end_span(job)
+    tracer.end_span(job)
+
+    with open(path) as f:
+        spans = [json.loads(line) for line in f]
+    assert [span['name'] for span in spans] == ['submit', 'poll', 'download', 'job']
+    assert len({span['traceId'] for span in spans}) == 1
+    assert all(span['parentSpanId'] == spans[-1]['spanId'] for span in spans[:-1])
+    assert spans[-1]['parentSpanId'] == ''
+    assert spans[0]['attributes'] == {'uuid': 'abc'}
+    assert spans[1]['status'] == {'code': 'ERROR', 'message': 'no status'}
+    assert spans[2]['endTimeUnixNano'] - spans[2]['startTimeUnixNano'] == pytest.approx(2e9, rel=1e-6)
+
+    summary = tracer.summary()
+    assert summary.index[0] == 'download' and set(summary.index) == {'job', 'download', 'poll', 'submit'}
+    assert summary.loc['poll', 'errors'] == 1
+    assert summary.loc['download', 'total'] == pytest.approx(2)
+
+
+def test_separate_traces():
+    tracer = Tracer()
+    first, second = tracer.start_span('job'), tracer.start_span('job')
+    assert first.trace_id != second.trace_id
+    assert tracer.spans == []
+
+
+def test_opentelemetry():
+    pytest.importorskip('opentelemetry.sdk')
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    memory = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(memory))
+    tracer = Tracer(OpenTelemetryExporter(provider.get_tracer('test')), keep=False)
+    job = tracer.start_span('job', start=100., uuid='abc')
+    tracer.record_span('download', job, 101., 103., error='HTTP 500', status=500)
+    tracer.end_span(job, end=104.)
+
+    download, job = memory.get_finished_spans()
+    assert download.parent.span_id == job.context.span_id
+    assert download.context.trace_id == job.context.trace_id
+    assert (download.start_time, download.end_time) == (101 * 10 ** 9, 103 * 10 ** 9)
+    assert not download.status.is_ok and download.attributes['status'] == 500
+    assert job.attributes['uuid'] == 'abc' and job.end_time == 104 * 10 ** 9
+    assert tracer.spans == []
+
+# EOF
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import zipfile
+
+import pytest
+import requests
+import vds_api_client as vac
+from vds_api_client.api_cli import api
+from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.requester import Requester
+from vds_api_client.fake_server import FakeApiServer
+from vds_api_client.transport import Recorder, Replayer, ReplayMiss, transport_for
+
+
+def workflow(outfold):
+    vds = VdsApiV2('user', 'pass', debug=False)
+    vds._wait_time = 0.05
+    vds.outfold = outfold
+    vds.gen_gridded_data_request(products=['SM-XN_V001_100'], start_date='2020-01-01', end_date='2020-01-21',
+                                 lat_min=52, lat_max=53, lon_min=4, lon_max=5, nrequests=2)
+    vds.gen_time_series_requests(products=['SM-XN_V001_100'], start_time='2020-01-01', end_time='2020-01-31',
+                                 rois=[1000])
+    vds.submit_async_requests()
+    vds.download_async_files(n_proc=2)
+    return {fn: os.path.getsize(os.path.join(outfold, fn)) for fn in os.listdir(outfold)}
+
+
+def test_record_replay(offline, tmpdir):
+    path = str(tmpdir.join('recordings', 'workflow.zip'))
+    with FakeApiServer(processing_time=0.1, file_size=1000) as server:
+        vac.ENVIRONMENT = server.name
+        with Recorder(path) as recorder:
+            assert Requester().transport is recorder
+            recorded = workflow(str(tmpdir.join('recorded')))
+    assert vac.TRANSPORT is None and len(recorded) == 22
+    with zipfile.ZipFile(path) as archive:
+        index = json.loads(archive.read('exchanges.json'))
+        nbodies = sum(name.startswith('bodies/') for name in archive.namelist())
+    exchanges = index['exchanges']
+    assert index['version'] == 1 and index['client'] == vac.__version__
+    assert not any('Authorization' in exchange['request_headers'] for exchange in exchanges)
+    assert nbodies < len(exchanges)  # identical bodies are stored once
+
+    # The server is gone, the run is replayed from the archive
+    vac.ENVIRONMENT = 'maps'
+    with Replayer(path) as replayer:
+        replayed = workflow(str(tmpdir.join('replayed')))
+    assert replayed == recorded
+    assert not replayer.misses
+
+
+def test_replay_order_and_miss(offline, tmpdir):
+    path = str(tmpdir.join('status.zip'))
+    with FakeApiServer(processing_time=0.3) as server:
+        vac.ENVIRONMENT = server.name
+        with Recorder(path):
+            req = Requester()
+            uuid = req.get_content(f'{req.base_url}/api/v2/products/SM-XN_V001_100/gridded-data?lat_min=1&'
+                                   f'lat_max=2&lon_min=1&lon_max=2&start_date=2020-01-01&end_date=2020-01-02')['uuid']
+            recorded = [req.get_content(f'{req.base_url}/api/v2/api-requests/{uuid}/status')['percentage']]
+            time.sleep(0.4)
+            recorded.append(req.get_content(f'{req.base_url}/api/v2/api-requests/{uuid}/status')['percentage'])
+    assert recorded[0] < 100 and recorded[1] == 100
+    with Replayer(path) as replayer:
+        req = Requester()
+        replayed = [req.get_content(f'{req.base_url}/api/v2/api-requests/{uuid}/status')['percentage']
+                    for _ in range(3)]
+        assert replayed == recorded + [100]  # the last response once the recorded ones run out
+        with pytest.raises(ReplayMiss):
+            req.get(f'{req.base_url}/api/v2/api-requests/{uuid}/unknown')
+        with pytest.raises(requests.exceptions.ConnectionError):
+            req.get(f'{req.base_url}/api/v2/users/me')
+        assert len(replayer.misses) == 2
+        replayer.rewind()
+        assert req.get_content(f'{req.base_url}/api/v2/api-requests/{uuid}/status')['percentage'] == recorded[0]
+
+
+def test_preserve_timing(offline, tmpdir):
+    path = str(tmpdir.join('latency.zip'))
+    with FakeApiServer(latency=0.1) as server:
+        vac.ENVIRONMENT = server.name
+        with Recorder(path):
+            req = Requester()
+            for _ in range(3):
+                req.get_content(f'{req.base_url}/api/v2/products/')
+    for kwargs, low, high in [({}, 0., 0.1), ({'preserve_timing': True}, 0.3, 1.), ({'preserve_timing': True,
+                                                                                    'speed': 2.}, 0.15, 0.3)]:
+        with Replayer(path, **kwargs):
+            t0 = time.perf_counter()
+            for _ in range(3):
+                Requester().get_content(f'{Requester().base_url}/api/v2/products/')
+            assert low <= time.perf_counter() - t0 < high
+    with pytest.raises(ValueError):
+        Replayer(path, speed=0)
+
+
+def test_transport_for(tmpdir):
+    path = str(tmpdir.join('missing.zip'))
+    assert transport_for(path) is None
+    assert isinstance(transport_for(path, record=True), Recorder)
+    Recorder(path).save()
+    assert isinstance(transport_for(path, preserve_timing=True), Replayer)
+
+
+def test_cli_record_replay(offline, tmpdir, runner):
+    path = str(tmpdir.join('info.zip'))
+    with FakeApiServer() as server:
+        vac.ENVIRONMENT = server.name
+        recorded = runner.invoke(api, ['-u', 'user', '-p', 'pass', '--record', path, 'info', '--roi'])
+    assert recorded.exit_code == 0 and 'roi_1' in recorded.output
+    vac.ENVIRONMENT = 'maps'
+    replayed = runner.invoke(api, ['-u', 'user', '-p', 'pass', '--replay', path, 'info', '--roi'])
+    assert replayed.exit_code == 0
+    assert replayed.output == recorded.output
+    assert vac.TRANSPORT is None
+
+
+def test_bench_replay(offline, tmpdir):
+    from benchmarks.bench_replay import record, replay
+    path = record(str(tmpdir.join('workflow.zip')))
+    replay(path)
+    assert vac.TRANSPORT is None and vac.ENVIRONMENT == 'maps'
@@ -2,9 +2,10 @@
 import os
 import pytest
 from datetime import datetime
-from vds_api_client.api_v2 import VdsApiV2
+from vds_api_client.api_v2 import VdsApiV2, unique_everseen
 from vds_api_client.vds_api_base import getpar_fromtext
 import pandas as pd
+import numpy as np
 
 
 def test_gridded_config(credentials, example_config_area):
@@ -60,6 +61,7 @@ def test_ts_config(credentials, example_config_ts):
         'masked': True,
         'clim': False,
         'provide_coverage': False,
+        'snap_to_grid': False,
         't': None
     }
     with pytest.raises(RuntimeError):
@@ -139,6 +141,36 @@ def test_gen_uri_ts(credentials, example_config_ts):
                                      rois=[25009], av_win_dir='forward')  # Invalid window direction
 
 
+def test_gen_uri_ts_snapped(credentials):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    vds.gen_time_series_requests(gen_uri=True, products=['TEST-PRODUCT_V001_25000'],
+                                 start_time='2020-01-01', end_time='2020-01-03',
+                                 lats=[66.8, 66.9, 66.125], lons=[-5.9, -5.8, -5.125],
+                                 snap_to_grid=True)
+    assert len(vds.async_requests) == 2
+    assert '&lat=66.875&lon=-5.875&' in vds.async_requests[0]
+    assert vds._pixel_fanout[vds.async_requests[0]] == [(66.8, -5.9), (66.9, -5.8)]
+    assert vds._pixel_fanout[vds.async_requests[1]] == [(66.125, -5.125)]
+
+
+def test_unique_everseen():
+    uris = (f'https://host/{i % 3}' for i in range(7))
+    assert list(unique_everseen(uris)) == ['https://host/0', 'https://host/1', 'https://host/2']
+
+
+def test_iter_uri_arrays(credentials):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    points = pd.DataFrame({'lat': [66.875, 66.125, 66.875], 'lon': [-5.875, -5.125, -5.875]})
+    vds.gen_time_series_requests(gen_uri=False, products=['TEST-PRODUCT_V001_25000'],
+                                 start_time='2020-01-01', end_time='2020-01-03',
+                                 lats=points['lat'], lons=points['lon'].values)
+    uris = vds.iter_uri()
+    assert not vds.async_requests
+    assert len(list(uris)) == 2
+
+
 def test_getarea(credentials, example_config_area, tmpdir):
     vds = VdsApiV2(credentials['user'], credentials['pw'])
     vds.environment = 'maps'
@@ -158,6 +190,24 @@ def test_getarea(credentials, example_config_area, tmpdir):
     assert not os.path.exists(uuid + '.uuid')
 
 
+def test_getarea_traced(credentials, example_config_area, tmpdir):
+    from vds_api_client.tracing import Tracer
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    tracer = vds.tracer = Tracer()
+    try:
+        vds.set_outfold(tmpdir)
+        vds.gen_gridded_data_request(config_file=example_config_area, products=['TEST-PRODUCT_V001_25000'])
+        vds.submit_async_requests()
+        vds.download_async_files()
+    finally:
+        vds.tracer = None
+    summary = tracer.summary()
+    assert summary.loc['job', 'count'] == 1
+    assert summary.loc['download', 'count'] == 3
+    assert {'generate', 'submit', 'poll'} <= set(summary.index)
+    assert len({span.trace_id for span in tracer.spans}) == 1
+
+
 def test_getts(credentials, example_config_ts, tmpdir):
     vds = VdsApiV2(credentials['user'], credentials['pw'])
     vds.environment = 'maps'
@@ -176,12 +226,102 @@ def test_getts(credentials, example_config_ts, tmpdir):
     assert not all([os.path.exists(uuid + '.uuid') for uuid in uuids])
 
 
-def test_get_df(example_config_ts):
-    vds = VdsApiV2()
+def test_getts_parquet(credentials, example_config_ts, tmpdir):
+    pytest.importorskip('pyarrow')
+    from vds_api_client.columnar import read_time_series_dataset
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    vds.outfold = os.path.join(tmpdir, 'csv')
+    vds.gen_time_series_requests(gen_uri=True, config_file=example_config_ts)
+    vds.submit_async_requests(queue_files=False)
+    vds.download_async_files(parquet=os.path.join(tmpdir, 'parquet'))
+    df = read_time_series_dataset(os.path.join(tmpdir, 'parquet'))
+    assert set(df.index.get_level_values('location_id')) == {'66.875000_-5.875000', '66.125000_-5.125000',
+                                                             'roi_25009', 'roi_25010'}
+    assert not vds.output_hooks
+
+
+@pytest.mark.parametrize('options', [dict(av_win=20, av_win_dir='backward'), dict(av_win=5, av_win_dir='center'),
+                                     dict(t=10)])
+def test_derive_matches_server(credentials, example_config_ts, options):
+    from vds_api_client.derive import add_derived_columns
+    from vds_api_client.parsing import read_time_series_csv
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    product = getpar_fromtext(example_config_ts, 'products')
+    roi_id = vds.rois[getpar_fromtext(example_config_ts, 'rois')[0]].id
+    base = (f'https://{vds.host}/api/v2/products/{product}/roi-time-series-sync?'
+            f'roi_id={roi_id}&start_time=2020-01-01&end_time=2020-06-30&format=csv')
+    raw = read_time_series_csv(vds.get(base).content)
+    query = (f'&avg_window_days={options.get("av_win", 0)}&avg_window_direction={options.get("av_win_dir", "center")}'
+             + (f'&exp_filter_t={options["t"]}' if 't' in options else ''))
+    server = read_time_series_csv(vds.get(base + query).content)
+    server_columns = server.columns.difference(raw.columns)
+    local = add_derived_columns(raw, **options)
+    local_columns = local.columns.difference(raw.columns)
+    assert len(server_columns) == len(local_columns) == 1
+    # Both only use the requested dates, so they should match up to the edges of the range
+    pd.testing.assert_index_equal(local.index, server.index)
+    np.testing.assert_allclose(local[local_columns[0]], server[server_columns[0]], rtol=1e-4, equal_nan=True)
+
+
+def test_get_df(credentials, example_config_ts):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
     vds.environment = 'maps'
     rois = getpar_fromtext(example_config_ts, 'rois')
     product = getpar_fromtext(example_config_ts, 'products')
     df = vds.get_roi_df(product, rois[0], '2020-01-01', '2020-01-03')
     assert isinstance(df, pd.DataFrame)
 
+
+def test_get_df_chunked(credentials, example_config_ts):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    rois = getpar_fromtext(example_config_ts, 'rois')
+    product = getpar_fromtext(example_config_ts, 'products')
+    df_single = vds.get_roi_df(product, rois[0], '2020-01-01', '2020-03-31', chunk_days=365)
+    df_chunked = vds.get_roi_df(product, rois[0], '2020-01-01', '2020-03-31', chunk_days=30)
+    pd.testing.assert_frame_equal(df_single, df_chunked)
+
+
+def test_get_df_stored(credentials, example_config_ts, tmpdir):
+    pytest.importorskip('pyarrow')
+    from vds_api_client.store import TimeSeriesStore
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    vds.ts_store = TimeSeriesStore(os.path.join(tmpdir, 'store'))
+    rois = getpar_fromtext(example_config_ts, 'rois')
+    product = getpar_fromtext(example_config_ts, 'products')
+    df_first = vds.get_roi_df(product, rois[0], '2020-01-01', '2020-01-31')
+    df_longer = vds.get_roi_df(product, rois[0], '2020-01-01', '2020-02-29')
+    pd.testing.assert_frame_equal(df_longer.loc[:'2020-01-31'], df_first)
+    assert len(vds.ts_store.series()) == 1
+
+
+def test_get_dfs(credentials, example_config_ts):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    rois = getpar_fromtext(example_config_ts, 'rois')
+    product = getpar_fromtext(example_config_ts, 'products')
+    partial = []
+    df = vds.get_roi_dfs([product], rois, '2020-01-01', '2020-01-03',
+                         callback=lambda p, roi, d: partial.append((p, roi)))
+    assert len(partial) == 2
+    assert df.index.names[:2] == ['product', 'roi_id']
+    assert set(df.index.get_level_values('roi_id')) == {25009, 25010}
+
+
+def test_get_values(credentials, example_config_ts):
+    vds = VdsApiV2(credentials['user'], credentials['pw'])
+    vds.environment = 'maps'
+    product = getpar_fromtext(example_config_ts, 'products')
+    lats, lons = [66.8, 66.81, 67.2], [-5.9, -5.91, -5.2]
+    values = vds.get_values(product, '2020-01-01', lats, lons)
+    assert values.shape == (3,)
+    assert values[0] == values[1] or (np.isnan(values[0]) and np.isnan(values[1]))
+    assert len(vds.value_cache) == 2
+    df = vds.get_values(product, ['2020-01-01', '2020-01-02'], lats[0], lons[0], as_frame=True)
+    assert list(df.columns) == ['date', 'lat', 'lon', 'value']
+    assert len(vds.value_cache) == 3
+
 # EOF